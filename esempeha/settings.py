@@ -40,24 +40,139 @@ OPENSEARCH_PASSWORD = os.getenv('OPENSEARCH_PASSWORD')
 OPENSEARCH_USE_SSL = os.getenv('OPENSEARCH_USE_SSL', 'False').lower() == 'true'
 OPENSEARCH_INDEX_NAME = 'scifact_index'
 
+# OpenSearch client: one pooled, keep-alive client per process (recreated after fork)
+OPENSEARCH_POOL_MAXSIZE = int(os.getenv('OPENSEARCH_POOL_MAXSIZE', '10'))  # Connections kept open per host
+OPENSEARCH_TIMEOUT = float(os.getenv('OPENSEARCH_TIMEOUT', '10'))  # Seconds per request
+OPENSEARCH_MAX_RETRIES = int(os.getenv('OPENSEARCH_MAX_RETRIES', '3'))
+OPENSEARCH_RETRY_ON_TIMEOUT = True
+OPENSEARCH_RETRY_ON_STATUS = (502, 503, 504)
+
+# Native k-NN: store document embeddings in a knn_vector field and run semantic search inside OpenSearch
+# Requires the k-NN plugin and an index created (or recreated) with this setting enabled
+OPENSEARCH_KNN_ENABLED = os.getenv('OPENSEARCH_KNN_ENABLED', 'False').lower() == 'true'
+OPENSEARCH_KNN_FIELD = 'embedding'
+OPENSEARCH_KNN_DIMENSION = 384  # all-MiniLM-L6-v2
+OPENSEARCH_KNN_ENGINE = 'lucene'
+OPENSEARCH_KNN_M = 16
+OPENSEARCH_KNN_EF_CONSTRUCTION = 128
+OPENSEARCH_KNN_EF_SEARCH = 100  # Sent with each k-NN query (method_parameters, OpenSearch 2.16+), so it applies to every engine
+
+# Hybrid search fusion for semantic mode: None (semantic hits only boost the lexical query), 'rrf' or 'weighted'
+# Can be overridden per request with ?fusion=
+SEARCH_FUSION_DEFAULT = os.getenv('SEARCH_FUSION_DEFAULT') or None
+SEARCH_FUSION_DEPTH = 50  # Candidates taken from each retriever before fusing
+SEARCH_RRF_K = 60
+SEARCH_FUSION_WEIGHTS = {'lexical': 0.5, 'vector': 0.5}
+
+# Serve the search views as async views; only worthwhile under an ASGI server, e.g.
+#   uvicorn esempeha.asgi:application --workers 2
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+# Threads per process for CPU-bound work (preprocessing, query encoding, corrections) started by async views
+ASYNC_CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS', '4'))
+
+# Search result cache: doc ids and scores per (query, mode, size, index generation)
+# index_data and build_semantic_index bump the generation, so a reindex never serves stale results. The generation
+# lives in data/index_generation, which every worker on the host checks per request, and in the cache for other hosts
+SEARCH_RESULT_CACHE_ENABLED = os.getenv('SEARCH_RESULT_CACHE_ENABLED', 'True').lower() == 'true'
+SEARCH_RESULT_CACHE_TIMEOUT = 600  # 10 minutes
+
+# Warm-up: with WARMUP_ON_BOOT every gunicorn worker loads the engines and replays the top WARMUP_TOP_N queries of
+# WARMUP_QUERIES_FILE in the background after booting, and /ready/ answers 503 until it is done
+WARMUP_ON_BOOT = os.getenv('WARMUP_ON_BOOT', 'False').lower() == 'true'
+WARMUP_QUERIES_FILE = os.getenv('WARMUP_QUERIES_FILE') or None
+WARMUP_TOP_N = int(os.getenv('WARMUP_TOP_N', '50'))
+
+# Threads per process running the independent stages of a search request (ping, search, corrections, summary)
+SEARCH_VIEW_WORKERS = 16
+
 # Text preprocessing settings
 TEXT_PREPROCESSING_METHOD = 'spacy'
+QUERY_PREPROCESS_CACHE_SIZE = 8192  # Memoized preprocess_query results per process
+
+# Semantic search embedding store settings
+# float16 halves the size of data/document_embeddings.bin at a small cost in precision
+SEMANTIC_EMBEDDING_DTYPE = os.getenv('SEMANTIC_EMBEDDING_DTYPE', 'float32')
+
+# Query embedding cache: per-process LRU, optionally backed by the Django cache to share across workers
+SEMANTIC_QUERY_CACHE_SIZE = 4096
+SEMANTIC_QUERY_CACHE_SHARED = os.getenv('SEMANTIC_QUERY_CACHE_SHARED', 'False').lower() == 'true'
+SEMANTIC_QUERY_CACHE_TIMEOUT = 86400  # 1 day
+
+# Semantic search ANN index settings
+# Backend: 'auto' (exact below SEMANTIC_ANN_MIN_DOCS, then HNSW if hnswlib is installed, else IVF), 'exact', 'ivf' or 'hnsw'
+SEMANTIC_ANN_BACKEND = os.getenv('SEMANTIC_ANN_BACKEND', 'auto')
+SEMANTIC_ANN_MIN_DOCS = int(os.getenv('SEMANTIC_ANN_MIN_DOCS', '20000'))
+SEMANTIC_IVF_NLIST = None  # None = 4 * sqrt(number of documents)
+SEMANTIC_IVF_NPROBE = int(os.getenv('SEMANTIC_IVF_NPROBE', '16'))  # Higher = better recall, slower queries
+SEMANTIC_HNSW_M = 16
+SEMANTIC_HNSW_EF_CONSTRUCTION = 200
+SEMANTIC_HNSW_EF_SEARCH = int(os.getenv('SEMANTIC_HNSW_EF_SEARCH', '64'))  # Higher = better recall, slower queries
+# Most results one semantic search returns; HNSW ef is raised to it once, and larger requests are clamped
+SEMANTIC_MAX_TOP_K = 100
+
+# Incremental embedding updates: index_data --incremental appends the vectors of changed documents to a delta log
+# next to the store, which every worker applies within SEMANTIC_DELTA_REFRESH_INTERVAL seconds. Once the log holds
+# changes for SEMANTIC_DELTA_COMPACT_THRESHOLD documents it is merged into a new store and ANN index
+SEMANTIC_DELTA_REFRESH_INTERVAL = 2
+SEMANTIC_DELTA_COMPACT_THRESHOLD = 1000
 
 # Caching settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 3600,
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+# With REDIS_URL set, cached values (LLM summaries, search results, corrections) are shared by all workers
+# and survive restarts; a small per-process LRU in front of Redis answers repeated reads without a round trip
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'main.cache_backends.TwoTierCache',
+            'LOCATION': 'two-tier',
+            'TIMEOUT': 3600,
+            'OPTIONS': {
+                'REMOTE': 'redis',
+                'LOCAL_MAX_ENTRIES': 1024,
+                'LOCAL_TIMEOUT': 5,  # Longest time a worker may serve a value changed by another worker
+            }
+        },
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': 3600,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SERIALIZER': 'django_redis.serializers.pickle.PickleSerializer',
+                'PICKLE_VERSION': -1,  # Highest protocol, the fastest to load and dump
+                'COMPRESSOR': 'main.cache_backends.ThresholdZlibCompressor',
+                'COMPRESS_MIN_LENGTH': 1024,
+                'SOCKET_CONNECT_TIMEOUT': 2,
+                'SOCKET_TIMEOUT': 2,
+            }
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 3600,
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+            }
         }
     }
-}
+
+# Spelling correction result cache: per-process LRU in front of the Django cache
+CORRECTION_CACHE_SIZE = 2048
+CORRECTION_CACHE_TIMEOUT = 3600  # 1 hour
 
 # Cache timeout for LLM responses (in seconds)
 LLM_CACHE_TIMEOUT = 3600  # 1 hour
 
+# Single-flight summaries: one request generates a summary while concurrent requests for it poll the cache
+# Longer than the 45s API timeout, so a lock normally only expires if its holder died. A stream can outlast it,
+# since its timeout applies per read; the late holder then only releases the lock if it still holds it.
+LLM_SUMMARY_LOCK_TIMEOUT = 60
+LLM_SUMMARY_WAIT_TIMEOUT = 30
+LLM_SUMMARY_POLL_INTERVAL = 0.25
+
 # Construct OPENSEARCH_URL based on SSL settings
 _opensearch_scheme = "https" if OPENSEARCH_USE_SSL else "http"
 if OPENSEARCH_USERNAME and OPENSEARCH_PASSWORD:
@@ -69,6 +184,10 @@ else:
 # HuggingFace API Key
 HUGGINGFACE_API_KEY = os.getenv('HUGGINGFACE_API_KEY')
 LLM_MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.3"
+# Inference endpoint; defaults to the HuggingFace Inference API URL of LLM_MODEL_ID. Point it at a local stub for testing
+LLM_API_URL = os.getenv('LLM_API_URL') or None
+# Render results without waiting for the summary, which the page then streams from /api/summary/
+LLM_SUMMARY_DEFERRED = os.getenv('LLM_SUMMARY_DEFERRED', 'True').lower() == 'true'
 
 # Application definition
 
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn is started from the project root.
+
+Set GUNICORN_PRELOAD=true to import the app and load the search engines (spaCy, the sentence transformer
+with its embeddings, the spelling dictionaries) once in the master process. Forked workers then share
+that memory copy-on-write instead of each loading their own copy on first request.
+
+Set WARMUP_ON_BOOT=true to have every worker run the warm-up (first inferences, replay of popular
+queries) in the background after it boots; /ready/ reports the worker ready once that has finished.
+"""
+import gc
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'False').lower() == 'true'
+
+if preload_app:
+    # HuggingFace tokenizers cannot use their thread pool after a fork and warn in every worker otherwise
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from main.warmup import preload_engines
+    preload_engines()
+    # Move everything loaded so far out of the collector's reach, so collections in workers do not
+    # touch (and copy) the shared pages
+    gc.freeze()
+
+def post_worker_init(worker):
+    if os.getenv('WARMUP_ON_BOOT', 'False').lower() != 'true':
+        return
+    # In the background, so a long warm-up cannot trip the worker timeout
+    from main.warmup import start_background_warmup
+    start_background_warmup()
@@ -22,6 +22,7 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 import argparse
+import time
 
 # Setup Django environment
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -29,7 +30,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'esempeha.settings')
 django.setup()
 
 from django.conf import settings
-from main.opensearch_utils import get_opensearch_client, search_documents
+from django.test import override_settings
+from main.opensearch_utils import FUSION_METHODS, get_opensearch_client, search_documents
 from main.semantic_search import semantic_engine
 from main.text_preprocessing import preprocessor
 import logging
@@ -223,19 +225,28 @@ class IREvaluator:
         
         return scores
     
-    def evaluate_query(self, query_info: Dict, use_semantic: bool = False) -> Dict:
+    def method_name(self, use_semantic: bool = False, fusion: str = None) -> str:
+        """Name of a search configuration as used in the results"""
+        if not use_semantic:
+            return "traditional"
+        return f"semantic_{fusion}" if fusion else "semantic"
+    
+    def evaluate_query(self, query_info: Dict, use_semantic: bool = False, fusion: str = None) -> Dict:
         """Evaluate a single query"""
         query = query_info["query"]
         logger.info(f"Evaluating query: {query}")
         
         # Get search results
+        start_time = time.perf_counter()
         results = search_documents(
             self.client, 
             self.index_name, 
             query, 
             size=20,
-            use_semantic=use_semantic
+            use_semantic=use_semantic,
+            fusion=fusion
         )
+        latency_ms = (time.perf_counter() - start_time) * 1000
         
         retrieved_docs = [result.get('doc_id', result.get('id')) for result in results]
         retrieved_docs = [doc_id for doc_id in retrieved_docs if doc_id]
@@ -254,7 +265,7 @@ class IREvaluator:
         
         return {
             "query": query,
-            "method": "semantic" if use_semantic else "traditional",
+            "method": self.method_name(use_semantic, fusion),
             "precision": precision,
             "recall": recall,
             "f1_score": f1_score,
@@ -263,16 +274,17 @@ class IREvaluator:
             "ndcg_20": ndcg_20,
             "num_retrieved": len(retrieved_docs),
             "num_relevant": len(relevant_docs),
-            "relevant_retrieved": len(set(retrieved_docs).intersection(relevant_docs))
+            "relevant_retrieved": len(set(retrieved_docs).intersection(relevant_docs)),
+            "latency_ms": latency_ms
         }
     
-    def evaluate_all_queries(self, test_queries: Dict, use_semantic: bool = False) -> List[Dict]:
+    def evaluate_all_queries(self, test_queries: Dict, use_semantic: bool = False, fusion: str = None) -> List[Dict]:
         """Evaluate all test queries"""
         results = []
         
         for query_id, query_info in test_queries.items():
             try:
-                result = self.evaluate_query(query_info, use_semantic)
+                result = self.evaluate_query(query_info, use_semantic, fusion)
                 result["query_id"] = query_id
                 results.append(result)
             except Exception as e:
@@ -294,6 +306,7 @@ class IREvaluator:
             "mean_average_precision": df["average_precision"].mean(),
             "mean_ndcg_10": df["ndcg_10"].mean(),
             "mean_ndcg_20": df["ndcg_20"].mean(),
+            "mean_latency_ms": df["latency_ms"].mean(),
             "total_queries": len(results),
             "total_retrieved": df["num_retrieved"].sum(),
             "total_relevant": df["num_relevant"].sum(),
@@ -303,20 +316,20 @@ class IREvaluator:
         return overall
     
     def compare_methods(self, test_queries: Dict) -> pd.DataFrame:
-        """Compare traditional vs semantic search"""
-        traditional_results = self.evaluate_all_queries(test_queries, use_semantic=False)
-        semantic_results = self.evaluate_all_queries(test_queries, use_semantic=True)
+        """Compare traditional search, semantic boosting and each score fusion method"""
+        configurations = [(False, None), (True, None)] + [(True, fusion) for fusion in FUSION_METHODS]
+        
+        all_results = []
+        overall = {}
+        # Every query is searched once per configuration, so cached results would only distort the timings
+        with override_settings(SEARCH_RESULT_CACHE_ENABLED=False):
+            for use_semantic, fusion in configurations:
+                results = self.evaluate_all_queries(test_queries, use_semantic=use_semantic, fusion=fusion)
+                all_results.extend(results)
+                overall[self.method_name(use_semantic, fusion)] = self.calculate_overall_metrics(results)
         
-        all_results = traditional_results + semantic_results
         df = pd.DataFrame(all_results)
-        
-        traditional_overall = self.calculate_overall_metrics(traditional_results)
-        semantic_overall = self.calculate_overall_metrics(semantic_results)
-        
-        comparison = pd.DataFrame({
-            'Traditional': traditional_overall,
-            'Semantic': semantic_overall
-        })
+        comparison = pd.DataFrame(overall)
         
         return df, comparison
     
@@ -373,7 +386,7 @@ class IREvaluator:
         print(f"Loaded {len(test_queries)} test queries")
         
         # Compare methods
-        print("\nComparing Traditional vs Semantic Search...")
+        print("\nComparing Traditional, Semantic and Fused Search...")
         df, comparison = self.compare_methods(test_queries)
         
         # Display comparison
@@ -392,11 +405,11 @@ class IREvaluator:
         
         # Print detailed results by query
         print("\n=== Detailed Results by Query ===")
-        for method in ['traditional', 'semantic']:
+        for method in df['method'].unique():
             print(f"\n{method.upper()} SEARCH:")
             method_df = df[df['method'] == method]
             for _, row in method_df.iterrows():
-                print(f"  {row['query_id']}: P={row['precision']:.3f}, R={row['recall']:.3f}, F1={row['f1_score']:.3f}, NDCG@10={row['ndcg_10']:.3f}")
+                print(f"  {row['query_id']}: P={row['precision']:.3f}, R={row['recall']:.3f}, F1={row['f1_score']:.3f}, NDCG@10={row['ndcg_10']:.3f}, {row['latency_ms']:.1f}ms")
         
         return df, comparison
 
@@ -406,6 +419,8 @@ def main():
     parser.add_argument('--query', type=str, help='Evaluate specific query')
     parser.add_argument('--method', choices=['traditional', 'semantic'], default='traditional', 
                        help='Search method to use')
+    parser.add_argument('--fusion', choices=FUSION_METHODS, default=None,
+                       help='Score fusion for semantic search (default: semantic boosting)')
     parser.add_argument('--create-test-queries', action='store_true', 
                        help='Create and save test queries file')
     
@@ -438,9 +453,9 @@ def main():
             }
         
         use_semantic = args.method == 'semantic'
-        result = evaluator.evaluate_query(query_info, use_semantic)
+        result = evaluator.evaluate_query(query_info, use_semantic, args.fusion)
         
-        print(f"\n=== Evaluation Results for '{args.query}' ({args.method}) ===")
+        print(f"\n=== Evaluation Results for '{args.query}' ({result['method']}) ===")
         for key, value in result.items():
             print(f"{key}: {value}")
     else:
@@ -0,0 +1,264 @@
+import json
+import math
+import os
+import numpy as np
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+import logging
+
+logger = logging.getLogger(__name__)
+
+def normalize_rows(vectors):
+    """L2-normalize each row of a 2D array, leaving all-zero rows untouched"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _file_identity(path):
+    """[inode, mtime, size] of a file, which os.replace keeps when moving it into place"""
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+def _top_k(scores, top_k):
+    """Return (indices, scores) of the top_k highest scores in a 1D array, best first"""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return order, scores[order]
+
+class ExactIndex:
+    """
+    Brute-force cosine similarity against every embedding, used for small corpora.
+    A batch of queries is scored block by block of `block_size` rows, so a float16 or not yet
+    normalized matrix is converted one block at a time instead of as a whole on every search.
+    """
+    backend = 'exact'
+
+    def __init__(self, embeddings, normalized=False, block_size=65536, **params):
+        self.embeddings = embeddings
+        self.normalized = normalized
+        self.block_size = block_size
+
+    def build(self):
+        pass
+
+    def save(self, path):
+        pass
+
+    def load(self, path):
+        return True
+
+    def search(self, query_vectors, top_k):
+        """Return a list of (indices, similarities) pairs, one per query vector"""
+        queries = normalize_rows(query_vectors)
+        similarities = np.empty((len(queries), len(self.embeddings)), dtype=np.float32)
+        for start in range(0, len(self.embeddings), self.block_size):
+            block = self.embeddings[start:start + self.block_size]
+            # A no-op for normalized float32 rows
+            block = np.asarray(block, dtype=np.float32) if self.normalized else normalize_rows(block)
+            similarities[:, start:start + len(block)] = queries @ block.T
+        return [_top_k(row, top_k) for row in similarities]
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are clustered with spherical k-means and a query only scans
+    the `nprobe` clusters whose centroids are closest to it. Raising nprobe trades latency for recall.
+    """
+    backend = 'ivf'
+
+    def __init__(self, embeddings, nlist=None, nprobe=16, iterations=10, sample_size=100000, seed=0,
+                 normalized=False, fingerprint=None, **params):
+        self.embeddings = embeddings
+        self.normalized = normalized
+        self.fingerprint = fingerprint
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+
+    def build(self, assign_batch_size=65536):
+        num_vectors = len(self.embeddings)
+        nlist = min(self.nlist or max(1, int(4 * math.sqrt(num_vectors))), num_vectors)
+        rng = np.random.default_rng(self.seed)
+
+        # Train centroids on a sample so k-means cost does not grow with the corpus
+        sample_ids = np.sort(rng.choice(num_vectors, min(num_vectors, max(self.sample_size, nlist)), replace=False))
+        sample = normalize_rows(self.embeddings[sample_ids])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Keep the previous centroid for clusters that lost all their members
+            empty = counts == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+
+        assignment = np.empty(num_vectors, dtype=np.int64)
+        for start in range(0, num_vectors, assign_batch_size):
+            batch = normalize_rows(self.embeddings[start:start + assign_batch_size])
+            assignment[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+
+        counts = np.bincount(assignment, minlength=nlist)
+        self.centroids = centroids
+        self.list_ids = np.argsort(assignment, kind='stable').astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        logger.info(f"Built IVF index with {nlist} lists over {num_vectors} vectors")
+
+    def save(self, path):
+        """Write the index next to `path` and move it into place, so readers never load a half-written index"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_ids=self.list_ids,
+                num_vectors=np.int64(len(self.embeddings)),
+                fingerprint=np.array(self.fingerprint or ''),
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        with np.load(path) as data:
+            fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else None
+            if int(data['num_vectors']) != len(self.embeddings) or fingerprint != self.fingerprint:
+                logger.warning("IVF index does not match the loaded embeddings, need to rebuild")
+                return False
+            self.centroids = data['centroids']
+            self.list_offsets = data['list_offsets']
+            self.list_ids = data['list_ids']
+        return True
+
+    def search(self, query_vectors, top_k):
+        """Return a list of (indices, similarities) pairs, one per query vector"""
+        queries = normalize_rows(query_vectors)
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = queries @ self.centroids.T
+
+        results = []
+        for query, scores in zip(queries, centroid_scores):
+            probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[probe]:self.list_offsets[probe + 1]] for probe in probes
+            ])
+            if not len(candidates):
+                results.append((candidates, np.empty(0, dtype=np.float32)))
+                continue
+            # Sorted ids keep reads from the embedding matrix sequential
+            candidates.sort()
+            vectors = self.embeddings[candidates]
+            if not self.normalized:
+                vectors = normalize_rows(vectors)
+            similarities = vectors @ query
+            order, top_scores = _top_k(similarities, top_k)
+            results.append((candidates[order], top_scores))
+        return results
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small world graph built with hnswlib. `ef_search` trades latency for recall,
+    `m` and `ef_construction` control graph quality and build time. ef is set once to at least `max_top_k`,
+    so concurrent searches never change it; hnswlib searches for more neighbours than ef with k as the ef of
+    that search only.
+    The store fingerprint is kept in a `.meta` file next to the index, along with the identity of the
+    index file it describes.
+    """
+    backend = 'hnsw'
+
+    def __init__(self, embeddings, m=16, ef_construction=200, ef_search=64, max_top_k=100, fingerprint=None,
+                 **params):
+        self.embeddings = embeddings
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = max(ef_search, max_top_k)
+        self.fingerprint = fingerprint
+        self.index = None
+
+    def _new_index(self):
+        return hnswlib.Index(space='cosine', dim=self.embeddings.shape[1])
+
+    def build(self, add_batch_size=65536):
+        num_vectors = len(self.embeddings)
+        index = self._new_index()
+        index.init_index(max_elements=num_vectors, ef_construction=self.ef_construction, M=self.m)
+        for start in range(0, num_vectors, add_batch_size):
+            batch = np.asarray(self.embeddings[start:start + add_batch_size], dtype=np.float32)
+            index.add_items(batch, np.arange(start, start + len(batch)))
+        index.set_ef(self.ef_search)
+        self.index = index
+        logger.info(f"Built HNSW index over {num_vectors} vectors (M={self.m}, ef_construction={self.ef_construction})")
+
+    def save(self, path):
+        """
+        Write the index, then its metadata, next to `path` and move each into place. Until the metadata
+        is replaced it names another index file, so a reader never pairs the new index with the old fingerprint.
+        """
+        tmp_path = f"{path}.tmp"
+        self.index.save_index(tmp_path)
+        meta = {'fingerprint': self.fingerprint, 'index_file': _file_identity(tmp_path)}
+        with open(f"{path}.meta.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+        os.replace(f"{path}.meta.tmp", f"{path}.meta")
+
+    def load(self, path):
+        try:
+            with open(f"{path}.meta") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            logger.warning("HNSW index has no metadata, need to rebuild")
+            return False
+        identity = _file_identity(path)
+        if meta.get('fingerprint') != self.fingerprint or meta.get('index_file') != identity:
+            logger.warning("HNSW index does not match the loaded embeddings, need to rebuild")
+            return False
+
+        index = self._new_index()
+        index.load_index(path, max_elements=len(self.embeddings))
+        if index.get_current_count() != len(self.embeddings) or _file_identity(path) != identity:
+            logger.warning("HNSW index does not match the loaded embeddings, need to rebuild")
+            return False
+        index.set_ef(self.ef_search)
+        self.index = index
+        return True
+
+    def search(self, query_vectors, top_k):
+        """Return a list of (indices, similarities) pairs, one per query vector"""
+        top_k = min(top_k, len(self.embeddings))
+        labels, distances = self.index.knn_query(np.asarray(query_vectors, dtype=np.float32), k=top_k)
+        return [(row_labels.astype(np.int64), 1.0 - row_distances) for row_labels, row_distances in zip(labels, distances)]
+
+ANN_BACKENDS = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+    'hnsw': HNSWIndex,
+}
+
+def resolve_backend(backend, num_vectors, min_docs):
+    """
+    Pick the index backend for a corpus of `num_vectors` embeddings.
+    'auto' uses exact search below `min_docs` vectors, then HNSW when hnswlib is installed and IVF otherwise.
+    """
+    if backend == 'auto':
+        if num_vectors < min_docs:
+            return 'exact'
+        return 'hnsw' if hnswlib else 'ivf'
+    if backend == 'hnsw' and not hnswlib:
+        logger.warning("hnswlib not installed, falling back to IVF index. Install with: pip install hnswlib")
+        return 'ivf'
+    if backend not in ANN_BACKENDS:
+        logger.warning(f"Unknown ANN backend '{backend}', falling back to exact search")
+        return 'exact'
+    return backend
@@ -0,0 +1,33 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+# Bounded pool for CPU-bound work (query preprocessing, embedding, spelling correction) called from async views,
+# so a burst of requests cannot starve the event loop or spawn unbounded threads
+_cpu_executor = None
+_cpu_executor_lock = threading.Lock()
+
+def get_cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is None:
+        with _cpu_executor_lock:
+            if _cpu_executor is None:
+                _cpu_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_CPU_WORKERS', 4), thread_name_prefix="async-cpu"
+                )
+    return _cpu_executor
+
+def _reset_after_fork():
+    global _cpu_executor, _cpu_executor_lock
+    _cpu_executor = None
+    _cpu_executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """Runs a blocking function on the bounded CPU executor and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(func, *args, **kwargs))
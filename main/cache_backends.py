@@ -0,0 +1,239 @@
+"""
+Cache backend keeping a small in-process LRU in front of a shared remote cache (Redis).
+
+Reads are answered from the local tier when possible and fall through to the remote cache otherwise.
+Values found remotely are copied into the local tier for at most LOCAL_TIMEOUT seconds, which bounds
+how long a process can serve a value another process has changed or deleted. Operations that must be
+consistent across processes (add, incr, delete) always go to the remote cache. Local values are kept
+by reference rather than pickled, so callers must not mutate what they get from the cache.
+
+Example configuration:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'main.cache_backends.TwoTierCache',
+            'OPTIONS': {'REMOTE': 'redis', 'LOCAL_MAX_ENTRIES': 1024, 'LOCAL_TIMEOUT': 5},
+        },
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://localhost:6379/0',
+            'OPTIONS': {'COMPRESSOR': 'main.cache_backends.ThresholdZlibCompressor'},
+        },
+    }
+"""
+import os
+import threading
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django_redis.cache import RedisCache
+from django_redis.compressors.zlib import ZlibCompressor
+from .cache_utils import LRUCache
+
+_MISSING = object()
+
+# Deletes KEYS[1] only while it holds ARGV[1]; Redis runs a script without interleaving other commands
+_DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def delete_if_equal(cache, key, value, version=None):
+    """
+    Delete `key` only if it still holds `value`, e.g. to release a lock without removing one another caller
+    took after it expired. Returns whether the key was deleted.
+    The check and delete are atomic on django-redis, directly or as the remote tier of a TwoTierCache. Other
+    backends fall back to a get followed by a delete, so a value replaced between the two is deleted too;
+    LocMemCache is only used by a single development process, where that window is a few microseconds.
+    """
+    if isinstance(cache, TwoTierCache):
+        return cache.delete_if_equal(key, value, version=version)
+    if isinstance(cache, RedisCache):
+        client = cache.client
+        # Values are stored serialized, and serializing the same value gives the same bytes
+        deleted = client.get_client(write=True).eval(
+            _DELETE_IF_EQUAL_SCRIPT, 1, client.make_key(key, version=version), client.encode(value)
+        )
+        return bool(deleted)
+    if cache.get(key, _MISSING, version=version) == value:
+        return cache.delete(key, version=version)
+    return False
+
+class ThresholdZlibCompressor(ZlibCompressor):
+    """
+    zlib compression for values longer than COMPRESS_MIN_LENGTH bytes (default 1024), such as LLM summaries.
+    Smaller values cost more CPU to compress than they save in memory and network.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self.preset = options.get('COMPRESS_LEVEL', 1)
+
+class _LocalTier:
+    """Process-wide state of a TwoTierCache: the LRU and the remote hit/miss counters"""
+
+    def __init__(self, max_entries, ttl):
+        self.lru = LRUCache(max_entries, ttl=ttl)
+        self.lock = threading.Lock()
+        self.remote_hits = 0
+        self.remote_misses = 0
+
+# Django creates a cache backend per thread, so the local tier is shared through this registry
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+def _reset_after_fork():
+    global _local_tiers, _local_tiers_lock
+    _local_tiers = {}
+    _local_tiers_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+class TwoTierCache(BaseCache):
+    """In-process LRU in front of the cache alias named by the REMOTE option, with per-tier hit/miss counters"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.remote_alias = options.get('REMOTE', 'redis')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1024)
+
+    @property
+    def tier(self):
+        tier = _local_tiers.get(self.location)
+        if tier is None:
+            with _local_tiers_lock:
+                tier = _local_tiers.get(self.location)
+                if tier is None:
+                    tier = _local_tiers[self.location] = _LocalTier(self.local_max_entries, self.local_timeout)
+        return tier
+
+    @property
+    def local(self):
+        return self.tier.lru
+
+    @property
+    def remote(self):
+        # caches[] hands out one backend instance per thread
+        return caches[self.remote_alias]
+
+    def _local_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(self.local_timeout, max(timeout, 0))
+
+    def _count_remote(self, hits, misses):
+        tier = self.tier
+        with tier.lock:
+            tier.remote_hits += hits
+            tier.remote_misses += misses
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.local.get(local_key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = self.remote.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count_remote(0, 1)
+            return default
+        self._count_remote(1, 0)
+        self.local.set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local.get(self.make_and_validate_key(key, version=version), _MISSING)
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                found[key] = value
+        if remote_keys:
+            remote_found = self.remote.get_many(remote_keys, version=version)
+            self._count_remote(len(remote_found), len(remote_keys) - len(remote_found))
+            for key, value in remote_found.items():
+                self.local.set(self.make_key(key, version=version), value)
+            found.update(remote_found)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.remote.set(key, value, timeout=self._remote_timeout(timeout), version=version)
+        self.local.set(local_key, value, ttl=self._local_ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout=self._remote_timeout(timeout), version=version) or []
+        for key, value in data.items():
+            if key not in failed:
+                self.local.set(self.make_and_validate_key(key, version=version), value, ttl=self._local_ttl(timeout))
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        added = self.remote.add(key, value, timeout=self._remote_timeout(timeout), version=version)
+        if added:
+            self.local.set(local_key, value, ttl=self._local_ttl(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, timeout=self._remote_timeout(timeout), version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.remote.delete(key, version=version)
+
+    def delete_if_equal(self, key, value, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return delete_if_equal(self.remote, key, value, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self.make_and_validate_key(key, version=version))
+        self.remote.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self.local.get(self.make_and_validate_key(key, version=version), _MISSING) is not _MISSING:
+            return True
+        return self.remote.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters are only consistent in the remote cache, so a stale local copy is dropped
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.remote.incr(key, delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.remote.clear()
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
+
+    def _remote_timeout(self, timeout):
+        # The remote backend applies its own default for DEFAULT_TIMEOUT, so this backend's default is passed explicitly
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def stats(self):
+        """Hit/miss counters of both tiers; a local miss is counted again as a remote hit or miss"""
+        tier = self.tier
+        local = tier.lru.stats()
+        with tier.lock:
+            remote_lookups = tier.remote_hits + tier.remote_misses
+            lookups = local['hits'] + local['misses']
+            return {
+                'local_hits': local['hits'],
+                'local_misses': local['misses'],
+                'local_hit_ratio': local['hit_ratio'],
+                'local_size': local['size'],
+                'remote_hits': tier.remote_hits,
+                'remote_misses': tier.remote_misses,
+                'remote_hit_ratio': tier.remote_hits / remote_lookups if remote_lookups else 0.0,
+                'hit_ratio': (local['hits'] + tier.remote_hits) / lookups if lookups else 0.0,
+            }
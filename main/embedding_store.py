@@ -0,0 +1,300 @@
+"""
+Binary on-disk store for document embeddings.
+
+Layout of a store file:
+    MAGIC (8 bytes) | header length (uint32, little endian) | JSON header, zero-padded to HEADER_SIZE
+    embedding matrix, `count` x `dim` rows of `dtype`, starting at HEADER_SIZE
+    doc id table, a UTF-8 JSON array starting at `ids_offset`
+    content hash table, a UTF-8 JSON array starting at `hashes_offset` (optional, null for unknown hashes)
+
+The matrix is opened with np.memmap, so every worker process shares the same pages through
+the OS page cache and opening a store costs a header read instead of unpickling the matrix.
+
+Changes made after a store was written go to an EmbeddingDeltaLog next to it, which readers
+apply on top of the store until compaction merges both into a new store file.
+"""
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import struct
+from contextlib import contextmanager
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ESEMBED1'
+HEADER_SIZE = 4096
+FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ('float32', 'float16')
+
+class EmbeddingStoreError(Exception):
+    """Raised when a store file is missing, corrupt or in an unsupported format"""
+
+class EmbeddingStoreWriter:
+    """
+    Streams embedding batches into a new store file. The file is written next to `path`
+    and moved into place on close(), so readers never see a half-written store.
+    """
+
+    def __init__(self, path, model_name, dtype='float32', normalized=False):
+        if dtype not in SUPPORTED_DTYPES:
+            raise EmbeddingStoreError(f"Unsupported embedding dtype '{dtype}'")
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.normalized = normalized
+        self.dim = None
+        self.count = 0
+        self.doc_ids = []
+        self.content_hashes = []
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(self.tmp_path, 'wb')
+        # Reserve the header region; it is filled in once the row count is known
+        self._file.write(b'\0' * HEADER_SIZE)
+
+    def add(self, embeddings, doc_ids, content_hashes=None):
+        """Append a batch of embeddings and their doc ids, optionally with the content hash of each document"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        if embeddings.ndim != 2 or len(embeddings) != len(doc_ids):
+            raise EmbeddingStoreError("Embeddings must be a 2D array with one row per doc id")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise EmbeddingStoreError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+
+        self._file.write(embeddings.tobytes())
+        self.doc_ids.extend(str(doc_id) for doc_id in doc_ids)
+        self.content_hashes.extend(content_hashes if content_hashes is not None else [None] * len(doc_ids))
+        self.count += len(embeddings)
+
+    def close(self):
+        """Write the doc id and content hash tables and the header, then publish the file"""
+        self.finish()
+        self.publish()
+
+    def finish(self):
+        """
+        Complete the file at `tmp_path` without publishing it, e.g. to build an index over it that has to be
+        in place before the new store replaces the old one
+        """
+        ids_offset = self._file.tell()
+        ids_table = json.dumps(self.doc_ids).encode('utf-8')
+        self._file.write(ids_table)
+        hashes_offset = self._file.tell()
+        hashes_table = json.dumps(self.content_hashes).encode('utf-8')
+        self._file.write(hashes_table)
+
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'model_name': self.model_name,
+            'dim': self.dim or 0,
+            'count': self.count,
+            'dtype': self.dtype.name,
+            'normalized': self.normalized,
+            'data_offset': HEADER_SIZE,
+            'ids_offset': ids_offset,
+            'ids_length': len(ids_table),
+            'hashes_offset': hashes_offset,
+            'hashes_length': len(hashes_table),
+        }).encode('utf-8')
+        prefix = MAGIC + struct.pack('<I', len(header))
+        if len(prefix) + len(header) > HEADER_SIZE:
+            self.abort()
+            raise EmbeddingStoreError("Embedding store header too large")
+
+        self._file.seek(0)
+        self._file.write(prefix + header)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def publish(self):
+        """Move the finished file into place"""
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Discard the partially written file"""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def read_header(path):
+    """Read and validate the JSON header of a store file"""
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise EmbeddingStoreError(f"{path} is not an embedding store file")
+        (header_length,) = struct.unpack('<I', prefix[len(MAGIC):])
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    if header.get('version') != FORMAT_VERSION:
+        raise EmbeddingStoreError(f"Unsupported embedding store version {header.get('version')}")
+    if header.get('dtype') not in SUPPORTED_DTYPES:
+        raise EmbeddingStoreError(f"Unsupported embedding dtype '{header.get('dtype')}'")
+    return header
+
+class EmbeddingStore:
+    """Read-only view of a store file with the embedding matrix memory-mapped"""
+
+    def __init__(self, path):
+        header = read_header(path)
+        self.path = path
+        self.header = header
+        self.model_name = header['model_name']
+        self.dim = header['dim']
+        self.count = header['count']
+        self.dtype = np.dtype(header['dtype'])
+        self.normalized = header['normalized']
+
+        if self.count:
+            self.embeddings = np.memmap(
+                path, dtype=self.dtype, mode='r', offset=header['data_offset'], shape=(self.count, self.dim)
+            )
+        else:
+            self.embeddings = np.empty((0, self.dim), dtype=self.dtype)
+
+        with open(path, 'rb') as f:
+            f.seek(header['ids_offset'])
+            ids_table = f.read(header['ids_length'])
+        self.doc_ids = json.loads(ids_table.decode('utf-8'))
+        if len(self.doc_ids) != self.count:
+            raise EmbeddingStoreError(f"{path} has {self.count} embeddings but {len(self.doc_ids)} doc ids")
+        # Identifies the rows of this store, so an ANN index built over another store with as many rows is not reused
+        self.fingerprint = hashlib.md5(json.dumps(header, sort_keys=True).encode('utf-8') + ids_table).hexdigest()
+
+    def __len__(self):
+        return self.count
+
+    def read_content_hashes(self):
+        """Content hash of every row (None where unknown), read on demand since searching does not need them"""
+        if self.header.get('hashes_offset') is None:
+            return [None] * self.count
+        with open(self.path, 'rb') as f:
+            f.seek(self.header['hashes_offset'])
+            return json.loads(f.read(self.header['hashes_length']).decode('utf-8'))
+
+class EmbeddingDeltaLog:
+    """
+    Append-only log of the embeddings added, replaced or removed since the store next to it was written.
+    Each line is a JSON record: {"op": "put", "doc_id", "hash", "vector"} with the base64 encoded float32
+    vector, or a tombstone {"op": "del", "doc_id"}. Later records for a doc id win, so applying a record
+    twice is harmless. Writers and compaction serialize on a lock file; readers never lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock across processes for appending to or replacing the log"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def put_record(doc_id, content_hash, vector):
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        return {
+            'op': 'put',
+            'doc_id': str(doc_id),
+            'hash': content_hash,
+            'vector': base64.b64encode(vector.tobytes()).decode('ascii'),
+        }
+
+    @staticmethod
+    def delete_record(doc_id):
+        return {'op': 'del', 'doc_id': str(doc_id)}
+
+    def append(self, records):
+        """Append records with a single write, so readers see whole lines or nothing of them"""
+        if not records:
+            return
+        data = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        with self.locked(), open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, offset=0):
+        """
+        Records from byte `offset` on, with the offset to continue from. A line still being written
+        is left for the next read.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b'\n') + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line]
+        return records, offset + end
+
+    def identity(self):
+        """(inode, size) of the log file, or None if there is none; a new inode means the log was reset"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def reset(self):
+        """Replace the log with an empty one once its records are merged into the store; call while holding locked()"""
+        tmp_path = f"{self.path}.tmp"
+        open(tmp_path, 'wb').close()
+        os.replace(tmp_path, self.path)
+
+class EmbeddingDelta:
+    """Records of a delta log folded into the latest vector per doc id and the doc ids removed"""
+
+    def __init__(self):
+        self.entries = {}
+        self.deleted = set()
+
+    def apply(self, records):
+        for record in records:
+            doc_id = record['doc_id']
+            if record['op'] == 'put':
+                vector = np.frombuffer(base64.b64decode(record['vector']), dtype=np.float32)
+                self.entries[doc_id] = (record.get('hash'), vector)
+                self.deleted.discard(doc_id)
+            else:
+                self.entries.pop(doc_id, None)
+                self.deleted.add(doc_id)
+
+    def __len__(self):
+        return len(self.entries) + len(self.deleted)
+
+    def hidden_ids(self):
+        """Doc ids whose rows in the store are replaced or removed by this delta"""
+        return frozenset(self.entries) | frozenset(self.deleted)
+
+    def arrays(self):
+        """(doc ids, content hashes, vector matrix) of the vectors in this delta"""
+        doc_ids = list(self.entries)
+        content_hashes = [self.entries[doc_id][0] for doc_id in doc_ids]
+        if doc_ids:
+            matrix = np.vstack([self.entries[doc_id][1] for doc_id in doc_ids])
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        return doc_ids, content_hashes, matrix
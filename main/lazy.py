@@ -0,0 +1,29 @@
+import threading
+from django.utils.functional import LazyObject, empty
+
+class LazySingleton(LazyObject):
+    """
+    Proxy that builds the wrapped object with `factory` on first use, so importing a module that
+    defines one stays cheap. Concurrent first uses build it only once.
+    """
+
+    def __init__(self, factory):
+        # LazyObject forwards attribute writes to the wrapped object, so own attributes go in __dict__
+        self.__dict__['_factory'] = factory
+        self.__dict__['_lock'] = threading.Lock()
+        super().__init__()
+
+    def _setup(self):
+        with self._lock:
+            if self._wrapped is empty:
+                self._wrapped = self._factory()
+
+def is_loaded(lazy_object):
+    """Whether a LazySingleton has already built its object"""
+    return lazy_object._wrapped is not empty
+
+def load(lazy_object):
+    """Builds a LazySingleton's object now if it has not been built yet, and returns it"""
+    if not is_loaded(lazy_object):
+        lazy_object._setup()
+    return lazy_object._wrapped
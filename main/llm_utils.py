@@ -1,12 +1,23 @@
 import os
+import json
+import time
+import uuid
+import asyncio
+import weakref
+import aiohttp
 import requests
 import hashlib
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from .cache_backends import delete_if_equal
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _api_url():
+    return getattr(settings, 'LLM_API_URL', None) or f"https://api-inference.huggingface.co/models/{settings.LLM_MODEL_ID}"
+
 def get_cache_key(query, documents):
     """Generate cache key for query and documents"""
     # Create a hash of the query and document IDs
@@ -14,30 +25,8 @@ def get_cache_key(query, documents):
     content = f"{query}:{':'.join(sorted(doc_ids))}"
     return f"llm_summary:{hashlib.md5(content.encode()).hexdigest()}"
 
-def get_llm_summary(query: str, documents: list, max_doc_length=700):
-    """
-    Generates a summary using HuggingFace Inference API with caching.
-    """
-    api_key = settings.HUGGINGFACE_API_KEY
-    model_id = settings.LLM_MODEL_ID
-    api_url = f"https://api-inference.huggingface.co/models/{model_id}"
-
-    if not api_key:
-        logger.warning("HUGGINGFACE_API_KEY not found. LLM summarization disabled.")
-        return "LLM summarization is unavailable (API key missing)."
-
-    if not documents:
-        return "No documents provided."
-
-    # Check cache first
-    cache_key = get_cache_key(query, documents)
-    cached_summary = cache.get(cache_key)
-    if cached_summary:
-        logger.info(f"Using cached LLM summary for query: {query}")
-        return cached_summary
-
-    headers = {"Authorization": f"Bearer {api_key}"}
-    
+def _build_payload(query, documents, max_doc_length):
+    """Builds the Inference API payload asking for a unified answer over the top documents"""
     context_parts = []
     for i, doc in enumerate(documents[:3]):
         doc_text = doc.get('text', '')
@@ -57,7 +46,7 @@ def get_llm_summary(query: str, documents: list, max_doc_length=700):
         f"Answer:"
     )
 
-    payload = {
+    return {
         "inputs": prompt,
         "parameters": {
             "max_new_tokens": 250,
@@ -70,34 +59,149 @@ def get_llm_summary(query: str, documents: list, max_doc_length=700):
         }
     }
 
+def _extract_summary(query, result):
+    """Returns the summary from a successful API response, or None if the format is unexpected"""
+    if isinstance(result, list) and len(result) > 0 and "generated_text" in result[0]:
+        summary = result[0]["generated_text"].strip()
+        logger.info(f"LLM summary received for query '{query}': {summary[:100]}...")
+        return summary
+    logger.error(f"Unexpected LLM API response format for query '{query}': {result}")
+    return None
+
+FORMAT_ERROR_MESSAGE = "Could not generate summary due to API response format."
+
+def _error_message(query, status_code, error_content):
+    """User-facing message for a failed API response"""
+    logger.error(f"LLM API request failed for query '{query}' with status {status_code}: {error_content}")
+    
+    if status_code == 401:
+        return "LLM API request failed: Unauthorized (check API key)."
+    elif status_code == 429:
+        return "LLM service is currently busy (rate limit exceeded). Please try again later."
+    elif status_code >= 500:
+        return f"LLM service unavailable (server error {status_code}). Please try again later."
+    return f"Failed to get summary from LLM (HTTP {status_code})."
+
+SUMMARY_PENDING_MESSAGE = "The summary for this query is still being generated. Please try again shortly."
+
+def _lock_key(cache_key):
+    return f"{cache_key}:lock"
+
+def _acquire_or_wait(cache_key):
+    """
+    Single-flight guard for a summary that is not cached yet. Returns (summary, token): either the token of
+    the lock to generate it, the summary another caller generated meanwhile, or neither once the wait times out.
+    The lock expires on its own if its holder dies, and waiters take it over once it is released without a summary.
+    """
+    lock_timeout = getattr(settings, 'LLM_SUMMARY_LOCK_TIMEOUT', 60)
+    poll_interval = getattr(settings, 'LLM_SUMMARY_POLL_INTERVAL', 0.25)
+    deadline = time.monotonic() + getattr(settings, 'LLM_SUMMARY_WAIT_TIMEOUT', 30)
+    token = uuid.uuid4().hex
+    while True:
+        if cache.add(_lock_key(cache_key), token, timeout=lock_timeout):
+            # The previous holder may have cached the summary between our cache check and taking the lock
+            summary = cache.get(cache_key)
+            if summary:
+                _release_lock(cache_key, token)
+                return summary, None
+            return None, token
+        summary = cache.get(cache_key)
+        if summary:
+            logger.info("Using LLM summary generated by a concurrent request")
+            return summary, None
+        if time.monotonic() >= deadline:
+            logger.warning("Timed out waiting for a concurrent request to generate the LLM summary")
+            return None, None
+        time.sleep(poll_interval)
+
+def _release_lock(cache_key, token):
+    """
+    Release a lock taken by _acquire_or_wait, unless it expired and another caller holds it now, e.g. after
+    a summary streamed for longer than LLM_SUMMARY_LOCK_TIMEOUT
+    """
+    delete_if_equal(caches['default'], _lock_key(cache_key), token)
+
+async def _async_acquire_or_wait(cache_key):
+    """Async counterpart of _acquire_or_wait"""
+    lock_timeout = getattr(settings, 'LLM_SUMMARY_LOCK_TIMEOUT', 60)
+    poll_interval = getattr(settings, 'LLM_SUMMARY_POLL_INTERVAL', 0.25)
+    deadline = time.monotonic() + getattr(settings, 'LLM_SUMMARY_WAIT_TIMEOUT', 30)
+    token = uuid.uuid4().hex
+    while True:
+        if await cache.aadd(_lock_key(cache_key), token, timeout=lock_timeout):
+            summary = await cache.aget(cache_key)
+            if summary:
+                await _async_release_lock(cache_key, token)
+                return summary, None
+            return None, token
+        summary = await cache.aget(cache_key)
+        if summary:
+            logger.info("Using LLM summary generated by a concurrent request")
+            return summary, None
+        if time.monotonic() >= deadline:
+            logger.warning("Timed out waiting for a concurrent request to generate the LLM summary")
+            return None, None
+        await asyncio.sleep(poll_interval)
+
+async def _async_release_lock(cache_key, token):
+    """Async counterpart of _release_lock"""
+    await sync_to_async(delete_if_equal)(caches['default'], _lock_key(cache_key), token)
+
+def _prepare_request(query, documents):
+    """Returns (cache key, early reply) where an early reply short-circuits the API call"""
+    if not settings.HUGGINGFACE_API_KEY:
+        logger.warning("HUGGINGFACE_API_KEY not found. LLM summarization disabled.")
+        return None, "LLM summarization is unavailable (API key missing)."
+
+    if not documents:
+        return None, "No documents provided."
+
+    return get_cache_key(query, documents), None
+
+def get_llm_summary(query: str, documents: list, max_doc_length=700):
+    """
+    Generates a summary using HuggingFace Inference API with caching.
+    """
+    cache_key, early_reply = _prepare_request(query, documents)
+    if early_reply:
+        return early_reply
+
+    # Check cache first
+    cached_summary = cache.get(cache_key)
+    if cached_summary:
+        logger.info(f"Using cached LLM summary for query: {query}")
+        return cached_summary
+
+    # Only one caller generates a given summary, the others wait for it to appear in the cache
+    summary, token = _acquire_or_wait(cache_key)
+    if summary:
+        return summary
+    if not token:
+        return SUMMARY_PENDING_MESSAGE
+    try:
+        return _request_summary(query, documents, cache_key, max_doc_length)
+    finally:
+        _release_lock(cache_key, token)
+
+def _request_summary(query, documents, cache_key, max_doc_length):
+    """Calls the Inference API and caches the summary"""
+    model_id = settings.LLM_MODEL_ID
+    headers = {"Authorization": f"Bearer {settings.HUGGINGFACE_API_KEY}"}
+    payload = _build_payload(query, documents, max_doc_length)
+
     try:
         logger.info(f"Sending request to LLM: {model_id} with query: {query}")
-        response = requests.post(api_url, headers=headers, json=payload, timeout=45) 
+        response = requests.post(_api_url(), headers=headers, json=payload, timeout=45) 
         
         if response.status_code == 200:
-            result = response.json()
-            if isinstance(result, list) and len(result) > 0 and "generated_text" in result[0]:
-                summary = result[0]["generated_text"].strip()
-                
-                # Cache the summary
-                cache.set(cache_key, summary, timeout=getattr(settings, 'LLM_CACHE_TIMEOUT', 3600))
-                
-                logger.info(f"LLM summary received for query '{query}': {summary[:100]}...")
-                return summary
-            else:
-                logger.error(f"Unexpected LLM API response format for query '{query}': {result}")
-                return "Could not generate summary due to API response format."
-        else:
-            error_content = response.text
-            logger.error(f"LLM API request failed for query '{query}' with status {response.status_code}: {error_content}")
+            summary = _extract_summary(query, response.json())
+            if summary is None:
+                return FORMAT_ERROR_MESSAGE
             
-            if response.status_code == 401:
-                return "LLM API request failed: Unauthorized (check API key)."
-            elif response.status_code == 429:
-                return "LLM service is currently busy (rate limit exceeded). Please try again later."
-            elif response.status_code >= 500:
-                return f"LLM service unavailable (server error {response.status_code}). Please try again later."
-            return f"Failed to get summary from LLM (HTTP {response.status_code})."
+            # Cache the summary
+            cache.set(cache_key, summary, timeout=getattr(settings, 'LLM_CACHE_TIMEOUT', 3600))
+            return summary
+        return _error_message(query, response.status_code, response.text)
 
     except requests.exceptions.Timeout:
         logger.error(f"LLM API request timed out for query '{query}'.")
@@ -109,3 +213,260 @@ def get_llm_summary(query: str, documents: list, max_doc_length=700):
         logger.error(f"An unexpected error occurred while getting LLM summary for query '{query}': {e}", exc_info=True)
         return "An unexpected error occurred while generating the summary."
 
+def _stream_tokens(response):
+    """
+    Yields generated text pieces from a streaming text-generation response (server-sent events with a
+    `token` per event). A plain JSON body, e.g. from a server that ignores `stream`, is yielded as one piece.
+    """
+    if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+        summary = _extract_summary("", response.json())
+        if summary is None:
+            raise ValueError("unexpected response format")
+        yield summary
+        return
+
+    for line in response.iter_lines(decode_unicode=True):
+        done, text = _parse_stream_line(line)
+        if done:
+            break
+        if text:
+            yield text
+
+def _parse_stream_line(line):
+    """(done, text) of one line of a streaming text-generation response; text is None for lines without a token"""
+    if not line or not line.startswith('data:'):
+        return False, None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return True, None
+    event = json.loads(data)
+    if event.get('error'):
+        raise ValueError(event['error'])
+    token = event.get('token') or {}
+    if not token.get('special') and token.get('text'):
+        return False, token['text']
+    return False, None
+
+def stream_llm_summary(query: str, documents: list, max_doc_length=700):
+    """
+    Streams a summary as it is generated, yielding {'token': text} events followed by one
+    {'summary': full text, 'done': True} event, or a single {'error': message} event.
+    Summaries are cached under the same key as get_llm_summary, so cached queries are answered in one event.
+    """
+    cache_key, early_reply = _prepare_request(query, documents)
+    if early_reply:
+        yield {'error': early_reply}
+        return
+
+    cached_summary = cache.get(cache_key)
+    if cached_summary:
+        logger.info(f"Using cached LLM summary for query: {query}")
+        yield {'summary': cached_summary, 'done': True, 'cached': True}
+        return
+
+    summary, token = _acquire_or_wait(cache_key)
+    if summary:
+        yield {'summary': summary, 'done': True, 'cached': True}
+        return
+    if not token:
+        yield {'error': SUMMARY_PENDING_MESSAGE}
+        return
+    try:
+        yield from _stream_summary(query, documents, cache_key, max_doc_length)
+    finally:
+        _release_lock(cache_key, token)
+
+def _stream_summary(query, documents, cache_key, max_doc_length):
+    """Streams the summary from the Inference API and caches it once complete"""
+    model_id = settings.LLM_MODEL_ID
+    headers = {"Authorization": f"Bearer {settings.HUGGINGFACE_API_KEY}"}
+    payload = _build_payload(query, documents, max_doc_length)
+    payload["stream"] = True
+
+    try:
+        logger.info(f"Streaming request to LLM: {model_id} with query: {query}")
+        with requests.post(_api_url(), headers=headers, json=payload, timeout=45, stream=True) as response:
+            if response.status_code != 200:
+                yield {'error': _error_message(query, response.status_code, response.text)}
+                return
+
+            pieces = []
+            for piece in _stream_tokens(response):
+                # Leading whitespace of the answer is dropped, like the stripped non-streaming summary
+                if not pieces:
+                    piece = piece.lstrip()
+                    if not piece:
+                        continue
+                pieces.append(piece)
+                yield {'token': piece}
+
+        summary = "".join(pieces).strip()
+        if not summary:
+            yield {'error': FORMAT_ERROR_MESSAGE}
+            return
+        cache.set(cache_key, summary, timeout=getattr(settings, 'LLM_CACHE_TIMEOUT', 3600))
+        logger.info(f"LLM summary streamed for query '{query}': {summary[:100]}...")
+        yield {'summary': summary, 'done': True}
+
+    except requests.exceptions.Timeout:
+        logger.error(f"LLM API request timed out for query '{query}'.")
+        yield {'error': "LLM request timed out. Please try again."}
+    except requests.exceptions.RequestException as e:
+        logger.error(f"LLM API request failed for query '{query}': {e}")
+        yield {'error': "Failed to get summary from LLM due to a connection or API error."}
+    except ValueError as e:
+        logger.error(f"Unexpected LLM API stream for query '{query}': {e}")
+        yield {'error': FORMAT_ERROR_MESSAGE}
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while streaming LLM summary for query '{query}': {e}", exc_info=True)
+        yield {'error': "An unexpected error occurred while generating the summary."}
+
+# aiohttp sessions are bound to the event loop that created them, so one pooled session is kept per loop
+_async_sessions = weakref.WeakKeyDictionary()
+
+def _get_async_session():
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = _async_sessions[loop] = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=45))
+    return session
+
+async def async_get_llm_summary(query: str, documents: list, max_doc_length=700):
+    """
+    Async version of get_llm_summary using aiohttp, sharing its cache and messages.
+    """
+    cache_key, early_reply = _prepare_request(query, documents)
+    if early_reply:
+        return early_reply
+
+    cached_summary = await cache.aget(cache_key)
+    if cached_summary:
+        logger.info(f"Using cached LLM summary for query: {query}")
+        return cached_summary
+
+    summary, token = await _async_acquire_or_wait(cache_key)
+    if summary:
+        return summary
+    if not token:
+        return SUMMARY_PENDING_MESSAGE
+    try:
+        return await _async_request_summary(query, documents, cache_key, max_doc_length)
+    finally:
+        await _async_release_lock(cache_key, token)
+
+async def _async_request_summary(query, documents, cache_key, max_doc_length):
+    """Calls the Inference API over aiohttp and caches the summary"""
+    model_id = settings.LLM_MODEL_ID
+    headers = {"Authorization": f"Bearer {settings.HUGGINGFACE_API_KEY}"}
+    payload = _build_payload(query, documents, max_doc_length)
+
+    try:
+        logger.info(f"Sending async request to LLM: {model_id} with query: {query}")
+        async with _get_async_session().post(_api_url(), headers=headers, json=payload) as response:
+            if response.status == 200:
+                summary = _extract_summary(query, await response.json(content_type=None))
+                if summary is None:
+                    return FORMAT_ERROR_MESSAGE
+                await cache.aset(cache_key, summary, timeout=getattr(settings, 'LLM_CACHE_TIMEOUT', 3600))
+                return summary
+            return _error_message(query, response.status, await response.text())
+
+    except asyncio.TimeoutError:
+        logger.error(f"LLM API request timed out for query '{query}'.")
+        return "LLM request timed out. Please try again."
+    except aiohttp.ClientError as e:
+        logger.error(f"LLM API request failed for query '{query}': {e}")
+        return "Failed to get summary from LLM due to a connection or API error."
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while getting LLM summary for query '{query}': {e}", exc_info=True)
+        return "An unexpected error occurred while generating the summary."
+
+async def async_stream_llm_summary(query: str, documents: list, max_doc_length=700):
+    """
+    Async version of stream_llm_summary over aiohttp, yielding the same events. Under an ASGI server
+    tokens reach the client as they are generated without holding a thread for the whole LLM call.
+    """
+    cache_key, early_reply = _prepare_request(query, documents)
+    if early_reply:
+        yield {'error': early_reply}
+        return
+
+    cached_summary = await cache.aget(cache_key)
+    if cached_summary:
+        logger.info(f"Using cached LLM summary for query: {query}")
+        yield {'summary': cached_summary, 'done': True, 'cached': True}
+        return
+
+    summary, token = await _async_acquire_or_wait(cache_key)
+    if summary:
+        yield {'summary': summary, 'done': True, 'cached': True}
+        return
+    if not token:
+        yield {'error': SUMMARY_PENDING_MESSAGE}
+        return
+    try:
+        async for event in _async_stream_summary(query, documents, cache_key, max_doc_length):
+            yield event
+    finally:
+        await _async_release_lock(cache_key, token)
+
+async def _async_stream_tokens(response):
+    """Async counterpart of _stream_tokens for an aiohttp response"""
+    if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+        summary = _extract_summary("", await response.json(content_type=None))
+        if summary is None:
+            raise ValueError("unexpected response format")
+        yield summary
+        return
+
+    async for line in response.content:
+        done, text = _parse_stream_line(line.decode('utf-8').strip())
+        if done:
+            break
+        if text:
+            yield text
+
+async def _async_stream_summary(query, documents, cache_key, max_doc_length):
+    """Streams the summary from the Inference API over aiohttp and caches it once complete"""
+    model_id = settings.LLM_MODEL_ID
+    headers = {"Authorization": f"Bearer {settings.HUGGINGFACE_API_KEY}"}
+    payload = _build_payload(query, documents, max_doc_length)
+    payload["stream"] = True
+
+    try:
+        logger.info(f"Streaming async request to LLM: {model_id} with query: {query}")
+        async with _get_async_session().post(_api_url(), headers=headers, json=payload) as response:
+            if response.status != 200:
+                yield {'error': _error_message(query, response.status, await response.text())}
+                return
+
+            pieces = []
+            async for piece in _async_stream_tokens(response):
+                # Leading whitespace of the answer is dropped, like the stripped non-streaming summary
+                if not pieces:
+                    piece = piece.lstrip()
+                    if not piece:
+                        continue
+                pieces.append(piece)
+                yield {'token': piece}
+
+        summary = "".join(pieces).strip()
+        if not summary:
+            yield {'error': FORMAT_ERROR_MESSAGE}
+            return
+        await cache.aset(cache_key, summary, timeout=getattr(settings, 'LLM_CACHE_TIMEOUT', 3600))
+        logger.info(f"LLM summary streamed for query '{query}': {summary[:100]}...")
+        yield {'summary': summary, 'done': True}
+
+    except asyncio.TimeoutError:
+        logger.error(f"LLM API request timed out for query '{query}'.")
+        yield {'error': "LLM request timed out. Please try again."}
+    except aiohttp.ClientError as e:
+        logger.error(f"LLM API request failed for query '{query}': {e}")
+        yield {'error': "Failed to get summary from LLM due to a connection or API error."}
+    except ValueError as e:
+        logger.error(f"Unexpected LLM API stream for query '{query}': {e}")
+        yield {'error': FORMAT_ERROR_MESSAGE}
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while streaming LLM summary for query '{query}': {e}", exc_info=True)
+        yield {'error': "An unexpected error occurred while generating the summary."}
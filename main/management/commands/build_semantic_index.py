@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from main.semantic_search import semantic_engine
 from main.query_correction import query_corrector
+from main.search_cache import bump_index_generation
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -20,14 +21,34 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip building custom dictionary',
         )
+        parser.add_argument(
+            '--ann-backend',
+            choices=['auto', 'exact', 'ivf', 'hnsw'],
+            default=None,
+            help='ANN index backend (defaults to SEMANTIC_ANN_BACKEND)',
+        )
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Merge incremental embedding updates into the store instead of rebuilding all embeddings',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Building semantic search capabilities...'))
         
         try:
-            if not options['skip_embeddings']:
+            if options['compact']:
+                self.stdout.write('Compacting incremental embedding updates...')
+                if semantic_engine.compact_document_embeddings(ann_backend=options['ann_backend']):
+                    bump_index_generation()
+                    self.stdout.write(self.style.SUCCESS('Embedding updates merged into the store'))
+                else:
+                    self.stdout.write('No embedding updates to compact')
+            elif not options['skip_embeddings']:
                 self.stdout.write('Building document embeddings...')
-                if semantic_engine.build_document_embeddings():
+                if semantic_engine.build_document_embeddings(ann_backend=options['ann_backend']):
+                    # Cached semantic results were ranked with the old embeddings
+                    bump_index_generation()
                     self.stdout.write(self.style.SUCCESS('Document embeddings built successfully'))
                 else:
                     self.stdout.write(self.style.WARNING('Failed to build document embeddings'))
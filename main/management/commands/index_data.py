@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from main.opensearch_utils import get_opensearch_client, index_beir_scifact_data
+from main.search_cache import bump_index_generation
 import logging
 
 # Configure basic logging for the command
@@ -22,6 +23,52 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip dependency checking',
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Index through the OpenSearch _bulk API with parallel workers instead of one request per document.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of documents per _bulk request (only with --bulk).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of parallel _bulk workers (only with --bulk).',
+        )
+        parser.add_argument(
+            '--max-retries',
+            type=int,
+            default=3,
+            help='Retries for documents rejected with HTTP 429 (only with --bulk).',
+        )
+        parser.add_argument(
+            '--initial-backoff',
+            type=float,
+            default=2,
+            help='Seconds to wait before the first 429 retry, doubled on every retry (only with --bulk).',
+        )
+        parser.add_argument(
+            '--preprocess-batch-size',
+            type=int,
+            default=256,
+            help='Number of texts per spaCy batch during preprocessing.',
+        )
+        parser.add_argument(
+            '--preprocess-workers',
+            type=int,
+            default=1,
+            help='Number of processes used for spaCy preprocessing.',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only index new and changed documents (by content hash) and delete documents removed from the dataset.',
+        )
 
     def check_dependencies(self):
         """Check if required dependencies are available"""
@@ -74,7 +121,44 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f"Successfully connected to OpenSearch at {settings.OPENSEARCH_URL}"))
             
             index_name = settings.OPENSEARCH_INDEX_NAME
-            index_beir_scifact_data(client, index_name, max_docs=max_docs_to_index)
+            stats = index_beir_scifact_data(
+                client,
+                index_name,
+                max_docs=max_docs_to_index,
+                bulk=options['bulk'],
+                chunk_size=options['chunk_size'],
+                thread_count=options['workers'],
+                max_retries=options['max_retries'],
+                initial_backoff=options['initial_backoff'],
+                preprocess_batch_size=options['preprocess_batch_size'],
+                preprocess_processes=options['preprocess_workers'],
+                incremental=options['incremental'],
+            )
+            if stats is None:
+                self.stderr.write(self.style.ERROR('Could not load the BeIR/scifact dataset.'))
+                return
+            # Cached search results may refer to replaced documents
+            if stats['indexed'] or stats.get('deleted'):
+                bump_index_generation()
+
+            self.stdout.write(
+                f"Indexed {stats['indexed']} documents in {stats['elapsed']:.1f}s "
+                f"({stats['docs_per_sec']:.1f} docs/sec), skipped {stats['skipped']}."
+            )
+            if options['incremental']:
+                self.stdout.write(
+                    f"Added {stats['added']}, updated {stats['updated']}, "
+                    f"left {stats['unchanged']} unchanged and deleted {stats['deleted']} documents."
+                )
+                if 'embedded' in stats:
+                    self.stdout.write(f"Updated the semantic embeddings of {stats['embedded']} documents.")
+            for chunk in stats.get('failed_chunks', []):
+                self.stderr.write(self.style.ERROR(
+                    f"Chunk {chunk['chunk']}: {chunk['failed']} of {chunk['size']} documents failed. First error: {chunk['first_error']}"
+                ))
+            if stats['failed']:
+                self.stderr.write(self.style.ERROR(f"{stats['failed']} documents failed to index into \"{index_name}\"."))
+                return
             
             self.stdout.write(self.style.SUCCESS(f'Successfully indexed BeIR/scifact data into "{index_name}".'))
         
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from main.warmup import run_warmup
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = (
+        'Load every search engine, run first inferences and optionally replay popular queries. '
+        'Models are only warm in this process; replayed queries also prime shared caches such as Redis.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries-file',
+            default=None,
+            help='File of queries to replay, one per line (or "query<TAB>count"), most popular first. '
+                 'Defaults to WARMUP_QUERIES_FILE.',
+        )
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=None,
+            help='Number of queries to replay from the file (defaults to WARMUP_TOP_N).',
+        )
+        parser.add_argument(
+            '--skip-search',
+            action='store_true',
+            help='Do not send searches to OpenSearch',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Warming up search engines...'))
+
+        report = run_warmup(
+            queries_file=options['queries_file'],
+            top_n=options['top_n'],
+            search=not options['skip_search'],
+        )
+
+        for name, seconds in report.get('engines', {}).items():
+            self.stdout.write(f"Loaded {name} in {seconds:.2f}s")
+        for step in ('first_inference', 'first_search', 'replay'):
+            if step in report:
+                self.stdout.write(f"{step.replace('_', ' ').capitalize()}: {report[step]:.2f}s")
+        if 'replayed_queries' in report:
+            self.stdout.write(f"Replayed {report['replayed_queries']} queries")
+
+        if 'error' in report:
+            self.stderr.write(self.style.ERROR(f"Warm-up failed: {report['error']}"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Warm-up completed in {report['total']:.2f}s"))
@@ -1,26 +1,124 @@
 import os
-from opensearchpy import OpenSearch, RequestsHttpConnection, exceptions
+import asyncio
+import functools
+import hashlib
+import weakref
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import threading
+from opensearchpy import AsyncOpenSearch, OpenSearch, Urllib3HttpConnection, exceptions, helpers
 from django.conf import settings
-from datasets import load_dataset # Changed import
+from django.core.cache import cache
+from .async_utils import run_cpu_bound
+from .search_cache import (
+    INDEX_GENERATION_KEY, bump_index_generation, cache_entry, get_index_generation, hits_from_entry,
+    result_cache_enabled, result_cache_key, result_cache_stats,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_opensearch_client():
-    """Initializes and returns an OpenSearch client."""
+_client = None
+_client_lock = threading.Lock()
+
+def _client_args():
     client_args = {
         'hosts': [{'host': settings.OPENSEARCH_HOST, 'port': settings.OPENSEARCH_PORT}],
-        'http_conn_class': RequestsHttpConnection,
+        'timeout': getattr(settings, 'OPENSEARCH_TIMEOUT', 10),
+        'max_retries': getattr(settings, 'OPENSEARCH_MAX_RETRIES', 3),
+        'retry_on_timeout': getattr(settings, 'OPENSEARCH_RETRY_ON_TIMEOUT', True),
+        'retry_on_status': getattr(settings, 'OPENSEARCH_RETRY_ON_STATUS', (502, 503, 504)),
         'use_ssl': settings.OPENSEARCH_USE_SSL,
         'verify_certs': True,  # Set to False if you have issues with Bonsai's SSL certificate and don't have a CA bundle
         'ssl_show_warn': False,
     }
     if settings.OPENSEARCH_USERNAME and settings.OPENSEARCH_PASSWORD:
         client_args['http_auth'] = (settings.OPENSEARCH_USERNAME, settings.OPENSEARCH_PASSWORD)
+    return client_args
+
+def create_opensearch_client():
+    """Builds a new OpenSearch client with the connection pool, timeout and retry policy from settings."""
+    client_args = _client_args()
+    # urllib3 keeps pooled connections alive between requests
+    client_args['connection_class'] = Urllib3HttpConnection
+    client_args['pool_maxsize'] = getattr(settings, 'OPENSEARCH_POOL_MAXSIZE', 10)
+    return OpenSearch(**client_args)
+
+def create_async_opensearch_client():
+    """Builds a new aiohttp-based AsyncOpenSearch client with the same settings as the sync client."""
+    client_args = _client_args()
+    client_args['maxsize'] = getattr(settings, 'OPENSEARCH_POOL_MAXSIZE', 10)
+    return AsyncOpenSearch(**client_args)
+
+def get_opensearch_client():
+    """Returns the process-wide OpenSearch client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_opensearch_client()
+    return _client
 
-    client = OpenSearch(**client_args)
+# aiohttp sessions are bound to the event loop that created them, so async clients are kept per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_opensearch_client():
+    """Returns the AsyncOpenSearch client of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = create_async_opensearch_client()
     return client
 
+def _reset_after_fork():
+    """Drops connections and worker threads inherited from the parent, e.g. a preloading gunicorn master."""
+    global _client, _client_lock, _async_clients, _fusion_executor, _fusion_executor_lock
+    _client = None
+    _client_lock = threading.Lock()
+    _async_clients = weakref.WeakKeyDictionary()
+    _fusion_executor = None
+    _fusion_executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def knn_enabled():
+    """Whether document embeddings are stored and searched in a native OpenSearch knn_vector field."""
+    return getattr(settings, 'OPENSEARCH_KNN_ENABLED', False)
+
+def _add_knn_field(index_body):
+    """Adds the k-NN index setting and knn_vector field mapping to an index body."""
+    index_body["settings"]["index"] = {"knn": True}
+    index_body["mappings"]["properties"][settings.OPENSEARCH_KNN_FIELD] = {
+        "type": "knn_vector",
+        "dimension": settings.OPENSEARCH_KNN_DIMENSION,
+        "method": {
+            "name": "hnsw",
+            "space_type": "cosinesimil",
+            "engine": settings.OPENSEARCH_KNN_ENGINE,
+            "parameters": {
+                "m": settings.OPENSEARCH_KNN_M,
+                "ef_construction": settings.OPENSEARCH_KNN_EF_CONSTRUCTION,
+            },
+        },
+    }
+
+def _knn_clause(query_vector, k):
+    """
+    k-NN query clause for the knn_vector field. ef_search is passed per query, since the index-level
+    knn.algo_param.ef_search setting only applies to the nmslib engine.
+    """
+    return {
+        "knn": {
+            settings.OPENSEARCH_KNN_FIELD: {
+                "vector": query_vector.tolist(),
+                "k": k,
+                "method_parameters": {"ef_search": max(settings.OPENSEARCH_KNN_EF_SEARCH, k)},
+            }
+        }
+    }
+
 def create_index_if_not_exists(client, index_name):
     """Creates an OpenSearch index if it doesn't already exist."""
     if not client.indices.exists(index=index_name):
@@ -46,6 +144,7 @@ def create_index_if_not_exists(client, index_name):
             "mappings": {
                 "properties": {
                     "doc_id": {"type": "keyword"},
+                    "content_hash": {"type": "keyword", "index": False},
                     "title": {
                         "type": "text", 
                         "analyzer": "scientific_analyzer",
@@ -65,6 +164,8 @@ def create_index_if_not_exists(client, index_name):
                 }
             }
         }
+        if knn_enabled():
+            _add_knn_field(index_body)
         try:
             client.indices.create(index=index_name, body=index_body)
             logger.info(f"Index '{index_name}' created successfully.")
@@ -76,89 +177,591 @@ def create_index_if_not_exists(client, index_name):
                 raise
     else:
         logger.info(f"Index '{index_name}' already exists.")
+        if knn_enabled():
+            mapping = client.indices.get_mapping(index=index_name)
+            properties = mapping.get(index_name, {}).get("mappings", {}).get("properties", {})
+            if settings.OPENSEARCH_KNN_FIELD not in properties:
+                logger.warning(
+                    f"Index '{index_name}' has no '{settings.OPENSEARCH_KNN_FIELD}' knn_vector field. "
+                    f"Delete and re-index it to use native k-NN search."
+                )
 
 def index_document(client, index_name, doc_id, document_data):
-    """Indexes a single document into OpenSearch."""
+    """Indexes a single document into OpenSearch. Returns True on success."""
     try:
         client.index(index=index_name, id=doc_id, body=document_data)
+        return True
     except Exception as e:
         logger.error(f"Error indexing document {doc_id}: {e}")
+        return False
+
+def _chunked(iterable, size):
+    """Yields successive lists of at most `size` items from an iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _bulk_index_chunk(client, chunk, max_retries, initial_backoff, max_backoff):
+    """
+    Sends one chunk of actions through the _bulk API, retrying rejections with a 429 status.
+    Returns the ids of the documents indexed and the failed items.
+    """
+    succeeded_ids = []
+    errors = []
+    for ok, item in helpers.streaming_bulk(
+        client,
+        chunk,
+        chunk_size=len(chunk),
+        max_retries=max_retries,
+        initial_backoff=initial_backoff,
+        max_backoff=max_backoff,
+        raise_on_error=False,
+        raise_on_exception=False,
+    ):
+        if ok:
+            succeeded_ids.append(next(iter(item.values()))["_id"])
+        else:
+            errors.append(item)
+    return succeeded_ids, errors
+
+def bulk_index_documents(client, actions, chunk_size=500, thread_count=4,
+                         max_retries=3, initial_backoff=2, max_backoff=60, on_indexed=None):
+    """
+    Indexes a stream of bulk actions using the OpenSearch _bulk API.
+    Chunks are sent by `thread_count` workers with at most two chunks in flight per worker,
+    so the action stream is consumed lazily. Returns a stats dict with throughput and per-chunk failures.
+    `on_indexed` is called from the calling thread with the sources of each chunk's successfully indexed documents.
+    """
+    stats = {
+        "indexed": 0,
+        "failed": 0,
+        "chunks": 0,
+        "failed_chunks": [],
+        "elapsed": 0.0,
+        "docs_per_sec": 0.0,
+    }
+    start_time = time.perf_counter()
+
+    def collect(future, chunk_no, chunk):
+        chunk_len = len(chunk)
+        try:
+            succeeded_ids, errors = future.result()
+        except Exception as e:
+            succeeded_ids, errors = [], [{"error": str(e)}] * chunk_len
+        stats["indexed"] += len(succeeded_ids)
+        stats["failed"] += len(errors)
+        if errors:
+            stats["failed_chunks"].append({
+                "chunk": chunk_no,
+                "size": chunk_len,
+                "failed": len(errors),
+                "first_error": errors[0],
+            })
+            logger.error(f"Bulk chunk {chunk_no}: {len(errors)} of {chunk_len} documents failed. First error: {errors[0]}")
+        if on_indexed and succeeded_ids:
+            succeeded_ids = set(succeeded_ids)
+            on_indexed([action["_source"] for action in chunk if action["_id"] in succeeded_ids])
 
-def index_beir_scifact_data(client, index_name, max_docs=None):
-    """Loads BeIR/scifact data using Hugging Face datasets library and indexes it into OpenSearch."""
+    with ThreadPoolExecutor(max_workers=max(1, thread_count)) as executor:
+        in_flight = {}
+        for chunk_no, chunk in enumerate(_chunked(actions, chunk_size), start=1):
+            future = executor.submit(_bulk_index_chunk, client, chunk, max_retries, initial_backoff, max_backoff)
+            in_flight[future] = (chunk_no, chunk)
+            stats["chunks"] += 1
+
+            if len(in_flight) >= 2 * max(1, thread_count):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for finished in done:
+                    collect(finished, *in_flight.pop(finished))
+                elapsed = time.perf_counter() - start_time
+                logger.info(f"Bulk indexed {stats['indexed']} documents ({stats['indexed'] / elapsed:.1f} docs/sec)")
+
+        for finished in list(in_flight):
+            collect(finished, *in_flight.pop(finished))
+
+    stats["elapsed"] = time.perf_counter() - start_time
+    if stats["elapsed"] > 0:
+        stats["docs_per_sec"] = stats["indexed"] / stats["elapsed"]
+    return stats
+
+def _iter_raw_scifact_documents(hf_dataset, max_docs, stats):
+    """Yields raw BeIR/scifact documents that have a title or text, counting skipped ones in `stats`."""
+    num_yielded = 0
+    for doc in hf_dataset: # Iterate directly over the Hugging Face Dataset object
+        if max_docs and num_yielded >= max_docs:
+            logger.info(f"Reached max_docs limit of {max_docs}. Stopping indexing.")
+            break
+
+        stats["read"] += 1
+        try:
+            # Access fields from the Hugging Face dataset dictionary
+            doc_id = str(doc['_id'])
+            title = doc.get('title', '') 
+            text_content = doc.get('text', '')
+        except Exception as ex: 
+            logger.error(f"Error processing document {stats['read']}: {ex}")
+            stats["skipped"] += 1
+            continue
+
+        if not title and not text_content:
+            logger.warning(f"Document {doc_id} has no title or text. Skipping.")
+            stats["skipped"] += 1
+            continue
+
+        num_yielded += 1
+        yield {
+            "doc_id": doc_id,
+            "title": title,
+            "text": text_content,
+            "content_hash": document_content_hash(title, text_content),
+        }
+
+def document_content_hash(title, text):
+    """
+    Fingerprint of everything that goes into an indexed document: its title and text, the preprocessing
+    method actually applied and whether an embedding is stored, so a change to either also counts as a change.
+    """
+    from .text_preprocessing import preprocessor
+
+    method = preprocessor.applied_method(settings.TEXT_PREPROCESSING_METHOD)
+    content = f"{method}\0{knn_enabled()}\0{title}\0{text}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+def _iter_changed_documents(documents, existing_hashes, stats, seen_ids):
+    """
+    Yields the documents whose content hash differs from `existing_hashes` (doc id -> hash of the indexed copy),
+    counting new, updated and unchanged documents in `stats`. Every doc id read is added to `seen_ids`.
+    """
+    for document in documents:
+        doc_id = document["doc_id"]
+        seen_ids.add(doc_id)
+        if doc_id not in existing_hashes:
+            stats["added"] += 1
+        elif existing_hashes[doc_id] != document["content_hash"]:
+            stats["updated"] += 1
+        else:
+            stats["unchanged"] += 1
+            continue
+        yield document
+
+def get_content_hashes(client, index_name):
+    """Maps the id of every indexed document to its content hash (None for documents indexed without one)."""
+    if not client.indices.exists(index=index_name):
+        return {}
+    return {
+        document["id"]: document.get("content_hash")
+        for document in iter_all_documents(client, index_name, source_fields=["content_hash"])
+    }
+
+def delete_documents(client, index_name, doc_ids, chunk_size=500):
+    """Deletes documents by id through the _bulk API. Returns the number deleted and the failed items."""
+    actions = ({"_op_type": "delete", "_index": index_name, "_id": doc_id} for doc_id in doc_ids)
+    deleted = 0
+    errors = []
+    for ok, item in helpers.streaming_bulk(
+        client, actions, chunk_size=chunk_size, raise_on_error=False, raise_on_exception=False
+    ):
+        if ok:
+            deleted += 1
+        elif item.get("delete", {}).get("status") != 404:
+            errors.append(item)
+    return deleted, errors
+
+def _iter_scifact_documents(raw_documents, batch_size=256, n_process=1):
+    """
+    Yields preprocessed BeIR/scifact documents ready for indexing.
+    Titles and texts are streamed through a single batched spaCy pipe, so `n_process` workers stay busy for the whole corpus.
+    """
+    from .text_preprocessing import preprocessor
+
+    # nlp.pipe reads ahead of what it yields, so documents wait here until their texts come back out.
+    pending = deque()
+
+    def texts():
+        for document in raw_documents:
+            pending.append(document)
+            yield document["title"]
+            yield document["text"]
+
+    processed = preprocessor.preprocess_many(
+        texts(), batch_size=batch_size, n_process=n_process, method=settings.TEXT_PREPROCESSING_METHOD
+    )
+    for title_processed in processed:
+        text_processed = next(processed)
+        document = pending.popleft()
+        document["title_processed"] = title_processed
+        document["text_processed"] = text_processed
+        yield document
+
+def _attach_embeddings(documents, batch_size=256):
+    """Adds a normalized embedding of title and text to each document for the knn_vector field."""
+    from .semantic_search import semantic_engine
+    from .ann_index import normalize_rows
+
+    if not semantic_engine.model:
+        raise RuntimeError("Semantic model not available, cannot compute embeddings for the k-NN field")
+
+    for batch in _chunked(documents, batch_size):
+        embeddings = semantic_engine.encode_texts([f"{doc['title']} {doc['text']}".strip() for doc in batch])
+        if embeddings is None:
+            raise RuntimeError("Failed to encode documents for the k-NN field")
+        for document, embedding in zip(batch, normalize_rows(embeddings)):
+            document[settings.OPENSEARCH_KNN_FIELD] = embedding.tolist()
+            yield document
+
+def _update_local_embeddings(documents, stats):
+    """
+    Appends the embeddings of successfully indexed documents to the local embedding store's delta log and
+    invalidates cached search results, so the documents become semantically searchable while the run is
+    still indexing, and never before their new text is in the index.
+    """
+    from .semantic_search import semantic_engine
+
+    embedded = semantic_engine.update_document_embeddings(documents) or 0
+    stats["embedded"] += embedded
+    if embedded:
+        bump_index_generation()
+
+def _has_local_embeddings():
+    """
+    Whether semantic search runs on a local embedding store that incremental runs should keep up to date.
+    Only checks the store file, so the model is not loaded until documents are actually encoded.
+    """
+    from .semantic_search import embeddings_file_path
+
+    return not knn_enabled() and os.path.exists(embeddings_file_path())
+
+def index_beir_scifact_data(client, index_name, max_docs=None, bulk=False, chunk_size=500,
+                            thread_count=4, max_retries=3, initial_backoff=2,
+                            preprocess_batch_size=256, preprocess_processes=1, incremental=False):
+    """
+    Loads BeIR/scifact data using Hugging Face datasets library and indexes it into OpenSearch.
+    With `bulk=True` documents are sent through the _bulk API in parallel chunks instead of one request per document.
+    Preprocessing runs in spaCy batches of `preprocess_batch_size` texts across `preprocess_processes` processes.
+    With `incremental=True` only documents whose content hash differs from the indexed copy are preprocessed
+    and sent, and indexed documents no longer in the dataset are deleted. A local embedding store built by
+    build_semantic_index is updated through its delta log after each chunk, with only the documents that chunk indexed.
+    Returns a stats dict, or None if the dataset could not be loaded.
+    """
     logger.info("Loading BeIR/scifact dataset from Hugging Face...")
     try:
-        from .text_preprocessing import preprocessor
-        
+        # Imported here because the datasets library takes about a second to import, which every web worker would pay
+        from datasets import load_dataset
         # Load the corpus part of the BeIR/scifact dataset
         # The "corpus" configuration directly loads the corpus documents.
         # The load_dataset function for BeIR/scifact with "corpus" config returns a Dataset object.
         hf_dataset = load_dataset("BeIR/scifact", "corpus", split="corpus")
     except Exception as e:
         logger.error(f"Failed to load 'BeIR/scifact' dataset using Hugging Face datasets library: {e}. Ensure 'datasets' library is installed and network is available.")
-        return
+        return None
 
+    # Read before creating the index, so a missing index means every document is new
+    existing_hashes = get_content_hashes(client, index_name) if incremental else {}
     create_index_if_not_exists(client, index_name)
     
-    logger.info("Starting document indexing for BeIR/scifact...")
+    logger.info(f"Starting {'incremental ' if incremental else ''}{'bulk ' if bulk else ''}document indexing for BeIR/scifact...")
     
-    num_processed_successfully = 0
-    num_read_attempts = 0
-    num_skipped_due_to_error = 0
+    stats = {"read": 0, "skipped": 0, "indexed": 0, "failed": 0}
+    raw_documents = _iter_raw_scifact_documents(hf_dataset, max_docs, stats)
+    seen_ids = set()
+    if incremental:
+        stats.update({"added": 0, "updated": 0, "unchanged": 0, "deleted": 0})
+        raw_documents = _iter_changed_documents(raw_documents, existing_hashes, stats, seen_ids)
+    documents = _iter_scifact_documents(
+        raw_documents, batch_size=preprocess_batch_size, n_process=preprocess_processes
+    )
+    if knn_enabled():
+        documents = _attach_embeddings(documents)
+    local_embeddings = incremental and _has_local_embeddings()
+    on_indexed = None
+    if local_embeddings:
+        stats["embedded"] = 0
+        on_indexed = functools.partial(_update_local_embeddings, stats=stats)
 
-    for doc in hf_dataset: # Iterate directly over the Hugging Face Dataset object
-        num_read_attempts += 1
+    if bulk:
+        actions = (
+            {"_index": index_name, "_id": document["doc_id"], "_source": document}
+            for document in documents
+        )
+        # Refreshing while loading only slows the bulk requests down; the default is restored afterwards.
+        client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1"}})
         try:
-            if max_docs and num_processed_successfully >= max_docs:
-                logger.info(f"Reached max_docs limit of {max_docs}. Stopping indexing.")
-                # Decrement num_read_attempts as this doc was fetched but not processed.
-                num_read_attempts -=1 
-                break
-            
-            # Access fields from the Hugging Face dataset dictionary
-            doc_id = str(doc['_id'])
-            title = doc.get('title', '') 
-            text_content = doc.get('text', '')
+            bulk_stats = bulk_index_documents(
+                client,
+                actions,
+                chunk_size=chunk_size,
+                thread_count=thread_count,
+                max_retries=max_retries,
+                initial_backoff=initial_backoff,
+                on_indexed=on_indexed,
+            )
+        finally:
+            client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": None}})
+            client.indices.refresh(index=index_name)
+        stats.update(bulk_stats)
+    else:
+        start_time = time.perf_counter()
+        indexed_batch = []
+        for document in documents:
+            if index_document(client, index_name, document["doc_id"], document):
+                stats["indexed"] += 1
+                if on_indexed:
+                    indexed_batch.append(document)
+                    # Batched like the bulk chunks, so embeddings are encoded and cached results invalidated per chunk
+                    if len(indexed_batch) >= chunk_size:
+                        on_indexed(indexed_batch)
+                        indexed_batch = []
+            else:
+                stats["failed"] += 1
+
+            if stats["indexed"] > 0 and stats["indexed"] % 1000 == 0: 
+                logger.info(f"Successfully indexed {stats['indexed']} BeIR/scifact documents...")
+                logger.info(f"(Total documents iterated: {stats['read']}, Skipped due to errors: {stats['skipped']})")
+        if indexed_batch:
+            on_indexed(indexed_batch)
+        stats["elapsed"] = time.perf_counter() - start_time
+        stats["docs_per_sec"] = stats["indexed"] / stats["elapsed"] if stats["elapsed"] > 0 else 0.0
+
+    if incremental:
+        removed_ids = existing_hashes.keys() - seen_ids
+        if max_docs and removed_ids:
+            # Documents past the limit were never read, so they cannot be told apart from removed ones
+            logger.info(f"Not deleting {len(removed_ids)} unread documents because --max-docs limited the run.")
+        elif removed_ids:
+            deleted, errors = delete_documents(client, index_name, removed_ids, chunk_size=chunk_size)
+            stats["deleted"] = deleted
+            stats["failed"] += len(errors)
+            for error in errors[:1]:
+                logger.error(f"{len(errors)} documents could not be deleted. First error: {error}")
+            client.indices.refresh(index=index_name)
+        if local_embeddings:
+            from .semantic_search import semantic_engine
+
+            if removed_ids and not max_docs:
+                semantic_engine.delete_document_embeddings(removed_ids)
+            semantic_engine.compact_document_embeddings(
+                min_records=getattr(settings, 'SEMANTIC_DELTA_COMPACT_THRESHOLD', 1000)
+            )
+        logger.info(
+            f"Incremental indexing: {stats['added']} added, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['deleted']} deleted"
+        )
+    
+    logger.info(
+        f"Finished indexing. Indexed: {stats['indexed']}, Failed: {stats['failed']}, "
+        f"Skipped: {stats['skipped']}, Throughput: {stats['docs_per_sec']:.1f} docs/sec"
+    )
+    return stats
+
+def iter_all_documents(client, index_name, source_fields=None, page_size=500, keep_alive="2m", query=None):
+    """
+    Streams every document of an index through the scroll API, holding one page of `page_size` hits at a time.
+    Yields each hit's `_source` (restricted to `source_fields`) together with its `_id` under "id".
+    """
+    body = {"query": query or {"match_all": {}}}
+    if source_fields is not None:
+        body["_source"] = source_fields
+
+    # helpers.scan sorts by _doc and clears the scroll context when the generator is closed or exhausted.
+    for hit in helpers.scan(client, index=index_name, query=body, size=page_size, scroll=keep_alive):
+        yield {"id": hit["_id"], **hit.get("_source", {})}
+
+FUSION_METHODS = ('rrf', 'weighted')
+
+def search_options(params):
+    """
+    (query, use_semantic, fusion) of a search from request parameters, applying SEARCH_FUSION_DEFAULT.
+    Shared by the views and the warm-up, so warmed result cache entries match real requests.
+    """
+    query = params.get('query', '').strip()
+    use_semantic = params.get('semantic', 'false').lower() == 'true'
+    fusion = params.get('fusion') or getattr(settings, 'SEARCH_FUSION_DEFAULT', None)
+    if fusion not in FUSION_METHODS:
+        fusion = None
+    return query, use_semantic, fusion
 
-            if not title and not text_content:
-                logger.warning(f"Document {doc_id} has no title or text. Skipping.")
-                num_skipped_due_to_error +=1
-                continue
-
-            # Preprocess text for better indexing
-            title_processed = preprocessor.preprocess_for_indexing(title)
-            text_processed = preprocessor.preprocess_for_indexing(text_content)
-
-            document_data = {
-                "doc_id": doc_id,
-                "title": title,
-                "text": text_content,
-                "title_processed": title_processed,
-                "text_processed": text_processed,
+# Shared pool for running the lexical and vector retrievers of a fused search side by side
+_fusion_executor = None
+_fusion_executor_lock = threading.Lock()
+
+def _get_fusion_executor():
+    global _fusion_executor
+    if _fusion_executor is None:
+        with _fusion_executor_lock:
+            if _fusion_executor is None:
+                _fusion_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search-fusion")
+    return _fusion_executor
+
+def _ranking_pairs(response):
+    return [(hit["_id"], hit["_score"]) for hit in response["hits"]["hits"]]
+
+def _lexical_ranking_body(processed_query, depth):
+    """Search body for the traditional fuzzy multi_match query, without sources."""
+    return {
+        "query": {
+            "multi_match": {
+                "query": processed_query,
+                "fields": ["title_processed^2", "text_processed", "title^1.5", "text"],
+                "fuzziness": "AUTO"
             }
-            index_document(client, index_name, doc_id, document_data)
-            num_processed_successfully += 1
-            
-            if num_processed_successfully > 0 and num_processed_successfully % 1000 == 0: 
-                logger.info(f"Successfully indexed {num_processed_successfully} BeIR/scifact documents...")
-                logger.info(f"(Total documents iterated: {num_read_attempts}, Skipped due to errors: {num_skipped_due_to_error})")
-        
-        except Exception as ex: 
-            logger.error(f"Error processing document {num_read_attempts}: {ex}")
-            num_skipped_due_to_error += 1
+        },
+        "size": depth,
+        "_source": False
+    }
+
+def _knn_ranking_body(query_text, depth):
+    """Encodes the query and returns a native k-NN search body, or None if encoding failed."""
+    from .semantic_search import semantic_engine
+    from .ann_index import normalize_rows
+
+    query_vector = semantic_engine.encode_queries([query_text])
+    if query_vector is None:
+        return None
+    return {
+        "query": _knn_clause(normalize_rows(query_vector)[0], depth),
+        "size": depth,
+        "_source": False
+    }
+
+def _semantic_ranking(query_text, depth):
+    """(doc id, similarity) pairs from the local semantic engine; documents are indexed with their doc_id as _id."""
+    from .semantic_search import semantic_engine
+    return [(result['doc_id'], result['similarity']) for result in semantic_engine.semantic_search(query_text, top_k=depth)]
+
+def _lexical_ranking(client, index_name, processed_query, depth):
+    """Returns (doc id, BM25 score) pairs for the traditional fuzzy multi_match query, without sources."""
+    response = client.search(index=index_name, body=_lexical_ranking_body(processed_query, depth))
+    return _ranking_pairs(response)
+
+def _vector_ranking(client, index_name, query_text, depth):
+    """Returns (doc id, similarity) pairs from native k-NN or the local semantic engine."""
+    from .semantic_search import semantic_engine
+
+    if not semantic_engine.model:
+        return []
+
+    if knn_enabled():
+        search_body = _knn_ranking_body(query_text, depth)
+        if search_body is None:
+            return []
+        return _ranking_pairs(client.search(index=index_name, body=search_body))
+
+    return _semantic_ranking(query_text, depth)
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses ranked (doc id, score) lists by summing 1 / (k + rank) over the lists a document appears in."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def weighted_score_fusion(rankings, weights):
+    """Fuses ranked (doc id, score) lists by a weighted sum of min-max normalized scores."""
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
             continue
-    
-    logger.info(f"Finished indexing. Processed: {num_processed_successfully}, Skipped: {num_skipped_due_to_error}")
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        for doc_id, score in ranking:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
 
-def search_documents(client, index_name, query_text, size=10, use_semantic=False):
-    """Performs a search query against the OpenSearch index."""
-    from .text_preprocessing import preprocessor
+def _fusion_depth(size):
+    return max(size, getattr(settings, 'SEARCH_FUSION_DEPTH', 50))
+
+def _fuse_rankings(rankings, fusion, size):
+    if fusion == 'rrf':
+        fused = reciprocal_rank_fusion(rankings, k=getattr(settings, 'SEARCH_RRF_K', 60))
+    else:
+        weights = getattr(settings, 'SEARCH_FUSION_WEIGHTS', {'lexical': 0.5, 'vector': 0.5})
+        fused = weighted_score_fusion(rankings, [weights['lexical'], weights['vector']])
+    return fused[:size]
+
+def _mget_params():
+    if knn_enabled():
+        return {"_source_excludes": settings.OPENSEARCH_KNN_FIELD}
+    return {}
+
+def _fused_hits(response, fused):
+    hits = []
+    for doc, (_, score) in zip(response["docs"], fused):
+        if doc.get("found"):
+            hits.append({"id": doc["_id"], **doc["_source"], "score": score})
+    return hits
+
+def get_documents_by_ids(client, index_name, doc_ids):
+    """Fetches documents by _id in the given order, skipping missing ones."""
+    if not doc_ids:
+        return []
+    response = client.mget(index=index_name, body={"ids": list(doc_ids)}, params=_mget_params())
+    return [{"id": doc["_id"], **doc["_source"]} for doc in response["docs"] if doc.get("found")]
+
+async def async_get_documents_by_ids(client, index_name, doc_ids):
+    """Async version of get_documents_by_ids for an AsyncOpenSearch client."""
+    if not doc_ids:
+        return []
+    response = await client.mget(index=index_name, body={"ids": list(doc_ids)}, params=_mget_params())
+    return [{"id": doc["_id"], **doc["_source"]} for doc in response["docs"] if doc.get("found")]
+
+def _fused_search(client, index_name, query_text, processed_query, size, fusion):
+    """Runs the lexical and vector retrievers in parallel, fuses their scores and fetches the top `size` sources."""
+    depth = _fusion_depth(size)
+    executor = _get_fusion_executor()
+    lexical_future = executor.submit(_lexical_ranking, client, index_name, processed_query, depth)
+    vector_future = executor.submit(_vector_ranking, client, index_name, query_text, depth)
+    fused = _fuse_rankings([lexical_future.result(), vector_future.result()], fusion, size)
+
+    if not fused:
+        return []
+
+    response = client.mget(index=index_name, body={"ids": [doc_id for doc_id, _ in fused]}, params=_mget_params())
+    return _fused_hits(response, fused)
+
+def _search_body(query_text, processed_query, size, use_semantic):
+    """
+    Builds the single-request search body of search_documents.
+    Semantic modes encode the query or run the local semantic search here, so this is the CPU-bound part of a search.
+    """
     from .semantic_search import semantic_engine
+    from .ann_index import normalize_rows
     
-    # Preprocess query
-    processed_query = preprocessor.preprocess_query(query_text)
-    
-    if use_semantic and semantic_engine.model:
+    if use_semantic and semantic_engine.model and knn_enabled():
+        # Hybrid search in a single request: BM25 and native k-NN clauses scored together by OpenSearch
+        query_vector = semantic_engine.encode_queries([query_text])
+        if query_vector is not None:
+            search_body = {
+                "query": {
+                    "bool": {
+                        "should": [
+                            {
+                                "multi_match": {
+                                    "query": processed_query,
+                                    "fields": ["title_processed^2", "text_processed", "title^1.5", "text"]
+                                }
+                            },
+                            _knn_clause(normalize_rows(query_vector)[0], size)
+                        ]
+                    }
+                },
+                "size": size
+            }
+        else:
+            search_body = {
+                "query": {
+                    "multi_match": {
+                        "query": processed_query,
+                        "fields": ["title_processed^2", "text_processed", "title^1.5", "text"]
+                    }
+                },
+                "size": size
+            }
+    elif use_semantic and semantic_engine.model:
         # Combine traditional and semantic search
         semantic_results = semantic_engine.semantic_search(query_text, top_k=size)
         
@@ -209,14 +812,185 @@ def search_documents(client, index_name, query_text, size=10, use_semantic=False
             "size": size
         }
     
+    if knn_enabled():
+        # Embeddings are only needed for scoring, never in the results
+        search_body["_source"] = {"excludes": [settings.OPENSEARCH_KNN_FIELD]}
+    
+    return search_body
+
+def _parse_hits(response):
+    return [{"id": hit["_id"], **hit["_source"]} for hit in response["hits"]["hits"]]
+
+def _cached_search(client, index_name, cache_key):
+    """Returns the cached hits for cache_key, or None on a miss or if the documents could not be fetched."""
+    start = time.perf_counter()
+    entry = cache.get(cache_key)
+    if entry is None:
+        result_cache_stats.record_miss()
+        return None
     try:
-        response = client.search(index=index_name, body=search_body)
-        hits = [{"id": hit["_id"], **hit["_source"]} for hit in response["hits"]["hits"]]
+        documents = get_documents_by_ids(client, index_name, [doc_id for doc_id, _ in entry['results']])
+    except Exception as e:
+        logger.warning(f"Could not fetch cached search results, searching again: {e}")
+        return None
+    result_cache_stats.record_hit(entry, (time.perf_counter() - start) * 1000)
+    return hits_from_entry(entry, documents)
+
+def _search_cache_key(processed_query, query_text, size, use_semantic, fusion):
+    if not result_cache_enabled():
+        return None
+    return result_cache_key(get_index_generation(), processed_query, query_text, size, use_semantic, fusion, knn_enabled())
+
+def _store_search(cache_key, hits, start):
+    if cache_key:
+        entry = cache_entry(hits, (time.perf_counter() - start) * 1000)
+        cache.set(cache_key, entry, timeout=getattr(settings, 'SEARCH_RESULT_CACHE_TIMEOUT', 600))
+
+def search_documents(client, index_name, query_text, size=10, use_semantic=False, fusion=None):
+    """
+    Performs a search query against the OpenSearch index.
+    With `use_semantic`, `fusion` ('rrf' or 'weighted') fuses lexical and vector rankings by score;
+    otherwise semantic hits are only used to boost the lexical query.
+    Result ids are cached per index generation, so a repeated query only fetches its documents.
+    """
+    from .text_preprocessing import preprocessor
+    
+    # Preprocess query
+    processed_query = preprocessor.preprocess_query(query_text, method=settings.TEXT_PREPROCESSING_METHOD)
+    if not (use_semantic and fusion in FUSION_METHODS):
+        fusion = None
+    
+    cache_key = _search_cache_key(processed_query, query_text, size, use_semantic, fusion)
+    if cache_key:
+        hits = _cached_search(client, index_name, cache_key)
+        if hits is not None:
+            return hits
+    start = time.perf_counter()
+    
+    if fusion:
+        try:
+            hits = _fused_search(client, index_name, query_text, processed_query, size, fusion)
+        except exceptions.NotFoundError:
+            logger.warning(f"Index '{index_name}' not found during search.")
+            return []
+        except Exception as e:
+            logger.error(f"Error during fused search: {e}")
+            return []
+        _store_search(cache_key, hits, start)
         return hits
+    
+    search_body = _search_body(query_text, processed_query, size, use_semantic)
+    
+    try:
+        response = client.search(index=index_name, body=search_body)
+        hits = _parse_hits(response)
     except exceptions.NotFoundError:
         logger.warning(f"Index '{index_name}' not found during search.")
         return []
     except Exception as e:
         logger.error(f"Error during search: {e}")
         return []
+    _store_search(cache_key, hits, start)
+    return hits
 
+async def _async_vector_ranking(client, index_name, query_text, depth):
+    """Async counterpart of _vector_ranking; query encoding runs on the bounded CPU executor."""
+    from .semantic_search import semantic_engine
+
+    if not semantic_engine.model:
+        return []
+
+    if knn_enabled():
+        search_body = await run_cpu_bound(_knn_ranking_body, query_text, depth)
+        if search_body is None:
+            return []
+        return _ranking_pairs(await client.search(index=index_name, body=search_body))
+
+    return await run_cpu_bound(_semantic_ranking, query_text, depth)
+
+async def _async_fused_search(client, index_name, query_text, processed_query, size, fusion):
+    """Async counterpart of _fused_search; both retrievers are awaited concurrently."""
+    depth = _fusion_depth(size)
+    lexical_response, vector_ranking = await asyncio.gather(
+        client.search(index=index_name, body=_lexical_ranking_body(processed_query, depth)),
+        _async_vector_ranking(client, index_name, query_text, depth),
+    )
+    fused = _fuse_rankings([_ranking_pairs(lexical_response), vector_ranking], fusion, size)
+
+    if not fused:
+        return []
+
+    response = await client.mget(index=index_name, body={"ids": [doc_id for doc_id, _ in fused]}, params=_mget_params())
+    return _fused_hits(response, fused)
+
+async def _async_cached_search(client, index_name, cache_key):
+    """Async counterpart of _cached_search."""
+    start = time.perf_counter()
+    entry = await cache.aget(cache_key)
+    if entry is None:
+        result_cache_stats.record_miss()
+        return None
+    doc_ids = [doc_id for doc_id, _ in entry['results']]
+    try:
+        documents = []
+        if doc_ids:
+            response = await client.mget(index=index_name, body={"ids": doc_ids}, params=_mget_params())
+            documents = [{"id": doc["_id"], **doc["_source"]} for doc in response["docs"] if doc.get("found")]
+    except Exception as e:
+        logger.warning(f"Could not fetch cached search results, searching again: {e}")
+        return None
+    result_cache_stats.record_hit(entry, (time.perf_counter() - start) * 1000)
+    return hits_from_entry(entry, documents)
+
+async def async_search_documents(client, index_name, query_text, size=10, use_semantic=False, fusion=None):
+    """
+    Async version of search_documents for an AsyncOpenSearch client, returning the same hits.
+    Preprocessing and query encoding run on the bounded CPU executor so they never block the event loop.
+    """
+    from .text_preprocessing import preprocessor
+    
+    processed_query = await run_cpu_bound(
+        preprocessor.preprocess_query, query_text, method=settings.TEXT_PREPROCESSING_METHOD
+    )
+    if not (use_semantic and fusion in FUSION_METHODS):
+        fusion = None
+    
+    cache_key = None
+    if result_cache_enabled():
+        cache_generation = await cache.aget(INDEX_GENERATION_KEY)
+        if cache_generation is None:
+            generation = await run_cpu_bound(get_index_generation)
+        else:
+            generation = get_index_generation(cache_generation)
+        cache_key = result_cache_key(generation, processed_query, query_text, size, use_semantic, fusion, knn_enabled())
+        hits = await _async_cached_search(client, index_name, cache_key)
+        if hits is not None:
+            return hits
+    start = time.perf_counter()
+    
+    if fusion:
+        try:
+            hits = await _async_fused_search(client, index_name, query_text, processed_query, size, fusion)
+        except exceptions.NotFoundError:
+            logger.warning(f"Index '{index_name}' not found during search.")
+            return []
+        except Exception as e:
+            logger.error(f"Error during fused search: {e}")
+            return []
+    else:
+        search_body = await run_cpu_bound(_search_body, query_text, processed_query, size, use_semantic)
+        
+        try:
+            response = await client.search(index=index_name, body=search_body)
+            hits = _parse_hits(response)
+        except exceptions.NotFoundError:
+            logger.warning(f"Index '{index_name}' not found during search.")
+            return []
+        except Exception as e:
+            logger.error(f"Error during search: {e}")
+            return []
+    
+    if cache_key:
+        entry = cache_entry(hits, (time.perf_counter() - start) * 1000)
+        await cache.aset(cache_key, entry, timeout=getattr(settings, 'SEARCH_RESULT_CACHE_TIMEOUT', 600))
+    return hits
@@ -1,14 +1,18 @@
 import os
 import pickle
+import hashlib
 from collections import Counter
 try:
     from symspellpy import SymSpell, Verbosity
 except ImportError:
     SymSpell = None
     Verbosity = None
-import textdistance
 from django.conf import settings
-from .opensearch_utils import get_opensearch_client
+from django.core.cache import cache
+from .cache_utils import LRUCache
+from .lazy import LazySingleton
+from .opensearch_utils import get_opensearch_client, iter_all_documents
+from .term_index import FuzzyIndex, InfixIndex, PrefixIndex
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,6 +25,11 @@ class QueryCorrector:
         self.dictionary_path = os.path.join(settings.BASE_DIR, 'data', 'frequency_dictionary_en_82_765.txt')
         self.custom_dict_path = os.path.join(settings.BASE_DIR, 'data', 'custom_terms.pkl')
         self.term_frequencies = {}
+        self.dictionary_version = ''
+        self.correction_cache = LRUCache(getattr(settings, 'CORRECTION_CACHE_SIZE', 2048))
+        self.prefix_index = PrefixIndex({})
+        self.infix_index = InfixIndex({})
+        self.fuzzy_index = FuzzyIndex({})
         self.load_dictionaries()
     
     def load_dictionaries(self):
@@ -45,11 +54,9 @@ class QueryCorrector:
         if os.path.exists(self.custom_dict_path):
             try:
                 with open(self.custom_dict_path, 'rb') as f:
-                    self.term_frequencies = pickle.load(f)
+                    term_frequencies = pickle.load(f)
                     
-                if self.sym_spell:
-                    for term, frequency in self.term_frequencies.items():
-                        self.sym_spell.create_dictionary_entry(term, frequency)
+                self._set_term_frequencies(term_frequencies)
                 
                 logger.info(f"Loaded {len(self.term_frequencies)} custom terms from cache")
                 return
@@ -64,20 +71,18 @@ class QueryCorrector:
             from .text_preprocessing import preprocessor
             client = get_opensearch_client()
             
-            # Search for all documents
-            search_body = {
-                "query": {"match_all": {}},
-                "size": 1000,
-                "_source": ["title", "text"]
-            }
-            
-            response = client.search(index=settings.OPENSEARCH_INDEX_NAME, body=search_body)
+            # Stream all documents so the whole corpus is never held in memory
+            documents = iter_all_documents(
+                client,
+                settings.OPENSEARCH_INDEX_NAME,
+                source_fields=["title", "text"],
+            )
             
             term_frequencies = Counter()
             
-            for hit in response["hits"]["hits"]:
-                title = hit["_source"].get("title", "")
-                text = hit["_source"].get("text", "")
+            for document in documents:
+                title = document.get("title", "")
+                text = document.get("text", "")
                 
                 # Process title and text
                 for content in [title, text]:
@@ -92,17 +97,15 @@ class QueryCorrector:
                         
                         term_frequencies.update(clean_words)
             
-            self.term_frequencies = {
+            term_frequencies = {
                 term: freq for term, freq in term_frequencies.items()
                 if freq >= 2 and len(term) > 2 and term.isalpha()
             }
             
             with open(self.custom_dict_path, 'wb') as f:
-                pickle.dump(self.term_frequencies, f)
+                pickle.dump(term_frequencies, f)
             
-            if self.sym_spell:
-                for term, frequency in self.term_frequencies.items():
-                    self.sym_spell.create_dictionary_entry(term, frequency)
+            self._set_term_frequencies(term_frequencies)
             
             logger.info(f"Built custom dictionary with {len(self.term_frequencies)} terms")
             
@@ -120,16 +123,57 @@ class QueryCorrector:
             "covid": 100, "coronavirus": 100, "pandemic": 100, "disease": 100
         }
         
-        self.term_frequencies = fallback_terms
+        self._set_term_frequencies(fallback_terms)
+        
+        logger.info("Created fallback dictionary with basic scientific terms")
+    
+    def _set_term_frequencies(self, term_frequencies):
+        """Install a custom term dictionary and build the lookup structures over it"""
+        self.term_frequencies = term_frequencies
         
         if self.sym_spell:
-            for term, frequency in fallback_terms.items():
+            for term, frequency in term_frequencies.items():
                 self.sym_spell.create_dictionary_entry(term, frequency)
         
-        logger.info("Created fallback dictionary with basic scientific terms")
+        self.prefix_index = PrefixIndex(term_frequencies)
+        self.infix_index = InfixIndex(term_frequencies)
+        self.fuzzy_index = FuzzyIndex(term_frequencies)
+        
+        # Cached corrections are keyed by this version, so a rebuilt dictionary never serves stale results
+        self.dictionary_version = self._compute_dictionary_version(term_frequencies)
+        self.correction_cache.clear()
+    
+    def _compute_dictionary_version(self, term_frequencies):
+        """Fingerprint of the dictionaries loaded into the corrector, identical across processes"""
+        digest = hashlib.md5()
+        if os.path.exists(self.dictionary_path):
+            stat = os.stat(self.dictionary_path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        for term, frequency in sorted(term_frequencies.items()):
+            digest.update(f"{term}:{frequency}\n".encode())
+        return digest.hexdigest()[:16]
     
     def suggest_corrections(self, query, max_suggestions=3):
-        """Get spelling correction suggestions for query"""
+        """Get spelling correction suggestions for query, cached in-process and in the Django cache"""
+        # Casing and spacing carry into the suggestions, so only surrounding whitespace is normalised
+        query = query.strip()
+        key = f"{self.dictionary_version}:{max_suggestions}:{query}"
+        
+        suggestions = self.correction_cache.get(key)
+        if suggestions is not None:
+            return list(suggestions)
+        
+        shared_key = f"corrections:{hashlib.md5(key.encode()).hexdigest()}"
+        suggestions = cache.get(shared_key)
+        if suggestions is None:
+            suggestions = self._compute_corrections(query, max_suggestions)
+            cache.set(shared_key, suggestions, timeout=getattr(settings, 'CORRECTION_CACHE_TIMEOUT', 3600))
+        
+        self.correction_cache.set(key, tuple(suggestions))
+        return list(suggestions)
+    
+    def _compute_corrections(self, query, max_suggestions):
+        """Run SymSpell and the fuzzy fallback for a query"""
         suggestions = []
         
         # Don't suggest corrections for very short queries
@@ -187,22 +231,11 @@ class QueryCorrector:
                 if len(query_word) < 3:
                     continue
                 
-                # Find similar terms
-                similar_terms = []
-                for term in self.term_frequencies.keys():
-                    if len(term) < 3:
-                        continue
-                    
-                    # Calculate similarity
-                    similarity = textdistance.jaro_winkler(query_word, term)
-                    if 0.7 <= similarity < 1.0:
-                        similar_terms.append((term, similarity, self.term_frequencies[term]))
-                
-                # Sort by similarity and frequency
-                similar_terms.sort(key=lambda x: (x[1], x[2]), reverse=True)
+                # Find the most similar terms, sorted by similarity and frequency
+                similar_terms = self.fuzzy_index.lookup(query_word, max_results=2, min_similarity=0.7)
                 
                 # Create corrected query
-                for term, similarity, freq in similar_terms[:2]:  # Top 2 for each word
+                for term, similarity, freq in similar_terms:  # Top 2 for each word
                     corrected_query = query.replace(query_word, term)
                     if corrected_query not in suggestions:
                         suggestions.append(corrected_query)
@@ -215,32 +248,21 @@ class QueryCorrector:
     
     def get_query_suggestions(self, partial_query, max_suggestions=5):
         """Get auto-completion suggestions for partial query"""
-        suggestions = set()
-        
         if len(partial_query) < 2:
             return []
         
         partial_lower = partial_query.lower()
         
-        # Use custom terms for suggestions
-        if self.term_frequencies:
-            for term, freq in self.term_frequencies.items():
-                if term.lower().startswith(partial_lower) and len(term) > len(partial_query):
-                    suggestions.add(term)
-                
-                elif partial_lower in term.lower() and len(term) > len(partial_query):
-                    suggestions.add(term)
+        # Prefix matches first, sorted by length and then frequency
+        suggestions_list = self.prefix_index.lookup(partial_lower, max_suggestions)
         
-        # Sort by length and frequency, prioritizing exact prefix matches
-        suggestions_list = list(suggestions)
-        suggestions_list.sort(key=lambda x: (
-            not x.lower().startswith(partial_lower),  # Prefix matches first
-            len(x),
-            -self.term_frequencies.get(x, 0)  # Higher frequency first
-        ))
+        # Then terms containing the partial query elsewhere, in the same order
+        if len(suggestions_list) < max_suggestions:
+            suggestions_list.extend(self.infix_index.lookup(partial_lower, max_suggestions - len(suggestions_list)))
         
         logger.info(f"Generated {len(suggestions_list)} suggestions for '{partial_query}': {suggestions_list[:3]}")
         return suggestions_list[:max_suggestions]
 
 # Global corrector instance
-query_corrector = QueryCorrector()
+# Built on first use, since loading the dictionaries may query the whole index
+query_corrector = LazySingleton(QueryCorrector)
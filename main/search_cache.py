@@ -0,0 +1,157 @@
+import fcntl
+import hashlib
+import os
+import threading
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_GENERATION_KEY = "search_index_generation"
+
+# (identity, generation) of the generation file as last read by this process
+_file_generation = (None, 0)
+
+def _generation_file_path():
+    return os.path.join(settings.BASE_DIR, 'data', 'index_generation')
+
+def _read_file_generation():
+    """
+    Generation counter kept in a file under data/, which every process on the host sees even when
+    the Django cache is per process. Costs a stat per call, the file is only read after it was replaced.
+    """
+    global _file_generation
+    path = _generation_file_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached_identity, generation = _file_generation
+    if identity != cached_identity:
+        try:
+            with open(path) as f:
+                generation = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return generation
+        _file_generation = (identity, generation)
+    return generation
+
+def _bump_file_generation():
+    path = _generation_file_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(path) as f:
+                    generation = int(f.read().strip() or 0) + 1
+            except (FileNotFoundError, ValueError):
+                generation = 1
+            # Replaced rather than rewritten, so readers see a new inode and never a half-written number
+            with open(f"{path}.tmp", 'w') as f:
+                f.write(str(generation))
+            os.replace(f"{path}.tmp", path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return generation
+
+def _cache_generation():
+    generation = cache.get(INDEX_GENERATION_KEY)
+    if generation is None:
+        cache.add(INDEX_GENERATION_KEY, 0, timeout=None)
+        generation = cache.get(INDEX_GENERATION_KEY, 0)
+    return generation
+
+def get_index_generation(cache_generation=None):
+    """
+    Current generation of the search index; cached results of older generations are never read.
+    It combines the generation file, shared by the processes of one host, with a counter in the Django
+    cache, shared by every host when the cache is Redis. `cache_generation` is the counter if the caller
+    already read it, e.g. with cache.aget.
+    """
+    if cache_generation is None:
+        cache_generation = _cache_generation()
+    return f"{_read_file_generation()}.{cache_generation}"
+
+def bump_index_generation():
+    """Invalidates every cached search result, e.g. after re-indexing documents or rebuilding embeddings."""
+    try:
+        cache_generation = cache.incr(INDEX_GENERATION_KEY)
+    except ValueError:
+        cache.add(INDEX_GENERATION_KEY, 0, timeout=None)
+        cache_generation = cache.incr(INDEX_GENERATION_KEY)
+    generation = f"{_bump_file_generation()}.{cache_generation}"
+    logger.info(f"Search index generation is now {generation}")
+    return generation
+
+def result_cache_enabled():
+    return getattr(settings, 'SEARCH_RESULT_CACHE_ENABLED', True)
+
+def result_cache_key(generation, processed_query, query_text, size, use_semantic, fusion, knn):
+    """
+    Key of a cached search. Lexical search only sees the processed query, semantic modes also
+    embed the raw query text, so its normalized form is part of their key.
+    """
+    if use_semantic:
+        mode = f"semantic:{fusion or 'boost'}:{'knn' if knn else 'local'}"
+        query_part = f"{processed_query}\n{' '.join(query_text.lower().split())}"
+    else:
+        mode = "traditional"
+        query_part = processed_query
+    digest = hashlib.md5(f"{mode}:{size}:{query_part}".encode()).hexdigest()
+    return f"search_results:{generation}:{digest}"
+
+def cache_entry(hits, elapsed_ms):
+    """Cached form of a result list: doc ids with their fused score, if any, and the time the search took."""
+    return {
+        'results': [(hit['id'], hit.get('score')) for hit in hits],
+        'elapsed_ms': elapsed_ms,
+    }
+
+def hits_from_entry(entry, documents):
+    """Rebuilds hits from a cache entry and the fetched documents, in cached order."""
+    documents_by_id = {document['id']: document for document in documents}
+    hits = []
+    for doc_id, score in entry['results']:
+        document = documents_by_id.get(doc_id)
+        if document is None:
+            continue
+        hits.append(document if score is None else {**document, 'score': score})
+    return hits
+
+class ResultCacheStats:
+    """Per-process hit/miss counters and the search time saved by hits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def record_hit(self, entry, elapsed_ms):
+        with self._lock:
+            self.hits += 1
+            self.saved_ms += max(entry['elapsed_ms'] - elapsed_ms, 0.0)
+            lookups = self.hits + self.misses
+            logger.info(
+                f"Search result cache hit in {elapsed_ms:.1f}ms instead of {entry['elapsed_ms']:.1f}ms "
+                f"(hit ratio {self.hits / lookups:.2f}, {self.saved_ms / 1000:.1f}s saved)"
+            )
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'saved_ms': self.saved_ms,
+            }
+
+result_cache_stats = ResultCacheStats()
@@ -1,28 +1,57 @@
 import numpy as np
-try:
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
-except ImportError:
-    SentenceTransformer = None
-    cosine_similarity = None
-import pickle
 import os
+import time
+import heapq
+import hashlib
+import threading
 from django.conf import settings
+from django.core.cache import cache
+from .ann_index import ANN_BACKENDS, ExactIndex, normalize_rows, resolve_backend
+from .embedding_store import EmbeddingDelta, EmbeddingDeltaLog, EmbeddingStore, EmbeddingStoreWriter
+from .cache_utils import LRUCache
+from .lazy import LazySingleton
 import logging
 
 logger = logging.getLogger(__name__)
 
+def embeddings_file_path():
+    """Path of the document embedding store, known without creating the engine and loading its model"""
+    return os.path.join(settings.BASE_DIR, 'data', 'document_embeddings.bin')
+
 class SemanticSearchEngine:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
+    def __init__(self, model_name='all-MiniLM-L6-v2', batch_size=256):
         self.model_name = model_name
+        self.batch_size = batch_size
         self.model = None
-        self.embeddings_cache = {}
-        self.embeddings_file = os.path.join(settings.BASE_DIR, 'data', 'document_embeddings.pkl')
+        self.store = None
+        self.ann_index = None
+        self.embeddings_file = embeddings_file_path()
+        self.legacy_embeddings_file = os.path.join(settings.BASE_DIR, 'data', 'document_embeddings.pkl')
+        self.ann_index_file = os.path.join(settings.BASE_DIR, 'data', 'document_embeddings.ann')
+        # Incremental updates made since the store was written, applied on top of it by every search
+        self.delta_log = EmbeddingDeltaLog(f"{self.embeddings_file}.delta")
+        self.delta = EmbeddingDelta()
+        # (doc ids hidden in the store, doc ids in the delta, their vectors), swapped as a whole for searches to read
+        self._delta_view = (frozenset(), [], None)
+        self._delta_offset = 0
+        self._delta_inode = None
+        self._files_identity = None
+        self._base_embedding_hashes = None
+        self._refresh_lock = threading.Lock()
+        self._next_refresh = 0.0
+        self.query_cache = LRUCache(getattr(settings, 'SEMANTIC_QUERY_CACHE_SIZE', 4096))
+        self.use_shared_query_cache = getattr(settings, 'SEMANTIC_QUERY_CACHE_SHARED', False)
+        self._stats_lock = threading.Lock()
+        self.shared_cache_hits = 0
+        self.query_encodes = 0
         self.load_model()
     
     def load_model(self):
         """Load sentence transformer model"""
-        if not SentenceTransformer:
+        # Imported here, since importing torch alone takes seconds
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
             logger.warning("SentenceTransformers not available")
             return
             
@@ -45,117 +74,487 @@ class SemanticSearchEngine:
             logger.error(f"Error encoding texts: {e}")
             return None
     
-    def build_document_embeddings(self):
-        """Build embeddings for all documents in the index"""
+    def _query_cache_key(self, query):
+        # The model is uncased, so lowercasing and collapsing whitespace does not change the embedding
+        normalized_query = ' '.join(query.lower().split())
+        return f"{self.model_name}:{normalized_query}"
+    
+    def encode_queries(self, queries):
+        """Encode queries to embeddings, reusing cached embeddings of previously seen queries"""
+        if not self.model:
+            return None
+        
+        keys = [self._query_cache_key(query) for query in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        
+        if self.use_shared_query_cache:
+            for i, key in enumerate(keys):
+                if embeddings[i] is None:
+                    cached = cache.get(self._shared_query_cache_key(key))
+                    if cached is not None:
+                        embeddings[i] = np.frombuffer(cached, dtype=np.float32)
+                        self.query_cache.set(key, embeddings[i])
+                        with self._stats_lock:
+                            self.shared_cache_hits += 1
+        
+        # Encode each distinct missing query once
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], i)
+        if missing:
+            encoded = self.encode_texts([queries[i] for i in missing.values()])
+            if encoded is None:
+                return None
+            encoded_by_key = dict(zip(missing, np.asarray(encoded, dtype=np.float32)))
+            with self._stats_lock:
+                self.query_encodes += len(encoded_by_key)
+            
+            for key, embedding in encoded_by_key.items():
+                self.query_cache.set(key, embedding)
+                if self.use_shared_query_cache:
+                    cache.set(
+                        self._shared_query_cache_key(key),
+                        embedding.tobytes(),
+                        timeout=getattr(settings, 'SEMANTIC_QUERY_CACHE_TIMEOUT', 86400),
+                    )
+            embeddings = [
+                embedding if embedding is not None else encoded_by_key[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
+        
+        return np.vstack(embeddings)
+    
+    def _shared_query_cache_key(self, key):
+        return f"semantic_query:{hashlib.md5(key.encode()).hexdigest()}"
+    
+    def query_cache_stats(self):
+        """Return hit/miss counters of the query embedding cache"""
+        stats = self.query_cache.stats()
+        with self._stats_lock:
+            stats['shared_hits'] = self.shared_cache_hits
+            stats['encodes'] = self.query_encodes
+        return stats
+    
+    def build_document_embeddings(self, ann_backend=None):
+        """Build embeddings for all documents in the index, plus the ANN index over them"""
         if not self.model:
             logger.warning("Semantic model not available for embedding generation")
             return False
         
         try:
-            from .opensearch_utils import get_opensearch_client
+            from .opensearch_utils import get_opensearch_client, iter_all_documents
             
             client = get_opensearch_client()
             
-            # Get all documents
-            search_body = {
-                "query": {"match_all": {}},
-                "size": 1000,
-                "_source": ["doc_id", "title", "text"]
-            }
+            # Stream all documents and encode them batch by batch, so only one batch is held in memory at a time
+            documents = iter_all_documents(
+                client,
+                settings.OPENSEARCH_INDEX_NAME,
+                source_fields=["doc_id", "title", "text"],
+            )
             
-            response = client.search(index=settings.OPENSEARCH_INDEX_NAME, body=search_body)
+            writer = EmbeddingStoreWriter(
+                self.embeddings_file,
+                self.model_name,
+                dtype=getattr(settings, 'SEMANTIC_EMBEDDING_DTYPE', 'float32'),
+                normalized=True,
+            )
+            batch_texts = []
+            batch_ids = []
+            batch_hashes = []
             
-            documents = []
-            doc_ids = []
-            
-            for hit in response["hits"]["hits"]:
-                doc_id = hit["_source"]["doc_id"]
-                title = hit["_source"].get("title", "")
-                text = hit["_source"].get("text", "")
+            try:
+                for document in documents:
+                    doc_id = document["doc_id"]
+                    title = document.get("title", "")
+                    text = document.get("text", "")
+                    
+                    # Combine title and text
+                    combined_text = f"{title} {text}".strip()
+                    
+                    if combined_text:
+                        batch_texts.append(combined_text)
+                        batch_ids.append(doc_id)
+                        batch_hashes.append(self.embedding_hash(title, text))
+                    
+                    if len(batch_texts) >= self.batch_size:
+                        if not self._encode_batch(batch_texts, batch_ids, batch_hashes, writer):
+                            writer.abort()
+                            return False
+                        batch_texts, batch_ids, batch_hashes = [], [], []
                 
-                # Combine title and text
-                combined_text = f"{title} {text}".strip()
+                if batch_texts and not self._encode_batch(batch_texts, batch_ids, batch_hashes, writer):
+                    writer.abort()
+                    return False
                 
-                if combined_text:
-                    documents.append(combined_text)
-                    doc_ids.append(doc_id)
-            
-            if documents:
-                logger.info(f"Generating embeddings for {len(documents)} documents...")
-                embeddings = self.encode_texts(documents)
+                if not writer.count:
+                    writer.abort()
+                    logger.warning("No documents found to embed")
+                    return False
                 
-                if embeddings is not None:
-                    # Save embeddings
-                    embedding_data = {
-                        'embeddings': embeddings,
-                        'doc_ids': doc_ids,
-                        'model_name': self.model_name
-                    }
-                    
-                    os.makedirs(os.path.dirname(self.embeddings_file), exist_ok=True)
-                    with open(self.embeddings_file, 'wb') as f:
-                        pickle.dump(embedding_data, f)
-                    
-                    logger.info(f"Saved embeddings for {len(documents)} documents")
-                    return True
+                with self.delta_log.locked():
+                    self._publish_store(writer, ann_backend)
+                    # The new store was read from the index, which already holds every change in the log
+                    self.delta_log.reset()
+            except Exception:
+                writer.abort()
+                raise
+            
+            logger.info(f"Saved embeddings for {writer.count} documents")
+            return True
             
         except Exception as e:
             logger.error(f"Error building document embeddings: {e}")
             return False
     
-    def load_document_embeddings(self):
-        """Load pre-computed document embeddings"""
-        if os.path.exists(self.embeddings_file):
+    def _encode_batch(self, texts, doc_ids, content_hashes, writer):
+        """Encode one batch of documents and append it L2-normalized to the embedding store"""
+        embeddings = self.encode_texts(texts)
+        if embeddings is None:
+            return False
+        
+        writer.add(normalize_rows(embeddings), doc_ids, content_hashes)
+        logger.info(f"Generated embeddings for {writer.count} documents...")
+        return True
+    
+    def embedding_hash(self, title, text):
+        """
+        Fingerprint of what a document's embedding depends on: the model and the title and text it encodes.
+        Stored with each vector, unlike the indexed document's content hash, which also covers settings
+        such as the preprocessing method that do not change the embedding.
+        """
+        content = f"{self.model_name}\0{title}\0{text}"
+        return hashlib.sha1(content.encode()).hexdigest()
+    
+    def _current_embedding_hash(self, doc_id):
+        """Embedding hash of a doc id's current embedding, if known"""
+        if doc_id in self.delta.entries:
+            return self.delta.entries[doc_id][0]
+        if doc_id in self.delta.deleted:
+            return None
+        if self._base_embedding_hashes is None or self._base_embedding_hashes[0] is not self.store:
+            self._base_embedding_hashes = (self.store, dict(zip(self.store.doc_ids, self.store.read_content_hashes())))
+        return self._base_embedding_hashes[1].get(doc_id)
+    
+    def update_document_embeddings(self, documents):
+        """
+        Encode new and changed documents and append their vectors to the delta log, from where searches in
+        every process pick them up within SEMANTIC_DELTA_REFRESH_INTERVAL seconds. Documents whose embedding
+        hash matches their current embedding are skipped.
+        Returns the number of documents encoded, or None if there is no model or embedding store to update.
+        """
+        if not self.model:
+            logger.warning("Semantic model not available for embedding updates")
+            return None
+        if self.store is None and not self.load_document_embeddings():
+            logger.warning("No document embeddings to update, run build_semantic_index first")
+            return None
+        self.refresh_document_embeddings(force=True)
+        
+        changed = []
+        for document in documents:
+            title, text = document.get('title', ''), document.get('text', '')
+            embedding_hash = self.embedding_hash(title, text)
+            if embedding_hash == self._current_embedding_hash(document["doc_id"]):
+                continue
+            combined_text = f"{title} {text}".strip()
+            if combined_text:
+                changed.append((document["doc_id"], embedding_hash, combined_text))
+        
+        for start in range(0, len(changed), self.batch_size):
+            batch = changed[start:start + self.batch_size]
+            embeddings = self.encode_texts([text for _, _, text in batch])
+            if embeddings is None:
+                logger.error(f"Failed to encode changed documents, {len(changed) - start} embeddings not updated")
+                return None
+            self.delta_log.append([
+                EmbeddingDeltaLog.put_record(doc_id, embedding_hash, embedding)
+                for (doc_id, embedding_hash, _), embedding in zip(batch, normalize_rows(embeddings))
+            ])
+        
+        self.refresh_document_embeddings(force=True)
+        return len(changed)
+    
+    def delete_document_embeddings(self, doc_ids):
+        """Tombstone the embeddings of removed documents in the delta log. Returns the number of tombstones written"""
+        if not os.path.exists(self.embeddings_file):
+            return 0
+        records = [EmbeddingDeltaLog.delete_record(doc_id) for doc_id in doc_ids]
+        self.delta_log.append(records)
+        if self.store is not None:
+            self.refresh_document_embeddings(force=True)
+        return len(records)
+    
+    def compact_document_embeddings(self, min_records=1, ann_backend=None, batch_size=65536):
+        """
+        Merge the delta log into a new store file and rebuild the ANN index over it, once the log holds
+        changes for at least `min_records` doc ids. Both are built while holding the delta log lock.
+        Returns True if a new store was written.
+        """
+        if not os.path.exists(self.embeddings_file):
+            return False
+        
+        with self.delta_log.locked():
+            records, _ = self.delta_log.read()
+            delta = EmbeddingDelta()
+            delta.apply(records)
+            if not len(delta) or len(delta) < min_records:
+                return False
+            
+            store = EmbeddingStore(self.embeddings_file)
+            hidden_ids = delta.hidden_ids()
+            content_hashes = store.read_content_hashes()
+            writer = EmbeddingStoreWriter(
+                self.embeddings_file, store.model_name, dtype=store.dtype.name, normalized=store.normalized
+            )
             try:
-                with open(self.embeddings_file, 'rb') as f:
-                    data = pickle.load(f)
-                
-                if data.get('model_name') == self.model_name:
-                    self.embeddings_cache = data
-                    logger.info(f"Loaded embeddings for {len(data['doc_ids'])} documents")
-                    return True
-                else:
-                    logger.warning("Embeddings model mismatch, need to rebuild")
+                for start in range(0, len(store), batch_size):
+                    stop = min(start + batch_size, len(store))
+                    keep = [i for i in range(start, stop) if store.doc_ids[i] not in hidden_ids]
+                    if keep:
+                        writer.add(
+                            store.embeddings[keep], [store.doc_ids[i] for i in keep], [content_hashes[i] for i in keep]
+                        )
+                doc_ids, delta_hashes, matrix = delta.arrays()
+                if doc_ids:
+                    writer.add(matrix, doc_ids, delta_hashes)
+                self._publish_store(writer, ann_backend)
+            except Exception:
+                writer.abort()
+                raise
+            self.delta_log.reset()
+        
+        logger.info(f"Compacted {len(delta)} embedding changes into a store of {writer.count} documents")
+        if self.store is not None:
+            self.load_document_embeddings()
+        return True
+    
+    def _publish_store(self, writer, ann_backend=None):
+        """
+        Finish a new store and build its ANN index before moving the store into place. Until then workers
+        keep the old store, and any of them that loads the new index with it falls back to exact search
+        since the fingerprints differ, so row ids of one store are never looked up in the other.
+        """
+        writer.finish()
+        self.build_ann_index(EmbeddingStore(writer.tmp_path), backend=ann_backend)
+        writer.publish()
+    
+    def _ann_params(self):
+        """ANN tuning parameters from settings"""
+        return {
+            'nlist': getattr(settings, 'SEMANTIC_IVF_NLIST', None),
+            'nprobe': getattr(settings, 'SEMANTIC_IVF_NPROBE', 16),
+            'm': getattr(settings, 'SEMANTIC_HNSW_M', 16),
+            'ef_construction': getattr(settings, 'SEMANTIC_HNSW_EF_CONSTRUCTION', 200),
+            'ef_search': getattr(settings, 'SEMANTIC_HNSW_EF_SEARCH', 64),
+            'max_top_k': getattr(settings, 'SEMANTIC_MAX_TOP_K', 100),
+        }
+    
+    def _resolve_ann_backend(self, num_vectors, backend=None):
+        return resolve_backend(
+            backend or getattr(settings, 'SEMANTIC_ANN_BACKEND', 'auto'),
+            num_vectors,
+            getattr(settings, 'SEMANTIC_ANN_MIN_DOCS', 20000),
+        )
+    
+    def _ann_index_path(self, backend):
+        return f"{self.ann_index_file}.{backend}"
+    
+    def build_ann_index(self, store, backend=None):
+        """Build and persist the ANN index for the embeddings of a store"""
+        backend = self._resolve_ann_backend(len(store), backend)
+        index = ANN_BACKENDS[backend](
+            store.embeddings, normalized=store.normalized, fingerprint=store.fingerprint, **self._ann_params()
+        )
+        
+        if backend != 'exact':
+            start_time = time.perf_counter()
+            index.build()
+            index.save(self._ann_index_path(backend))
+            logger.info(f"Built {backend} ANN index in {time.perf_counter() - start_time:.1f}s")
+        
+        return index
+    
+    def _load_ann_index(self, store):
+        """Load the persisted ANN index, falling back to exact search if it is missing or stale"""
+        backend = self._resolve_ann_backend(len(store))
+        index = ANN_BACKENDS[backend](
+            store.embeddings, normalized=store.normalized, fingerprint=store.fingerprint, **self._ann_params()
+        )
+        
+        if backend != 'exact':
+            path = self._ann_index_path(backend)
+            try:
+                if os.path.exists(path) and index.load(path):
+                    logger.info(f"Loaded {backend} ANN index")
+                    return index
+                logger.warning(f"No usable {backend} ANN index found, run build_semantic_index. Using exact search")
             except Exception as e:
-                logger.error(f"Error loading embeddings: {e}")
+                logger.error(f"Error loading {backend} ANN index: {e}. Using exact search")
+            index = ExactIndex(store.embeddings, normalized=store.normalized)
+        
+        return index
+    
+    def load_document_embeddings(self):
+        """Open the pre-computed document embedding store"""
+        if not os.path.exists(self.embeddings_file):
+            if os.path.exists(self.legacy_embeddings_file):
+                logger.warning("Found legacy pickled embeddings, which are no longer loaded. Rebuild with build_semantic_index")
+            return False
+        
+        try:
+            # Taken before opening, so a rebuild racing with this load is picked up by the next refresh
+            files_identity = self._embedding_files_identity()
+            store = EmbeddingStore(self.embeddings_file)
+            
+            if store.model_name == self.model_name:
+                ann_index = self._load_ann_index(store)
+                self.store = store
+                self.ann_index = ann_index
+                self._files_identity = files_identity
+                self._load_delta()
+                logger.info(f"Loaded embeddings for {len(store)} documents")
+                return True
+            else:
+                logger.warning("Embeddings model mismatch, need to rebuild")
+        except Exception as e:
+            logger.error(f"Error loading embeddings: {e}")
         
         return False
     
+    def _embedding_files_identity(self):
+        """Inode, mtime and size of the store and ANN index files, which change whenever either is rewritten"""
+        identity = []
+        hnsw_path = self._ann_index_path('hnsw')
+        for path in (self.embeddings_file, self._ann_index_path('ivf'), hnsw_path, f"{hnsw_path}.meta"):
+            try:
+                stat = os.stat(path)
+                identity.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                identity.append(None)
+        return tuple(identity)
+    
+    def _load_delta(self):
+        """Rebuild the delta overlay from the start of the log"""
+        self.delta = EmbeddingDelta()
+        self._delta_offset = 0
+        self._read_delta()
+        self._publish_delta()
+    
+    def _read_delta(self):
+        """Apply the records appended to the log since the last read; returns whether there were any"""
+        identity = self.delta_log.identity()
+        self._delta_inode = identity[0] if identity else None
+        records, self._delta_offset = self.delta_log.read(self._delta_offset)
+        self.delta.apply(records)
+        return bool(records)
+    
+    def _publish_delta(self):
+        doc_ids, _, matrix = self.delta.arrays()
+        self._delta_view = (self.delta.hidden_ids(), doc_ids, matrix)
+    
+    def refresh_document_embeddings(self, force=False):
+        """
+        Pick up changes made by other processes: reload the store after a rebuild or compaction, and apply
+        records appended to the delta log. Checks at most every SEMANTIC_DELTA_REFRESH_INTERVAL seconds unless forced.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return
+        # Searches do not wait for a refresh another thread is already running
+        if not self._refresh_lock.acquire(blocking=force):
+            return
+        try:
+            self._next_refresh = now + getattr(settings, 'SEMANTIC_DELTA_REFRESH_INTERVAL', 2)
+            if self._embedding_files_identity() != self._files_identity:
+                self.load_document_embeddings()
+                return
+            identity = self.delta_log.identity()
+            inode = identity[0] if identity else None
+            if inode != self._delta_inode or (identity and identity[1] < self._delta_offset):
+                # The log was reset by a compaction
+                self._load_delta()
+            elif identity and identity[1] > self._delta_offset and self._read_delta():
+                self._publish_delta()
+        finally:
+            self._refresh_lock.release()
+    
     def semantic_search(self, query, top_k=10):
         """Perform semantic search using embeddings"""
-        if not self.model or not cosine_similarity:
-            return []
+        return self.semantic_search_many([query], top_k=top_k)[0]
+    
+    def semantic_search_many(self, queries, top_k=10):
+        """Perform semantic search for a batch of queries, encoding and scoring them together"""
+        queries = list(queries)
+        no_results = [[] for _ in queries]
+        if not self.model or not queries:
+            return no_results
         
         # Load embeddings if not cached
-        if not self.embeddings_cache and not self.load_document_embeddings():
+        if self.store is None and not self.load_document_embeddings():
             logger.warning("No document embeddings available")
-            return []
+            return no_results
+        self.refresh_document_embeddings()
         
         try:
-            # Encode query
-            query_embedding = self.encode_texts([query])
-            if query_embedding is None:
-                return []
-            
-            # Calculate similarities
-            doc_embeddings = self.embeddings_cache['embeddings']
-            similarities = cosine_similarity(query_embedding, doc_embeddings)[0]
+            # Encode queries
+            query_embeddings = self.encode_queries(queries)
+            if query_embeddings is None:
+                return no_results
             
-            top_indices = np.argsort(similarities)[::-1][:top_k]
+            hidden_ids, delta_ids, delta_matrix = self._delta_view
+            store_candidates = self._store_candidates(np.asarray(query_embeddings), top_k, hidden_ids)
+            delta_similarities = normalize_rows(query_embeddings) @ delta_matrix.T if delta_ids else None
             
-            results = []
-            for idx in top_indices:
-                if similarities[idx] > 0.1:
-                    results.append({
-                        'doc_id': self.embeddings_cache['doc_ids'][idx],
-                        'similarity': float(similarities[idx])
-                    })
+            all_results = []
+            for i, candidates in enumerate(store_candidates):
+                if delta_similarities is not None:
+                    candidates.extend(zip(delta_ids, delta_similarities[i].tolist()))
+                results = []
+                for doc_id, similarity in heapq.nlargest(top_k, candidates, key=lambda candidate: candidate[1]):
+                    if similarity > 0.1:
+                        results.append({
+                            'doc_id': doc_id,
+                            'similarity': similarity
+                        })
+                all_results.append(results)
             
-            return results
+            return all_results
             
         except Exception as e:
             logger.error(f"Error in semantic search: {e}")
-            return []
+            return no_results
+    
+    def _store_candidates(self, query_embeddings, top_k, hidden_ids):
+        """
+        Nearest (doc id, similarity) pairs in the store for each query, leaving out rows the delta replaces or
+        removes. Most hidden rows are far from any given query, so the first search only fetches up to `top_k`
+        extra rows; queries left with fewer than `top_k` visible rows are searched again with twice the k,
+        up to `top_k` plus the number of hidden rows.
+        """
+        store, ann_index = self.store, self.ann_index
+        if not len(store):
+            return [[] for _ in query_embeddings]
+        
+        max_k = min(top_k + len(hidden_ids), len(store))
+        k = min(top_k + min(len(hidden_ids), top_k), max_k)
+        candidates = [None] * len(query_embeddings)
+        pending = list(range(len(query_embeddings)))
+        while pending:
+            retry = []
+            for i, (top_indices, similarities) in zip(pending, ann_index.search(query_embeddings[pending], k)):
+                candidates[i] = [
+                    (store.doc_ids[idx], float(similarity))
+                    for idx, similarity in zip(top_indices, similarities)
+                    if idx >= 0 and store.doc_ids[idx] not in hidden_ids
+                ]
+                # An index returning fewer than k rows, e.g. IVF after its probed lists, has nothing more to give
+                if len(candidates[i]) < top_k and len(top_indices) >= k and k < max_k:
+                    retry.append(i)
+            pending = retry
+            k = min(k * 2, max_k)
+        return candidates
     
     def expand_query(self, query, num_expansions=3):
         """Expand query with semantically similar terms"""
@@ -184,4 +583,5 @@ class SemanticSearchEngine:
         return expanded_queries[:num_expansions + 1]
 
 # Global semantic search engine
-semantic_engine = SemanticSearchEngine()
+# Built on first use, so importing views or running unrelated commands does not load the model
+semantic_engine = LazySingleton(SemanticSearchEngine)
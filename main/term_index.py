@@ -0,0 +1,158 @@
+import heapq
+import string
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+import numpy as np
+import textdistance
+
+# Sorts after every character, so prefix + _MAX_CHAR bounds all terms starting with prefix
+_MAX_CHAR = chr(0x10FFFF)
+
+class PrefixIndex:
+    """
+    Autocomplete index over a term -> frequency dictionary.
+    Terms are kept in a sorted array so the terms sharing a prefix form one contiguous range found by
+    binary search. Prefixes matching more than `scan_limit` terms get their best `top_k` completions
+    precomputed, so a lookup never ranks more than `scan_limit` terms.
+    Completions are ranked shortest first, then by descending frequency.
+    """
+
+    def __init__(self, term_frequencies, top_k=10, scan_limit=64):
+        self.top_k = top_k
+        self.scan_limit = scan_limit
+        self.frequencies = {term.lower(): freq for term, freq in term_frequencies.items()}
+        self.terms = sorted(self.frequencies)
+        self.top_completions = {}
+        self._precompute()
+
+    def rank_key(self, term):
+        return (len(term), -self.frequencies[term], term)
+
+    def _precompute(self):
+        length = 1
+        while True:
+            heavy_groups = 0
+            for prefix, group in groupby((term for term in self.terms if len(term) >= length),
+                                         key=lambda term: term[:length]):
+                group = list(group)
+                if len(group) > self.scan_limit:
+                    heavy_groups += 1
+                    # One extra completion, since the prefix itself may be a term and is never suggested
+                    self.top_completions[prefix] = heapq.nsmallest(self.top_k + 1, group, key=self.rank_key)
+            if not heavy_groups:
+                break
+            length += 1
+
+    def _range(self, prefix):
+        return bisect_left(self.terms, prefix), bisect_right(self.terms, prefix + _MAX_CHAR)
+
+    def lookup(self, prefix, limit=None):
+        """Return up to `limit` terms strictly longer than `prefix` that start with it, best first"""
+        prefix = prefix.lower()
+        limit = limit or self.top_k
+
+        precomputed = self.top_completions.get(prefix)
+        if precomputed is not None and limit <= self.top_k:
+            return [term for term in precomputed if term != prefix][:limit]
+
+        lo, hi = self._range(prefix)
+        candidates = (self.terms[i] for i in range(lo, hi) if self.terms[i] != prefix)
+        return heapq.nsmallest(limit, candidates, key=self.rank_key)
+
+class InfixIndex:
+    """
+    Character n-gram index for terms containing a partial query somewhere after their first character.
+    Term ids follow the autocomplete ranking (shortest first, then by descending frequency), so every posting
+    list is already in rank order: a lookup walks the rarest n-gram of the query and stops after `limit` hits.
+    """
+
+    def __init__(self, term_frequencies, gram_sizes=(2, 3)):
+        self.gram_sizes = gram_sizes
+        frequencies = {term.lower(): freq for term, freq in term_frequencies.items()}
+        self.terms = sorted(frequencies, key=lambda term: (len(term), -frequencies[term], term))
+        self.postings = {}
+        for term_id, term in enumerate(self.terms):
+            grams = {term[i:i + size] for size in gram_sizes for i in range(len(term) - size + 1)}
+            for gram in grams:
+                self.postings.setdefault(gram, array('I')).append(term_id)
+
+    def lookup(self, partial, limit=5):
+        """Return up to `limit` terms longer than `partial` that contain it but do not start with it, best first"""
+        partial = partial.lower()
+        usable_sizes = [size for size in self.gram_sizes if size <= len(partial)]
+        if not usable_sizes:
+            return []
+
+        # The longest n-grams have the shortest posting lists
+        size = max(usable_sizes)
+        grams = {partial[i:i + size] for i in range(len(partial) - size + 1)}
+        posting_lists = [self.postings.get(gram) for gram in grams]
+        if any(posting is None for posting in posting_lists):
+            return []
+
+        matches = []
+        for term_id in min(posting_lists, key=len):
+            term = self.terms[term_id]
+            if len(term) > len(partial) and partial in term and not term.startswith(partial):
+                matches.append(term)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+# Letter count columns for FuzzyIndex; every other character shares the last column
+_ALPHABET = {char: column for column, char in enumerate(string.ascii_lowercase)}
+_OTHER_COLUMN = len(_ALPHABET)
+
+def _letter_counts(word):
+    counts = np.zeros(_OTHER_COLUMN + 1, dtype=np.uint8)
+    for char in word:
+        column = _ALPHABET.get(char, _OTHER_COLUMN)
+        counts[column] = min(int(counts[column]) + 1, 255)
+    return counts
+
+class FuzzyIndex:
+    """
+    Indexed Jaro-Winkler lookup returning the same ranked candidates as scoring the whole vocabulary.
+    Two strings can only match on characters they share, so letter counts bound the Jaro score:
+    jaro <= (shared / len(a) + shared / len(b) + 1) / 3. Jaro-Winkler only boosts Jaro scores above 0.7,
+    by at most 0.4 * (1 - jaro). Terms are checked in order of that bound with the exact similarity,
+    and the lookup stops once the bound cannot beat the results already found.
+    """
+
+    def __init__(self, term_frequencies, min_length=3):
+        # Vocabulary order is kept as the final tie-breaker, like a stable sort over the dictionary
+        self.terms = [term for term in term_frequencies if len(term) >= min_length]
+        self.frequencies = [term_frequencies[term] for term in self.terms]
+        self.lengths = np.array([len(term) for term in self.terms], dtype=np.float64)
+        self.letter_counts = np.array(
+            [_letter_counts(term) for term in self.terms], dtype=np.uint8
+        ).reshape(len(self.terms), _OTHER_COLUMN + 1)
+
+    def lookup(self, word, max_results=2, min_similarity=0.7):
+        """
+        Return up to `max_results` (term, similarity, frequency) tuples with min_similarity <= similarity < 1,
+        sorted by similarity and then frequency. `min_similarity` must be at least 0.7.
+        """
+        if not self.terms or not word:
+            return []
+
+        shared = np.minimum(self.letter_counts, _letter_counts(word)).sum(axis=1)
+        jaro_bound = (shared / len(word) + shared / self.lengths + 1) / 3
+        # Small tolerance so float rounding never prunes a true match
+        similarity_bound = 0.6 * jaro_bound + 0.4 + 1e-9
+        candidates = np.nonzero((jaro_bound + 1e-9 >= 0.7) & (similarity_bound >= min_similarity))[0]
+        candidates = candidates[np.argsort(-similarity_bound[candidates], kind='stable')]
+
+        best = []
+        for term_id in candidates:
+            if len(best) >= max_results and similarity_bound[term_id] < -best[-1][0][0]:
+                break
+            term = self.terms[term_id]
+            similarity = textdistance.jaro_winkler(word, term)
+            if min_similarity <= similarity < 1.0:
+                best.append(((-similarity, -self.frequencies[term_id], term_id), term))
+                best.sort()
+                del best[max_results:]
+
+        return [(term, -key[0], -key[1]) for key, term in best]
@@ -1,3 +1,1285 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+import zlib
+import numpy as np
+import textdistance
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.template.loader import render_to_string
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.urls import include, path
+from unittest import mock
+from .llm_utils import _acquire_or_wait, _lock_key, _release_lock, get_cache_key, get_llm_summary, stream_llm_summary
+from .cache_backends import delete_if_equal
+from .ann_index import ExactIndex, HNSWIndex, IVFIndex, hnswlib
+from .embedding_store import HEADER_SIZE, EmbeddingStore, EmbeddingStoreError, EmbeddingStoreWriter
+from opensearchpy import OpenSearch
+from . import opensearch_utils
+from .opensearch_utils import (
+    _fused_hits, _has_local_embeddings, _iter_changed_documents, _iter_scifact_documents, bulk_index_documents,
+    document_content_hash, iter_all_documents, reciprocal_rank_fusion, search_options, weighted_score_fusion
+)
+from .lazy import LazySingleton, is_loaded, load
+from .query_correction import QueryCorrector
+from .term_index import FuzzyIndex, InfixIndex, PrefixIndex
+from .search_cache import bump_index_generation, get_index_generation
+from .semantic_search import SemanticSearchEngine
+from .text_preprocessing import TextPreprocessor, get_nlp
+from .urls import async_urlpatterns, sync_urlpatterns
+from .warmup import load_top_queries
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+DOCUMENTS = [
+    {'id': '1', 'doc_id': '1', 'title': 'Protein folding', 'text': 'Proteins fold into structures.'},
+    {'id': '2', 'doc_id': '2', 'title': 'Cell division', 'text': 'Cells divide by mitosis.'},
+]
+
+class StubInferenceHandler(BaseHTTPRequestHandler):
+    """Mimics the streaming text-generation API; the query in the prompt selects the behaviour"""
+    tokens = [' Proteins', ' fold', ' into', ' structures.']
+    requests_seen = 0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).requests_seen += 1
+
+        if 'rate limited' in payload['inputs']:
+            self.send_response(429)
+            self.end_headers()
+            self.wfile.write(b'Rate limit reached')
+            return
+
+        if not payload.get('stream'):
+            # Slow enough for concurrent callers to overlap
+            time.sleep(0.3)
+            content = json.dumps([{'generated_text': ''.join(self.tokens)}]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for text in self.tokens:
+            if 'slowly' in payload['inputs']:
+                time.sleep(0.15)
+            event = {'token': {'text': text, 'special': False}, 'generated_text': None}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        end = {'token': {'text': '</s>', 'special': True}, 'generated_text': ''.join(self.tokens)}
+        self.wfile.write(f"data: {json.dumps(end)}\n\n".encode())
+
+    def log_message(self, format, *args):
+        pass
+
+class StreamLLMSummaryTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubInferenceHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            LLM_API_URL=f"http://127.0.0.1:{cls.server.server_port}/generate",
+            HUGGINGFACE_API_KEY='test-key',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubInferenceHandler.requests_seen = 0
+
+    def test_streams_tokens_then_full_summary(self):
+        events = list(stream_llm_summary('protein folding', DOCUMENTS))
+
+        self.assertEqual([event['token'] for event in events[:-1]], ['Proteins', ' fold', ' into', ' structures.'])
+        self.assertEqual(events[-1], {'summary': 'Proteins fold into structures.', 'done': True})
+
+    def test_repeat_query_is_served_from_cache(self):
+        list(stream_llm_summary('protein folding', DOCUMENTS))
+        events = list(stream_llm_summary('protein folding', list(reversed(DOCUMENTS))))
+
+        self.assertEqual(events, [{'summary': 'Proteins fold into structures.', 'done': True, 'cached': True}])
+        self.assertEqual(StubInferenceHandler.requests_seen, 1)
+
+    def test_api_error_is_reported_as_single_event(self):
+        events = list(stream_llm_summary('rate limited', DOCUMENTS))
+
+        self.assertEqual(len(events), 1)
+        self.assertIn('rate limit', events[0]['error'])
+
+    def test_concurrent_callers_share_one_request(self):
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            summaries = list(executor.map(lambda _: get_llm_summary('protein folding', DOCUMENTS), range(5)))
+
+        self.assertEqual(summaries, ['Proteins fold into structures.'] * 5)
+        self.assertEqual(StubInferenceHandler.requests_seen, 1)
+
+    @override_settings(LLM_SUMMARY_WAIT_TIMEOUT=0.1, LLM_SUMMARY_POLL_INTERVAL=0.02)
+    def test_waiting_for_a_summary_is_bounded(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(get_llm_summary, 'protein folding', DOCUMENTS)
+            time.sleep(0.05)
+            follower = executor.submit(get_llm_summary, 'protein folding', DOCUMENTS)
+
+            self.assertIn('still being generated', follower.result())
+            self.assertEqual(leader.result(), 'Proteins fold into structures.')
+
+    def test_lock_taken_over_after_expiry_is_not_released_by_the_previous_holder(self):
+        cache_key = get_cache_key('protein folding', DOCUMENTS)
+        _, token = _acquire_or_wait(cache_key)
+        # The lock expired while the summary was still streaming and another request took it
+        cache.set(_lock_key(cache_key), 'token of another request')
+
+        _release_lock(cache_key, token)
+
+        self.assertEqual(cache.get(_lock_key(cache_key)), 'token of another request')
+
+class StubAsyncOpenSearch:
+    """
+    Stands in for AsyncOpenSearch, serving DOCUMENTS for mget. Each search returns the next list of
+    `results` (the last one repeating), or raises `error`.
+    """
+    def __init__(self, results=((),), available=True, error=None):
+        self.results = [list(hits) for hits in results]
+        self.available = available
+        self.error = error
+        self.searches = []
+
+    async def ping(self):
+        return self.available
+
+    async def search(self, index, body):
+        self.searches.append(body)
+        if self.error:
+            raise self.error
+        hits = self.results[min(len(self.searches), len(self.results)) - 1]
+        return {'hits': {'hits': [
+            {'_id': doc['id'], '_score': 1.0, '_source': {k: v for k, v in doc.items() if k != 'id'}}
+            for doc in hits
+        ]}}
+
+    async def mget(self, index, body, params=None):
+        by_id = {doc['id']: doc for doc in DOCUMENTS}
+        return {'docs': [
+            {'_id': doc_id, 'found': True, '_source': {k: v for k, v in by_id[doc_id].items() if k != 'id'}}
+            if doc_id in by_id else {'_id': doc_id, 'found': False}
+            for doc_id in body['ids']
+        ]}
+
+# The async views without reloading main.urls for ASYNC_VIEWS
+ASYNC_URLCONF = types.ModuleType('async_urlconf')
+ASYNC_URLCONF.urlpatterns = [path('', include((async_urlpatterns, 'main')))]
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncSummaryStreamTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubInferenceHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            LLM_API_URL=f"http://127.0.0.1:{cls.server.server_port}/generate",
+            HUGGINGFACE_API_KEY='test-key',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubInferenceHandler.requests_seen = 0
+        patcher = mock.patch('main.views.get_async_opensearch_client', return_value=StubAsyncOpenSearch())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_tokens_arrive_as_they_are_generated(self):
+        response = await AsyncClient().get('/api/summary/', {'query': 'protein folding slowly', 'ids': '1,2'})
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        arrivals = []
+        async for chunk in response.streaming_content:
+            arrivals.append((time.perf_counter(), chunk.decode()))
+
+        self.assertEqual([chunk for _, chunk in arrivals[:4]], [
+            f"data: {json.dumps({'token': token})}\n\n" for token in ['Proteins', ' fold', ' into', ' structures.']
+        ])
+        self.assertTrue(arrivals[-1][1].startswith('event: done\n'))
+        # The stub sleeps before each token, so a buffered response would deliver every chunk at once
+        self.assertGreater(arrivals[3][0] - arrivals[0][0], 0.3)
+
+    async def test_repeat_query_is_served_from_cache(self):
+        for _ in range(2):
+            response = await AsyncClient().get('/api/summary/', {'query': 'protein folding', 'ids': '1,2'})
+            chunks = [chunk.decode() async for chunk in response.streaming_content]
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIn('"cached": true', chunks[0])
+        self.assertEqual(StubInferenceHandler.requests_seen, 1)
+
+    async def test_missing_documents_are_an_error_event(self):
+        response = await AsyncClient().get('/api/summary/', {'query': 'protein folding'})
+        chunks = [chunk.decode() async for chunk in response.streaming_content]
+
+        self.assertEqual(len(chunks), 1)
+        self.assertTrue(chunks[0].startswith('event: error\n'))
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF, SEARCH_RESULT_CACHE_ENABLED=False, LLM_SUMMARY_DEFERRED=True)
+class AsyncSearchViewTests(SimpleTestCase):
+    def setUp(self):
+        self.corrector = types.SimpleNamespace(suggest_corrections=lambda query: [])
+        patcher = mock.patch('main.views.query_corrector', self.corrector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def search(self, client, params):
+        with mock.patch('main.views.get_async_opensearch_client', return_value=client):
+            return await AsyncClient().get('/', params)
+
+    async def test_results_are_rendered(self):
+        client = StubAsyncOpenSearch(results=[DOCUMENTS])
+
+        response = await self.search(client, {'query': 'protein folding'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.context['search_results']], ['1', '2'])
+        self.assertEqual(response.context['summary_ids'], '1,2')
+        self.assertEqual(response.context['error_message'], '')
+        self.assertIn('search;dur=', response['Server-Timing'])
+        self.assertEqual(len(client.searches), 1)
+
+    async def test_first_correction_is_searched_when_nothing_is_found(self):
+        self.corrector.suggest_corrections = lambda query: ['protein folding']
+        client = StubAsyncOpenSearch(results=[[], DOCUMENTS[:1]])
+
+        response = await self.search(client, {'query': 'protien foldng'})
+
+        self.assertEqual(response.context['query_suggestions'], ['protein folding'])
+        self.assertEqual([result['id'] for result in response.context['search_results']], ['1'])
+        self.assertEqual(len(client.searches), 2)
+        self.assertIn('corrected_search;dur=', response['Server-Timing'])
+
+    async def test_page_without_a_query_does_not_search(self):
+        client = StubAsyncOpenSearch()
+
+        response = await self.search(client, {})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['search_results'], [])
+        self.assertEqual(client.searches, [])
+        self.assertNotIn('Server-Timing', response)
+
+    async def test_unreachable_search_engine_is_reported(self):
+        response = await self.search(StubAsyncOpenSearch(available=False), {'query': 'protein folding'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Could not connect', response.context['error_message'])
+
+    async def test_search_error_shows_no_results(self):
+        client = StubAsyncOpenSearch(error=ConnectionError('connection refused'))
+
+        response = await self.search(client, {'query': 'protein folding'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['search_results'], [])
+        self.assertEqual(response.context['error_message'], "No results found for your query.")
+
+SYNC_URLCONF = types.ModuleType('sync_urlconf')
+SYNC_URLCONF.urlpatterns = [path('', include((sync_urlpatterns, 'main')))]
+
+def server_timing(response):
+    """Stage -> milliseconds from a Server-Timing header"""
+    stages = (entry.split(';dur=') for entry in response['Server-Timing'].split(', '))
+    return {stage: float(duration) for stage, duration in stages}
+
+def slow(result, seconds=0.2):
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return result
+    return call
+
+@override_settings(ROOT_URLCONF=SYNC_URLCONF, LLM_SUMMARY_DEFERRED=True)
+class SearchViewFanOutTests(SimpleTestCase):
+    def search(self, params, results, corrections=(), available=True):
+        """Renders show_main with ping, each search and corrections taking 0.2s, returning the given values"""
+        client = types.SimpleNamespace(ping=slow(available))
+        corrector = types.SimpleNamespace(suggest_corrections=slow(list(corrections)))
+        searches = iter(results)
+        with mock.patch('main.views.get_opensearch_client', return_value=client), \
+                mock.patch('main.views.query_corrector', corrector), \
+                mock.patch('main.views.search_documents', side_effect=lambda *args, **kwargs: slow(next(searches))()):
+            return self.client.get('/', params)
+
+    def test_ping_search_and_corrections_run_side_by_side(self):
+        response = self.search({'query': 'protien folding'}, [[], DOCUMENTS[:1]], corrections=['protein folding'])
+
+        timings = server_timing(response)
+        self.assertEqual(set(timings), {'ping', 'search', 'corrections', 'corrected_search', 'total'})
+        self.assertTrue(all(timings[stage] >= 200 for stage in ['ping', 'search', 'corrections', 'corrected_search']))
+        # Run one after another the four stages would take 800ms
+        self.assertLess(timings['total'], 700)
+        self.assertEqual([result['id'] for result in response.context['search_results']], ['1'])
+        self.assertEqual(response.context['query_suggestions'], ['protein folding'])
+
+    def test_corrections_are_not_waited_for_when_there_are_enough_results(self):
+        documents = DOCUMENTS + [{'id': '3', 'doc_id': '3', 'title': 'Gene mutation', 'text': 'Genes mutate.'}]
+        with mock.patch('main.views.query_corrector', types.SimpleNamespace(suggest_corrections=slow([], 2))):
+            client = types.SimpleNamespace(ping=lambda: True)
+            with mock.patch('main.views.get_opensearch_client', return_value=client), \
+                    mock.patch('main.views.search_documents', return_value=documents):
+                response = self.client.get('/', {'query': 'protein folding'})
+
+        timings = server_timing(response)
+        self.assertNotIn('corrections', timings)
+        self.assertLess(timings['total'], 1000)
+        self.assertEqual(response.context['query_suggestions'], [])
+
+    @override_settings(LLM_SUMMARY_DEFERRED=False)
+    def test_summary_is_a_stage_when_not_deferred(self):
+        with mock.patch('main.views.get_llm_summary', side_effect=slow('Proteins fold.')) as get_llm_summary:
+            response = self.search({'query': 'protein folding'}, [DOCUMENTS])
+
+        self.assertEqual(response.context['llm_summary'], 'Proteins fold.')
+        get_llm_summary.assert_called_once_with('protein folding', DOCUMENTS)
+        self.assertIn('summary', server_timing(response))
+
+    def test_unreachable_search_engine_is_reported_with_its_ping_time(self):
+        response = self.search({'query': 'protein folding'}, [DOCUMENTS], available=False)
+
+        self.assertIn('Could not connect', response.context['error_message'])
+        self.assertEqual(response.context['search_results'], [])
+        self.assertIn('ping', server_timing(response))
+
+    def test_page_without_a_query_has_no_timings(self):
+        response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+class WarmupTests(SimpleTestCase):
+    def test_top_queries_are_read_most_popular_first(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as f:
+            f.write(
+                "# query\tcount\n"
+                "protein folding\t12\n"
+                "\n"
+                "cell division\n"
+                "covid vaccine\t40\n"
+                "  gene mutation\t12  \n"
+                "query with\ttabs\n"
+                "protein folding\t99\n"
+                "virus\t3\n"
+            )
+        self.addCleanup(os.remove, f.name)
+
+        self.assertEqual(load_top_queries(f.name), [
+            'covid vaccine', 'protein folding', 'gene mutation', 'virus', 'cell division', 'query with\ttabs',
+        ])
+        self.assertEqual(load_top_queries(f.name, top_n=2), ['covid vaccine', 'protein folding'])
+
+    def test_ready_only_after_the_boot_warm_up(self):
+        with mock.patch('main.warmup._warmup_done', threading.Event()) as done, \
+                mock.patch('main.warmup._warmup_report', {}) as report:
+            with override_settings(WARMUP_ON_BOOT=True):
+                warming = self.client.get('/ready/')
+                done.set()
+                report['total'] = 1.5
+                ready = self.client.get('/ready/')
+            done.clear()
+            without_warmup = self.client.get('/ready/')
+
+        self.assertEqual((warming.status_code, warming.json()['ready']), (503, False))
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(ready.json(), {'ready': True, 'warmup': {'total': 1.5}})
+        self.assertEqual(without_warmup.status_code, 200)
+
+def two_tier_caches(local_timeout=5):
+    """CACHES setting for a TwoTierCache in front of an in-memory fakeredis server"""
+    return {
+        'default': {
+            'BACKEND': 'main.cache_backends.TwoTierCache',
+            'LOCATION': f'two-tier-test-{local_timeout}',
+            'OPTIONS': {'REMOTE': 'redis', 'LOCAL_MAX_ENTRIES': 16, 'LOCAL_TIMEOUT': local_timeout},
+        },
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://localhost:6379/15',
+            'OPTIONS': {
+                'PICKLE_VERSION': -1,
+                'COMPRESSOR': 'main.cache_backends.ThresholdZlibCompressor',
+                'COMPRESS_MIN_LENGTH': 1024,
+                'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection} if fakeredis else {},
+            },
+        },
+    }
+
+@unittest.skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(CACHES=two_tier_caches())
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_values_round_trip_through_both_tiers(self):
+        cache.set('summary', {'text': 'Proteins fold.'})
+        before = cache.stats()
+
+        self.assertEqual(cache.get('summary'), {'text': 'Proteins fold.'})
+        self.assertEqual(cache.stats()['local_hits'] - before['local_hits'], 1)
+        self.assertEqual(caches['redis'].get('summary'), {'text': 'Proteins fold.'})
+
+    def test_remote_values_fill_the_local_tier(self):
+        caches['redis'].set('shared', 'from another worker')
+        before = cache.stats()
+
+        self.assertEqual(cache.get('shared'), 'from another worker')
+        self.assertEqual(cache.get('shared'), 'from another worker')
+        after = cache.stats()
+        self.assertEqual(after['remote_hits'] - before['remote_hits'], 1)
+        self.assertEqual(after['local_hits'] - before['local_hits'], 1)
+
+    def test_only_large_values_are_compressed(self):
+        large = 'protein folding ' * 200
+        cache.set('large', large)
+        cache.set('small', 'short')
+        raw = caches['redis'].client.get_client()
+
+        stored = raw.get(caches['redis'].make_key('large'))
+        self.assertLess(len(stored), len(large))
+        self.assertTrue(zlib.decompress(stored))
+        self.assertEqual(cache.get('large'), large)
+        with self.assertRaises(zlib.error):
+            zlib.decompress(raw.get(caches['redis'].make_key('small')))
+
+    def test_counters_and_locks_use_the_remote_tier(self):
+        self.assertTrue(cache.add('generation', 0))
+        self.assertFalse(cache.add('generation', 0))
+        self.assertEqual(cache.incr('generation'), 1)
+        self.assertEqual(cache.get('generation'), 1)
+
+        cache.delete('generation')
+        self.assertIsNone(caches['redis'].get('generation'))
+        self.assertIsNone(cache.get('generation'))
+
+    def test_locks_are_only_released_by_their_holder(self):
+        cache_key = get_cache_key('protein folding', DOCUMENTS)
+        _, token = _acquire_or_wait(cache_key)
+        # Another worker took the lock over after it expired, while this one kept a local copy
+        caches['redis'].set(_lock_key(cache_key), 'token of another worker')
+
+        _release_lock(cache_key, token)
+        self.assertEqual(caches['redis'].get(_lock_key(cache_key)), 'token of another worker')
+
+        self.assertTrue(delete_if_equal(caches['default'], _lock_key(cache_key), 'token of another worker'))
+        self.assertIsNone(caches['redis'].get(_lock_key(cache_key)))
+        self.assertIsNone(cache.get(_lock_key(cache_key)))
+
+    @override_settings(CACHES=two_tier_caches(local_timeout=0.05))
+    def test_local_copies_expire(self):
+        cache.set('key', 'old')
+        caches['redis'].set('key', 'new')
+
+        self.assertEqual(cache.get('key'), 'old')
+        time.sleep(0.1)
+        self.assertEqual(cache.get('key'), 'new')
+
+PARITY_QUERIES = [
+    "Protein folding in human cells",
+    "COVID-19 vaccine efficacy against SARS-CoV-2 variants",
+    "mRNA expression levels were significantly increased in tumours",
+    "Does vitamin D supplementation reduce the risk of fractures?",
+    "Bacteria's resistance to antibiotics (e.g. penicillin) is rising",
+    "the study of running mice and their livers",
+    "  HIV  transmission rates   ",
+    "",
+]
+
+class QueryPreprocessingTests(SimpleTestCase):
+    def setUp(self):
+        self.preprocessor = TextPreprocessor()
+
+    @unittest.skipUnless(get_nlp(), "spaCy English model is not installed")
+    def test_query_pipeline_matches_indexing(self):
+        for query in PARITY_QUERIES:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.preprocessor.preprocess_query(query),
+                    self.preprocessor.preprocess_for_indexing(query),
+                )
+
+    @unittest.skipUnless(get_nlp(), "spaCy English model is not installed")
+    def test_batch_pipeline_matches_indexing(self):
+        texts = PARITY_QUERIES + [
+            "Alterations of the architecture of cerebral white matter in the developing human brain can affect "
+            "cortical development and result in functional disabilities. A line scan diffusion-weighted MRI "
+            "sequence with diffusion tensor analysis was applied to measure the apparent diffusion coefficient.",
+            "Mitochondrial DNA (mtDNA) copy number was 2.5-fold higher in patients; see www.example.org or mail a@b.org.",
+            None,
+            "?!... ,;: --",
+            "the and of to in it is was were",
+        ]
+
+        self.assertEqual(
+            list(self.preprocessor.preprocess_many(texts, batch_size=3)),
+            [self.preprocessor.preprocess_for_indexing(text) for text in texts],
+        )
+
+    def test_results_are_memoized_by_cleaned_query(self):
+        first = self.preprocessor.preprocess_query("Protein Folding", method='basic')
+        second = self.preprocessor.preprocess_query("  protein   folding ", method='basic')
+
+        self.assertEqual(first, self.preprocessor.preprocess_for_indexing("Protein Folding", method='basic'))
+        self.assertEqual(second, first)
+        self.assertEqual(self.preprocessor.query_cache.stats()['hits'], 1)
+
+class QueryCorrectionTests(SimpleTestCase):
+    def test_queries_differing_in_surrounding_whitespace_share_corrections(self):
+        cache.clear()
+        corrector = QueryCorrector()
+
+        padded = corrector.suggest_corrections('  protien foldng ')
+
+        self.assertTrue(padded)
+        self.assertTrue(all(suggestion == suggestion.strip() for suggestion in padded))
+        self.assertEqual(corrector.suggest_corrections('protien foldng'), padded)
+
+def jaro_winkler_scan(term_frequencies, word, max_results, min_similarity, min_length=3):
+    """Reference for FuzzyIndex.lookup: score the whole vocabulary, then a stable sort by similarity and frequency"""
+    matches = []
+    for term, frequency in term_frequencies.items():
+        if len(term) >= min_length:
+            similarity = textdistance.jaro_winkler(word, term)
+            if min_similarity <= similarity < 1.0:
+                matches.append((term, similarity, frequency))
+    return sorted(matches, key=lambda match: (-match[1], -match[2]))[:max_results]
+
+FUZZY_VOCABULARY = {
+    'abcdy': 4, 'abcdz': 4, 'abcdw': 9,  # Tied scores for 'abcdx', broken by frequency, then vocabulary order
+    'badcy': 6,  # Jaro-Winkler of exactly 0.7 for 'abcdx'
+    'abdcy': 2, 'bacdy': 2,
+    'abcdx': 1,  # An exact match is never suggested
+    'ab': 100,  # Shorter than min_length
+    'protein': 50, 'proteins': 30, 'protean': 30, 'protest': 5, 'folding': 20, 'fold': 20,
+}
+
+class FuzzyIndexTests(SimpleTestCase):
+    def assertMatchesScan(self, term_frequencies, words):
+        index = FuzzyIndex(term_frequencies)
+        for word in words:
+            scores = {textdistance.jaro_winkler(word, term) for term in term_frequencies}
+            thresholds = [0.7, 0.75, 0.9] + [score for score in scores if 0.7 <= score < 1.0]
+            for max_results in [1, 2, 5]:
+                for min_similarity in thresholds:
+                    with self.subTest(word=word, max_results=max_results, min_similarity=min_similarity):
+                        self.assertEqual(
+                            index.lookup(word, max_results=max_results, min_similarity=min_similarity),
+                            jaro_winkler_scan(term_frequencies, word, max_results, min_similarity),
+                        )
+
+    def test_lookup_matches_scoring_the_whole_vocabulary(self):
+        self.assertMatchesScan(FUZZY_VOCABULARY, ['abcdx', 'protien', 'foldng', 'ab', 'zzz'])
+
+    def test_threshold_boundary_and_ties(self):
+        index = FuzzyIndex(FUZZY_VOCABULARY)
+
+        self.assertEqual([term for term, _, _ in index.lookup('abcdx', max_results=3)], ['abcdw', 'abcdy', 'abcdz'])
+        self.assertIn('badcy', [term for term, _, _ in index.lookup('abcdx', max_results=10, min_similarity=0.7)])
+
+    def test_lookup_matches_scan_over_random_vocabulary(self):
+        rng = np.random.default_rng(7)
+        words = {''.join(rng.choice(list('abcde'), size=rng.integers(3, 7))) for _ in range(200)}
+        # Few distinct frequencies, so many scores tie on frequency as well
+        term_frequencies = {word: int(rng.integers(1, 4)) for word in sorted(words)}
+
+        self.assertMatchesScan(term_frequencies, list(term_frequencies)[:10] + ['abcab', 'eeee', 'dcba'])
+
+def suggestion_rank(term_frequencies):
+    return lambda term: (len(term), -term_frequencies[term], term)
+
+def prefix_scan(term_frequencies, partial, limit):
+    """Reference for PrefixIndex.lookup: every longer term starting with `partial`, in autocomplete order"""
+    matches = [term for term in term_frequencies if term.startswith(partial) and term != partial]
+    return sorted(matches, key=suggestion_rank(term_frequencies))[:limit]
+
+# Enough terms starting with 'ge' and 'gen' for their completions to be precomputed
+SUGGESTION_VOCABULARY = {
+    'gene': 40, 'genes': 40, 'genome': 25, 'genetic': 25, 'genomic': 10, 'general': 10, 'generic': 3,
+    'ge': 5, 'gel': 5, 'gem': 5, 'gut': 8,
+    **{f'gen{chr(97 + i)}{chr(97 + j)}': i + j for i in range(9) for j in range(9)},
+    'protein': 50, 'proteins': 30, 'proteome': 30, 'lipoprotein': 4, 'glycoprotein': 4, 'cytokine': 7,
+    'biogenesis': 3, 'oncogene': 6, 'transgene': 6, 'mutagen': 2,
+}
+
+class PrefixSuggestionTests(SimpleTestCase):
+    def test_lookup_matches_a_scan_of_the_vocabulary(self):
+        index = PrefixIndex(SUGGESTION_VOCABULARY, top_k=10, scan_limit=16)
+        self.assertIn('gen', index.top_completions)
+
+        for partial in ['g', 'ge', 'gen', 'gene', 'genea', 'prot', 'protein', 'PROT', 'zz', '']:
+            for limit in [1, 5, 10, 20]:
+                with self.subTest(partial=partial, limit=limit):
+                    self.assertEqual(
+                        index.lookup(partial, limit),
+                        prefix_scan(SUGGESTION_VOCABULARY, partial.lower(), limit),
+                    )
+
+def suggestions_scan(term_frequencies, partial, max_suggestions):
+    """Reference for get_query_suggestions: prefix completions, then terms containing `partial` elsewhere"""
+    partial = partial.lower()
+    if len(partial) < 2:
+        return []
+    infix = [term for term in term_frequencies if partial in term and not term.startswith(partial)]
+    infix = sorted(infix, key=suggestion_rank(term_frequencies))
+    return (prefix_scan(term_frequencies, partial, max_suggestions) + infix)[:max_suggestions]
+
+class InfixSuggestionTests(SimpleTestCase):
+    def setUp(self):
+        self.corrector = QueryCorrector()
+        self.corrector._set_term_frequencies(SUGGESTION_VOCABULARY)
+
+    def test_suggestions_match_a_scan_of_the_vocabulary(self):
+        # Partials shorter than a trigram, tied counts ('lipoprotein'/'glycoprotein') and ones without any match
+        partials = ['g', 'ge', 'gen', 'gene', 'ene', 'en', 'protein', 'rotei', 'PROTEIN', 'tok', 'ome', 'zq', 'genzz']
+        for partial in partials:
+            for max_suggestions in [1, 3, 5, 12]:
+                with self.subTest(partial=partial, max_suggestions=max_suggestions):
+                    self.assertEqual(
+                        self.corrector.get_query_suggestions(partial, max_suggestions),
+                        suggestions_scan(SUGGESTION_VOCABULARY, partial, max_suggestions),
+                    )
+
+    def test_infix_lookup_matches_a_scan_of_the_vocabulary(self):
+        index = InfixIndex(SUGGESTION_VOCABULARY)
+
+        for partial in ['ge', 'gen', 'prot', 'protein', 'eaa', 'zq']:
+            with self.subTest(partial=partial):
+                expected = [term for term in suggestions_scan(SUGGESTION_VOCABULARY, partial, 100)
+                            if not term.startswith(partial)]
+                self.assertEqual(index.lookup(partial, limit=100), expected)
+
+class LazySingletonTests(SimpleTestCase):
+    def test_object_is_built_once_on_first_use(self):
+        built = []
+
+        def factory():
+            # Slow enough for concurrent first uses to overlap
+            time.sleep(0.05)
+            built.append(types.SimpleNamespace(name='engine'))
+            return built[-1]
+
+        engine = LazySingleton(factory)
+        self.assertFalse(is_loaded(engine))
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            names = list(executor.map(lambda _: engine.name, range(8)))
+
+        self.assertEqual(names, ['engine'] * 8)
+        self.assertEqual(len(built), 1)
+        self.assertTrue(is_loaded(engine))
+        engine.name = 'renamed'
+        self.assertIs(load(engine), built[0])
+        self.assertEqual(built[0].name, 'renamed')
+
+    def test_importing_the_app_builds_no_engine(self):
+        script = (
+            "import django; django.setup(); import main.views, main.urls, main.warmup; "
+            "from main.lazy import is_loaded; from main.query_correction import query_corrector; "
+            "from main.semantic_search import semantic_engine; from main.text_preprocessing import preprocessor; "
+            "print([is_loaded(engine) for engine in (query_corrector, semantic_engine, preprocessor)])"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='esempeha.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120
+        )
+
+        self.assertEqual(result.stdout.strip(), '[False, False, False]', result.stderr)
+
+class IndexGenerationTests(SimpleTestCase):
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=data_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def test_bump_reaches_processes_with_their_own_cache(self):
+        before = get_index_generation()
+        bump_index_generation()
+        # A worker whose per-process cache never saw the bump
+        cache.clear()
+
+        self.assertNotEqual(get_index_generation(), before)
+        self.assertEqual(get_index_generation(), get_index_generation())
+
+class SearchFormTests(SimpleTestCase):
+    def test_explicit_no_fusion_is_kept_by_the_form_and_suggestions(self):
+        html = render_to_string('index.html', {
+            'query': 'protien', 'use_semantic': True, 'fusion': None, 'fusion_param': 'none',
+            'query_suggestions': ['protein'],
+        })
+
+        self.assertIn('<option value="none" selected>', html)
+        self.assertIn('<option value="" >', html)
+        self.assertIn('?query=protein&semantic=true&fusion=none', html)
+
+    @override_settings(SEARCH_FUSION_DEFAULT='rrf')
+    def test_fusion_default_applies_unless_explicitly_turned_off(self):
+        self.assertEqual(search_options({'query': ' protein ', 'semantic': 'true'}), ('protein', True, 'rrf'))
+        self.assertEqual(search_options({'query': 'protein', 'semantic': 'true', 'fusion': 'none'}), ('protein', True, None))
+
+class IncrementalIndexingTests(SimpleTestCase):
+    def document(self, doc_id, title, text):
+        return {'doc_id': doc_id, 'title': title, 'text': text, 'content_hash': document_content_hash(title, text)}
+
+    def test_only_new_and_changed_documents_are_indexed(self):
+        existing_hashes = {
+            '1': document_content_hash('Protein folding', 'Proteins fold into structures.'),
+            '2': document_content_hash('Cell division', 'Cells divide.'),
+            '3': None,
+            '4': document_content_hash('Removed', 'No longer in the dataset.'),
+        }
+        documents = [
+            self.document('1', 'Protein folding', 'Proteins fold into structures.'),
+            self.document('2', 'Cell division', 'Cells divide by mitosis.'),
+            self.document('3', 'Indexed without a hash', 'Text.'),
+            self.document('5', 'New', 'A new document.'),
+        ]
+        stats = {'added': 0, 'updated': 0, 'unchanged': 0}
+        seen_ids = set()
+
+        changed = list(_iter_changed_documents(documents, existing_hashes, stats, seen_ids))
+
+        self.assertEqual([document['doc_id'] for document in changed], ['2', '3', '5'])
+        self.assertEqual(stats, {'added': 1, 'updated': 2, 'unchanged': 1})
+        self.assertEqual(existing_hashes.keys() - seen_ids, {'4'})
+
+    def test_preprocessing_method_is_part_of_the_hash(self):
+        indexed = {}
+        for method in ['basic', 'nltk_stem', 'spacy']:
+            with override_settings(TEXT_PREPROCESSING_METHOD=method):
+                raw = {'doc_id': '1', 'title': 'Protein folding', 'text': 'Proteins are folding.'}
+                document = next(_iter_scifact_documents([raw]))
+                indexed[method] = (document['text_processed'], document_content_hash('Protein folding', 'Proteins are folding.'))
+
+        # Switching the method changes both what is indexed and the hash
+        self.assertNotEqual(indexed['nltk_stem'][0], indexed['basic'][0])
+        self.assertNotEqual(indexed['nltk_stem'][1], indexed['basic'][1])
+        # Without a spaCy model 'spacy' falls back to basic cleaning, so the hash only changes if the output can
+        spacy_changed = indexed['spacy'][1] != indexed['basic'][1]
+        self.assertEqual(spacy_changed, get_nlp() is not None)
+
+class FusionTests(SimpleTestCase):
+    def test_rrf_counts_documents_found_by_one_retriever_once(self):
+        lexical = [('a', 12.0), ('b', 8.0), ('c', 1.0)]
+        vector = [('d', 0.9), ('a', 0.8)]
+
+        fused = dict(reciprocal_rank_fusion([lexical, vector], k=60))
+
+        self.assertAlmostEqual(fused['a'], 1 / 61 + 1 / 62)
+        self.assertAlmostEqual(fused['b'], 1 / 62)
+        self.assertAlmostEqual(fused['c'], 1 / 63)
+        self.assertAlmostEqual(fused['d'], 1 / 61)
+        self.assertEqual([doc_id for doc_id, _ in reciprocal_rank_fusion([lexical, vector])], ['a', 'd', 'b', 'c'])
+
+    def test_weighted_fusion_normalizes_each_ranking(self):
+        lexical = [('a', 10.0), ('b', 6.0), ('c', 2.0)]
+        vector = [('c', 0.9), ('d', 0.5)]
+
+        fused = dict(weighted_score_fusion([lexical, vector], [0.5, 0.5]))
+
+        self.assertEqual(fused, {'a': 0.5, 'b': 0.25, 'c': 0.5, 'd': 0.0})
+
+    def test_weighted_fusion_with_a_single_hit_or_equal_scores(self):
+        fused = weighted_score_fusion([[('a', 3.0)], [('b', 0.4), ('c', 0.4)], []], [0.3, 0.7, 1.0])
+
+        self.assertEqual(fused, [('b', 0.7), ('c', 0.7), ('a', 0.3)])
+
+    def test_fused_hits_keep_the_fused_order_when_a_document_is_missing(self):
+        fused = [('c', 0.9), ('gone', 0.8), ('a', 0.5)]
+        response = {'docs': [
+            {'_id': 'c', 'found': True, '_source': {'title': 'C'}},
+            {'_id': 'gone', 'found': False},
+            {'_id': 'a', 'found': True, '_source': {'title': 'A'}},
+        ]}
+
+        self.assertEqual(_fused_hits(response, fused), [
+            {'id': 'c', 'title': 'C', 'score': 0.9},
+            {'id': 'a', 'title': 'A', 'score': 0.5},
+        ])
+
+class StubBulkHandler(BaseHTTPRequestHandler):
+    """Mimics the _bulk API, failing to index documents whose id starts with 'bad'"""
+
+    def do_POST(self):
+        lines = self.rfile.read(int(self.headers['Content-Length'])).decode().splitlines()
+        items = []
+        for action_line in lines[::2]:
+            doc_id = json.loads(action_line)['index']['_id']
+            if doc_id.startswith('bad'):
+                items.append({'index': {'_id': doc_id, 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}})
+            else:
+                items.append({'index': {'_id': doc_id, 'status': 201, 'result': 'created'}})
+        content = json.dumps({'took': 1, 'errors': any(item['index']['status'] >= 300 for item in items), 'items': items})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+class BulkIndexingTests(SimpleTestCase):
+    def test_only_indexed_documents_are_reported_per_chunk(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubBulkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = OpenSearch(hosts=[{'host': '127.0.0.1', 'port': server.server_port}])
+        actions = [
+            {'_index': 'test', '_id': doc_id, '_source': {'doc_id': doc_id}} for doc_id in ['1', 'bad-2', '3', '4']
+        ]
+        indexed_chunks = []
+
+        stats = bulk_index_documents(client, actions, chunk_size=2, thread_count=1, on_indexed=indexed_chunks.append)
+
+        self.assertEqual((stats['indexed'], stats['failed']), (3, 1))
+        self.assertEqual(
+            sorted([document['doc_id'] for document in chunk] for chunk in indexed_chunks), [['1'], ['3', '4']]
+        )
+
+class StubScrollHandler(BaseHTTPRequestHandler):
+    """Mimics the search and scroll APIs over `documents`, serving pages of the size of the first request"""
+    documents = [{'doc_id': str(i), 'title': f'Title {i}', 'text': f'Text {i}'} for i in range(5)]
+    requests_seen = []
+    source_fields = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        type(self).requests_seen.append((self.command, self.path.split('?')[0], body))
+        if self.path.startswith('/_search/scroll'):
+            offset, size = map(int, body['scroll_id'].split(':'))
+        else:
+            offset, size = 0, int(self.path.split('size=')[1].split('&')[0])
+            # Like a scroll context, later pages keep the source filter of the search
+            type(self).source_fields = body.get('_source')
+        fields = self.source_fields
+        hits = [
+            {'_id': document['doc_id'], '_source': {k: v for k, v in document.items() if fields is None or k in fields}}
+            for document in self.documents[offset:offset + size]
+        ]
+        self.respond({
+            '_scroll_id': f'{offset + size}:{size}',
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0},
+            'hits': {'hits': hits},
+        })
+
+    def do_DELETE(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        type(self).requests_seen.append((self.command, self.path.split('?')[0], None))
+        self.respond({'succeeded': True})
+
+    def respond(self, content):
+        content = json.dumps(content).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class ScrollTests(SimpleTestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubScrollHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.client = OpenSearch(hosts=[{'host': '127.0.0.1', 'port': server.server_port}])
+        StubScrollHandler.requests_seen = []
+
+    def test_every_document_is_read_across_pages(self):
+        documents = list(iter_all_documents(self.client, 'test', source_fields=['doc_id', 'title'], page_size=2))
+
+        self.assertEqual(documents, [
+            {'id': str(i), 'doc_id': str(i), 'title': f'Title {i}'} for i in range(5)
+        ])
+        paths = [path for _, path, _ in StubScrollHandler.requests_seen]
+        # One search, a scroll for each further page and the empty one ending it, then the context is cleared
+        self.assertEqual(paths, ['/test/_search', '/_search/scroll', '/_search/scroll', '/_search/scroll', '/_search/scroll'])
+        self.assertEqual(StubScrollHandler.requests_seen[0][2]['_source'], ['doc_id', 'title'])
+        self.assertEqual(StubScrollHandler.requests_seen[-1][0], 'DELETE')
+
+    def test_scroll_is_cleared_when_reading_stops_early(self):
+        documents = iter_all_documents(self.client, 'test', page_size=2)
+        self.assertEqual(next(documents)['id'], '0')
+
+        documents.close()
+
+        self.assertEqual([method for method, _, _ in StubScrollHandler.requests_seen], ['POST', 'DELETE'])
+
+class OpenSearchClientTests(SimpleTestCase):
+    def setUp(self):
+        opensearch_utils._reset_after_fork()
+        self.addCleanup(opensearch_utils._reset_after_fork)
+
+    @override_settings(OPENSEARCH_POOL_MAXSIZE=4, OPENSEARCH_TIMEOUT=2.5, OPENSEARCH_MAX_RETRIES=1)
+    def test_one_pooled_client_is_shared_by_all_threads(self):
+        create = opensearch_utils.create_opensearch_client
+        created = []
+
+        def slow_create():
+            # Gives other threads time to find no client yet
+            time.sleep(0.05)
+            created.append(create())
+            return created[-1]
+
+        with mock.patch('main.opensearch_utils.create_opensearch_client', side_effect=slow_create):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                clients = list(executor.map(lambda _: opensearch_utils.get_opensearch_client(), range(8)))
+
+        self.assertEqual(len(created), 1)
+        self.assertTrue(all(client is created[0] for client in clients))
+        connection = created[0].transport.connection_pool.connections[0]
+        self.assertEqual((connection.pool.pool.maxsize, connection.timeout), (4, 2.5))
+        self.assertEqual(created[0].transport.max_retries, 1)
+
+    def test_async_clients_are_kept_per_event_loop(self):
+        async def clients():
+            return opensearch_utils.get_async_opensearch_client(), opensearch_utils.get_async_opensearch_client()
+
+        first, again = asyncio.run(clients())
+        other, _ = asyncio.run(clients())
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+    def test_reset_after_fork_drops_clients_and_executor(self):
+        client = opensearch_utils.get_opensearch_client()
+        executor = opensearch_utils._get_fusion_executor()
+        self.addCleanup(executor.shutdown)
+
+        opensearch_utils._reset_after_fork()
+
+        self.assertIsNot(opensearch_utils.get_opensearch_client(), client)
+        self.assertIsNot(opensearch_utils._get_fusion_executor(), executor)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "os.fork is not available")
+    def test_forked_worker_does_not_inherit_the_client(self):
+        opensearch_utils.get_opensearch_client()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_fd, b'new' if opensearch_utils._client is None else b'inherited')
+            os._exit(0)
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd, 'rb') as pipe:
+            self.assertEqual(pipe.read(), b'new')
+        self.assertIsNotNone(opensearch_utils._client)
+
+class BagOfWordsModel:
+    """Stands in for the sentence transformer: one dimension per vocabulary word"""
+    vocabulary = ['protein', 'folding', 'cell', 'division', 'virus', 'vaccine', 'gene', 'mutation']
+
+    def encode(self, texts, convert_to_tensor=False):
+        return np.array([
+            [float(word in text.lower().split()) for word in self.vocabulary] for text in texts
+        ], dtype=np.float32)
+
+class CountingModel(BagOfWordsModel):
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, convert_to_tensor=False):
+        self.encoded.extend(texts)
+        return super().encode(texts)
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+    def engine(self, shared=False):
+        with override_settings(SEMANTIC_QUERY_CACHE_SHARED=shared):
+            engine = SemanticSearchEngine()
+        engine.model = CountingModel()
+        return engine
+
+    def setUp(self):
+        cache.clear()
+
+    def test_each_distinct_query_is_encoded_once(self):
+        engine = self.engine()
+
+        first = engine.encode_queries(['Protein folding', 'protein   folding', 'virus vaccine'])
+        second = engine.encode_queries(['PROTEIN FOLDING'])
+
+        self.assertEqual(engine.model.encoded, ['Protein folding', 'virus vaccine'])
+        np.testing.assert_array_equal(first[0], first[1])
+        np.testing.assert_array_equal(second[0], first[0])
+        stats = engine.query_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['encodes'], stats['shared_hits']), (1, 3, 2, 0))
+
+    def test_queries_encoded_by_one_worker_are_shared_with_others(self):
+        encoder, reader = self.engine(shared=True), self.engine(shared=True)
+
+        encoded = encoder.encode_queries(['protein folding'])
+        shared = reader.encode_queries(['Protein Folding', 'cell division'])
+
+        self.assertEqual(reader.model.encoded, ['cell division'])
+        self.assertEqual(shared.dtype, np.float32)
+        np.testing.assert_array_equal(shared[0], encoded[0])
+        stats = reader.query_cache_stats()
+        self.assertEqual((stats['shared_hits'], stats['encodes']), (1, 1))
+        # Found once in the shared cache, the embedding is served from the local cache afterwards
+        reader.encode_queries(['protein folding'])
+        self.assertEqual(reader.query_cache_stats()['shared_hits'], 1)
+
+@override_settings(SEMANTIC_ANN_BACKEND='exact', SEMANTIC_DELTA_REFRESH_INTERVAL=0)
+class IncrementalEmbeddingTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        with override_settings(BASE_DIR=self.data_dir.name):
+            # The indexing process and a web worker, sharing the files under data/
+            self.indexer, self.worker = SemanticSearchEngine(), SemanticSearchEngine()
+        for engine in (self.indexer, self.worker):
+            engine.model = BagOfWordsModel()
+
+        with EmbeddingStoreWriter(self.indexer.embeddings_file, self.indexer.model_name, normalized=True) as writer:
+            writer.add(
+                BagOfWordsModel().encode(['protein folding', 'cell division']), ['1', '2'],
+                [self.indexer.embedding_hash('Protein folding', ''), self.indexer.embedding_hash('Cell division', '')],
+            )
+
+    def search(self, engine, query):
+        return [result['doc_id'] for result in engine.semantic_search(query, top_k=5)]
+
+    def test_updates_are_searchable_in_other_processes_before_compaction(self):
+        self.assertEqual(self.search(self.worker, 'virus vaccine'), [])
+        self.assertEqual(self.worker.semantic_search_many(query for query in ['cell division'])[0][0]['doc_id'], '2')
+
+        encoded = self.indexer.update_document_embeddings([
+            {'doc_id': '1', 'title': 'Protein folding', 'text': ''},
+            {'doc_id': '2', 'title': 'Gene mutation', 'text': ''},
+            {'doc_id': '3', 'title': 'Virus vaccine', 'text': ''},
+        ])
+        self.indexer.delete_document_embeddings(['1'])
+
+        self.assertEqual(encoded, 2)
+        self.assertEqual(self.search(self.worker, 'virus vaccine'), ['3'])
+        self.assertEqual(self.search(self.worker, 'gene mutation'), ['2'])
+        self.assertEqual(self.search(self.worker, 'cell division'), [])
+        self.assertEqual(self.search(self.worker, 'protein folding'), [])
+
+    def test_top_k_results_are_found_behind_many_hidden_rows(self):
+        texts = ['protein folding'] * 6 + ['protein'] * 6 + ['virus vaccine'] * 4
+        doc_ids = [f'p{i}' for i in range(6)] + [f'q{i}' for i in range(6)] + [f'v{i}' for i in range(4)]
+        with EmbeddingStoreWriter(self.indexer.embeddings_file, self.indexer.model_name, normalized=True) as writer:
+            writer.add(BagOfWordsModel().encode(texts), doc_ids)
+        # The nearest rows to the query are all removed, as well as rows far from it
+        self.indexer.delete_document_embeddings(doc_ids[:6] + doc_ids[12:])
+        self.worker.load_document_embeddings()
+        searches = []
+        search = self.worker.ann_index.search
+        self.worker.ann_index.search = lambda queries, k: searches.append(k) or search(queries, k)
+
+        results = self.worker.semantic_search('protein folding', top_k=2)
+
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(result['doc_id'].startswith('q') for result in results))
+        # Two extra rows first, then twice as many, never the 2 + 10 hidden rows
+        self.assertEqual(searches, [4, 8])
+
+    def test_incremental_runs_find_the_store_without_loading_the_model(self):
+        engine = LazySingleton(SemanticSearchEngine)
+        with override_settings(BASE_DIR=self.data_dir.name), mock.patch('main.semantic_search.semantic_engine', engine):
+            self.assertTrue(_has_local_embeddings())
+            with override_settings(OPENSEARCH_KNN_ENABLED=True):
+                self.assertFalse(_has_local_embeddings())
+
+        self.assertFalse(is_loaded(engine))
+
+    def test_only_changes_to_the_embedded_text_or_model_are_encoded_again(self):
+        unchanged = [{'doc_id': '1', 'title': 'Protein folding', 'text': ''}]
+
+        with override_settings(TEXT_PREPROCESSING_METHOD='basic', OPENSEARCH_KNN_ENABLED=True):
+            self.assertEqual(self.indexer.update_document_embeddings(unchanged), 0)
+        self.indexer.model_name = 'another-model'
+        self.assertNotEqual(self.indexer.embedding_hash('Protein folding', ''), self.indexer.store.read_content_hashes()[0])
+
+    def test_compaction_merges_the_delta_into_the_store(self):
+        self.indexer.update_document_embeddings([
+            {'doc_id': '3', 'title': 'Virus vaccine', 'text': ''},
+        ])
+        self.indexer.delete_document_embeddings(['2'])
+        self.assertEqual(self.search(self.worker, 'cell division'), [])
+
+        self.assertFalse(self.indexer.compact_document_embeddings(min_records=3))
+        self.assertTrue(self.indexer.compact_document_embeddings(min_records=2))
+
+        store = EmbeddingStore(self.indexer.embeddings_file)
+        self.assertEqual(store.doc_ids, ['1', '3'])
+        self.assertEqual(store.read_content_hashes(), [
+            self.indexer.embedding_hash('Protein folding', ''), self.indexer.embedding_hash('Virus vaccine', '')
+        ])
+        self.assertEqual(self.indexer.delta_log.read(), ([], 0))
+        self.assertEqual(self.search(self.worker, 'virus vaccine'), ['3'])
+        self.assertEqual(self.search(self.worker, 'protein folding'), ['1'])
+        self.assertEqual(len(self.worker.store), 2)
+
+    @override_settings(SEMANTIC_ANN_BACKEND='ivf')
+    def test_compaction_publishes_a_matching_ann_index(self):
+        self.indexer.build_ann_index(EmbeddingStore(self.indexer.embeddings_file))
+        self.assertEqual(self.search(self.worker, 'protein folding'), ['1'])
+        self.assertIsInstance(self.worker.ann_index, IVFIndex)
+
+        # Only updates, so the compacted store has as many rows as the old one, in another order
+        self.indexer.update_document_embeddings([
+            {'doc_id': '1', 'title': 'Virus vaccine', 'text': ''},
+            {'doc_id': '2', 'title': 'Gene mutation', 'text': ''},
+        ])
+        self.assertTrue(self.indexer.compact_document_embeddings())
+
+        self.assertEqual(self.search(self.worker, 'virus vaccine'), ['1'])
+        self.assertEqual(self.search(self.worker, 'gene mutation'), ['2'])
+        self.assertIsInstance(self.worker.ann_index, IVFIndex)
+        self.assertEqual(self.worker.ann_index.fingerprint, self.worker.store.fingerprint)
+
+class EmbeddingStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        self.path = f"{self.data_dir.name}/store.bin"
+
+    def write_store(self, dtype='float32'):
+        vectors = BagOfWordsModel().encode(['protein folding', 'cell division', 'virus vaccine'])
+        with EmbeddingStoreWriter(self.path, 'bag-of-words', dtype=dtype, normalized=True) as writer:
+            writer.add(vectors[:2], ['1', '2'], ['hash-1', 'hash-2'])
+            writer.add(vectors[2:], [3])
+        return vectors
+
+    def rewrite_header(self, old, new):
+        with open(self.path, 'r+b') as f:
+            header = f.read(HEADER_SIZE)
+            self.assertIn(old, header)
+            f.seek(0)
+            f.write(header.replace(old, new))
+
+    def test_batches_round_trip(self):
+        for dtype in ['float32', 'float16']:
+            with self.subTest(dtype=dtype):
+                vectors = self.write_store(dtype)
+                store = EmbeddingStore(self.path)
+
+                self.assertEqual((store.model_name, store.dtype.name, store.normalized), ('bag-of-words', dtype, True))
+                self.assertEqual(len(store), 3)
+                self.assertEqual(store.doc_ids, ['1', '2', '3'])
+                np.testing.assert_array_equal(np.asarray(store.embeddings, dtype=np.float32), vectors)
+                self.assertEqual(store.read_content_hashes(), ['hash-1', 'hash-2', None])
+
+    def test_failed_write_leaves_no_file(self):
+        with self.assertRaises(EmbeddingStoreError):
+            with EmbeddingStoreWriter(self.path, 'bag-of-words') as writer:
+                writer.add(np.zeros((2, 4)), ['1', '2'])
+                writer.add(np.zeros((1, 3)), ['3'])
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(writer.tmp_path))
+
+    def test_other_files_and_versions_are_rejected(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\x80\x04 a pickled matrix')
+        with self.assertRaisesRegex(EmbeddingStoreError, 'not an embedding store'):
+            EmbeddingStore(self.path)
+
+        self.write_store()
+        self.rewrite_header(b'"version": 1', b'"version": 9')
+        with self.assertRaisesRegex(EmbeddingStoreError, 'Unsupported embedding store version 9'):
+            EmbeddingStore(self.path)
+
+    def test_doc_ids_must_match_the_row_count(self):
+        self.write_store()
+        self.rewrite_header(b'"count": 3', b'"count": 2')
+
+        with self.assertRaisesRegex(EmbeddingStoreError, '2 embeddings but 3 doc ids'):
+            EmbeddingStore(self.path)
+
+class ANNIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        vectors = BagOfWordsModel().encode(['protein folding', 'cell division', 'virus vaccine', 'gene mutation'])
+        # Two stores with the same number of rows in a different order
+        self.store = self.write_store('a.bin', vectors, ['1', '2', '3', '4'])
+        self.reordered_store = self.write_store('b.bin', vectors[::-1], ['4', '3', '2', '1'])
+
+    def write_store(self, name, vectors, doc_ids):
+        path = f"{self.data_dir.name}/{name}"
+        with EmbeddingStoreWriter(path, 'bag-of-words', normalized=True) as writer:
+            writer.add(vectors, doc_ids)
+        return EmbeddingStore(path)
+
+    def test_index_of_another_store_with_as_many_rows_is_not_loaded(self):
+        path = f"{self.data_dir.name}/index.ivf"
+        index = IVFIndex(self.store.embeddings, nlist=2, normalized=True, fingerprint=self.store.fingerprint)
+        index.build()
+        index.save(path)
+
+        reordered = IVFIndex(self.reordered_store.embeddings, normalized=True, fingerprint=self.reordered_store.fingerprint)
+        self.assertFalse(reordered.load(path))
+        self.assertTrue(IVFIndex(self.store.embeddings, normalized=True, fingerprint=self.store.fingerprint).load(path))
+
+    def test_exact_search_scores_float16_rows_in_blocks(self):
+        path = f"{self.data_dir.name}/half.bin"
+        with EmbeddingStoreWriter(path, 'bag-of-words', dtype='float16', normalized=True) as writer:
+            writer.add(np.asarray(self.store.embeddings), self.store.doc_ids)
+        queries = BagOfWordsModel().encode(['virus vaccine', 'cell division folding'])
+
+        blocked = ExactIndex(EmbeddingStore(path).embeddings, normalized=True, block_size=3).search(queries, top_k=2)
+        expected = ExactIndex(self.store.embeddings, normalized=True).search(queries, top_k=2)
+
+        for (indices, scores), (expected_indices, expected_scores) in zip(blocked, expected):
+            self.assertEqual(indices.tolist(), expected_indices.tolist())
+            np.testing.assert_allclose(scores, expected_scores, atol=1e-3)
+
+    @unittest.skipUnless(hnswlib, "hnswlib is not installed")
+    def test_hnsw_searches_do_not_change_ef(self):
+        path = f"{self.data_dir.name}/index.hnsw"
+        index = HNSWIndex(self.store.embeddings, ef_search=2, max_top_k=3, fingerprint=self.store.fingerprint)
+        index.build()
+        index.save(path)
+
+        self.assertFalse(HNSWIndex(self.reordered_store.embeddings, fingerprint=self.reordered_store.fingerprint).load(path))
+        loaded = HNSWIndex(self.store.embeddings, ef_search=2, max_top_k=3, fingerprint=self.store.fingerprint)
+        self.assertTrue(loaded.load(path))
+        [(labels, _)] = loaded.search(BagOfWordsModel().encode(['virus vaccine']), top_k=10)
+        self.assertEqual(len(labels), 4)
+        self.assertEqual(labels[0], 2)
+        self.assertEqual(loaded.ef_search, 3)
+        self.assertEqual(loaded.index.ef, 3)
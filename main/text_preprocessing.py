@@ -1,5 +1,6 @@
 import re
 import string
+import threading
 import nltk
 try:
     import spacy
@@ -10,32 +11,70 @@ except ImportError:
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 from nltk.tokenize import word_tokenize
+from django.conf import settings
+from .cache_utils import LRUCache
+from .lazy import LazySingleton
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Download required NLTK data
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-    nltk.download('wordnet', quiet=True)
-    nltk.download('averaged_perceptron_tagger', quiet=True)
-except Exception as e:
-    logger.warning(f"Failed to download NLTK data: {e}")
+# NLTK resources used by the preprocessor, by data path and download name
+NLTK_RESOURCES = {
+    'tokenizers/punkt': 'punkt',
+    'corpora/stopwords': 'stopwords',
+    'corpora/wordnet': 'wordnet',
+    'taggers/averaged_perceptron_tagger': 'averaged_perceptron_tagger',
+}
+
+_load_lock = threading.Lock()
+_nltk_ready = False
+_nlp = None
+_nlp_loaded = False
+
+def ensure_nltk_data():
+    """Download missing NLTK data once per process, instead of checking every resource on import"""
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    with _load_lock:
+        if _nltk_ready:
+            return
+        for path, name in NLTK_RESOURCES.items():
+            try:
+                nltk.data.find(path)
+            except LookupError:
+                try:
+                    nltk.download(name, quiet=True)
+                except Exception as e:
+                    logger.warning(f"Failed to download NLTK data: {e}")
+        _nltk_ready = True
+
+def get_nlp():
+    """The spaCy English pipeline, loaded on first use; None if spaCy or the model is missing"""
+    global _nlp, _nlp_loaded
+    if _nlp_loaded:
+        return _nlp
+    with _load_lock:
+        if _nlp_loaded:
+            return _nlp
+        if SPACY_AVAILABLE:
+            try:
+                _nlp = spacy.load("en_core_web_sm")
+            except OSError:
+                logger.warning("spaCy English model not found. Install with: python -m spacy download en_core_web_sm")
+        else:
+            logger.warning("spaCy not installed. Install with: pip install spacy && python -m spacy download en_core_web_sm")
+        _nlp_loaded = True
+        return _nlp
 
-# Load spaCy model
-nlp = None
-if SPACY_AVAILABLE:
-    try:
-        nlp = spacy.load("en_core_web_sm")
-    except OSError:
-        logger.warning("spaCy English model not found. Install with: python -m spacy download en_core_web_sm")
-        nlp = None
-else:
-    logger.warning("spaCy not installed. Install with: pip install spacy && python -m spacy download en_core_web_sm")
+# Pipeline components not needed for lemmatization, skipped during batch and query preprocessing
+BATCH_DISABLED_PIPES = ['parser', 'ner']
+QUERY_DISABLED_PIPES = BATCH_DISABLED_PIPES
 
 class TextPreprocessor:
     def __init__(self):
+        ensure_nltk_data()
+        self.query_cache = LRUCache(getattr(settings, 'QUERY_PREPROCESS_CACHE_SIZE', 8192))
         self.stemmer = PorterStemmer()
         self.lemmatizer = WordNetLemmatizer()
         try:
@@ -104,14 +143,8 @@ class TextPreprocessor:
         """Apply lemmatization to tokens"""
         return [self.lemmatizer.lemmatize(token) for token in tokens]
     
-    def spacy_preprocessing(self, text):
-        """Advanced preprocessing using spaCy"""
-        if not nlp or not text:
-            return []
-        
-        text = self.clean_text(text)
-        doc = nlp(text)
-        
+    def _spacy_tokens(self, doc):
+        """Filter and lemmatize the tokens of a processed spaCy doc"""
         tokens = []
         for token in doc:
             # Skip stopwords, punctuation, spaces, and single characters
@@ -123,12 +156,23 @@ class TextPreprocessor:
         
         return tokens
     
+    def spacy_preprocessing(self, text):
+        """Advanced preprocessing using spaCy"""
+        nlp = get_nlp()
+        if not nlp or not text:
+            return []
+        
+        text = self.clean_text(text)
+        doc = nlp(text)
+        
+        return self._spacy_tokens(doc)
+    
     def preprocess_for_indexing(self, text, method='spacy'):
         """
         Comprehensive preprocessing for document indexing
         method: 'spacy', 'nltk_stem', 'nltk_lemma'
         """
-        if method == 'spacy' and nlp:
+        if method == 'spacy' and get_nlp():
             return ' '.join(self.spacy_preprocessing(text))
         elif method == 'nltk_stem':
             tokens = self.tokenize_and_normalize(text)
@@ -142,14 +186,60 @@ class TextPreprocessor:
             # Fallback to basic cleaning
             return self.clean_text(text)
     
+    def applied_method(self, method='spacy'):
+        """The method preprocess_for_indexing really applies: 'basic' cleaning when spaCy or the method is unavailable"""
+        if method == 'spacy':
+            return method if get_nlp() else 'basic'
+        return method if method in ('nltk_stem', 'nltk_lemma') else 'basic'
+    
+    def preprocess_many(self, texts, batch_size=256, n_process=1, method='spacy'):
+        """
+        Batch version of preprocess_for_indexing, yielding one processed string per input text in order.
+        Uses nlp.pipe with the parser and NER disabled; lemmas and token flags do not depend on them,
+        so the output is identical to preprocess_for_indexing.
+        """
+        nlp = get_nlp()
+        if not (method == 'spacy' and nlp):
+            for text in texts:
+                yield self.preprocess_for_indexing(text, method)
+            return
+        
+        disabled = [name for name in BATCH_DISABLED_PIPES if name in nlp.pipe_names]
+        cleaned = (self.clean_text(text) for text in texts)
+        for doc in nlp.pipe(cleaned, batch_size=batch_size, n_process=n_process, disable=disabled):
+            yield ' '.join(self._spacy_tokens(doc))
+    
+    def _query_doc(self, nlp, text):
+        """Run only the pipeline components that lemmas and token flags depend on"""
+        doc = nlp.make_doc(text)
+        for name, component in nlp.pipeline:
+            if name not in QUERY_DISABLED_PIPES:
+                doc = component(doc)
+        return doc
+    
     def preprocess_query(self, query, method='spacy'):
         """
-        Preprocess search query with same method as indexing
+        Preprocess search query with same method as indexing.
+        Skips the parser and NER and memoizes results, since every method starts from the cleaned text.
         """
-        return self.preprocess_for_indexing(query, method)
+        cleaned = self.clean_text(query)
+        key = (method, cleaned)
+        processed = self.query_cache.get(key)
+        if processed is not None:
+            return processed
+        
+        nlp = get_nlp()
+        if method == 'spacy' and nlp:
+            processed = ' '.join(self._spacy_tokens(self._query_doc(nlp, cleaned))) if cleaned else ''
+        else:
+            processed = self.preprocess_for_indexing(query, method)
+        
+        self.query_cache.set(key, processed)
+        return processed
     
     def extract_entities(self, text):
         """Extract named entities using spaCy"""
+        nlp = get_nlp()
         if not nlp or not text:
             return []
         
@@ -157,5 +247,5 @@ class TextPreprocessor:
         entities = [(ent.text, ent.label_) for ent in doc.ents]
         return entities
 
-# Global preprocessor instance
-preprocessor = TextPreprocessor()
+# Global preprocessor instance, built on first use
+preprocessor = LazySingleton(TextPreprocessor)
@@ -1,10 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from main.views import show_main, autocomplete_suggestions, query_corrections_api
+from main.views import (
+    show_main, autocomplete_suggestions, query_corrections_api, summary_stream, readiness,
+    show_main_async, autocomplete_suggestions_async, query_corrections_api_async, summary_stream_async,
+)
 
 app_name = 'main'
 
-urlpatterns = [
+# Under an ASGI server the async views await OpenSearch and the LLM API instead of holding a thread
+async_urlpatterns = [
+    path('', show_main_async, name='show_main'),
+    path('api/autocomplete/', autocomplete_suggestions_async, name='autocomplete'),
+    path('api/corrections/', query_corrections_api_async, name='corrections'),
+    path('api/summary/', summary_stream_async, name='summary'),
+    path('ready/', readiness, name='readiness'),
+]
+
+sync_urlpatterns = [
     path('', show_main, name='show_main'),
     path('api/autocomplete/', autocomplete_suggestions, name='autocomplete'),
     path('api/corrections/', query_corrections_api, name='corrections'),
-]
\ No newline at end of file
+    path('api/summary/', summary_stream, name='summary'),
+    path('ready/', readiness, name='readiness'),
+]
+
+urlpatterns = async_urlpatterns if settings.ASYNC_VIEWS else sync_urlpatterns
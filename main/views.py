@@ -1,80 +1,177 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
-from .opensearch_utils import get_opensearch_client, search_documents
-from .llm_utils import get_llm_summary
+from .async_utils import run_cpu_bound
+from .opensearch_utils import (
+    async_get_documents_by_ids, async_search_documents, get_async_opensearch_client, get_documents_by_ids,
+    get_opensearch_client, search_documents, search_options
+)
+from .llm_utils import async_get_llm_summary, async_stream_llm_summary, get_llm_summary, stream_llm_summary
 from .query_correction import query_corrector
-from .semantic_search import semantic_engine
+from .warmup import warmup_status
+import os
+import json
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 logger = logging.getLogger(__name__)
 
+_view_executor = None
+_view_executor_lock = threading.Lock()
+
+def _get_view_executor():
+    global _view_executor
+    if _view_executor is None:
+        with _view_executor_lock:
+            if _view_executor is None:
+                _view_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SEARCH_VIEW_WORKERS', 16), thread_name_prefix="search-view"
+                )
+    return _view_executor
+
+def _reset_after_fork():
+    global _view_executor, _view_executor_lock
+    _view_executor = None
+    _view_executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _timed(timings, stage, func, *args, **kwargs):
+    """Runs func and records its wall time in milliseconds under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
+
+async def _atimed(timings, stage, awaitable):
+    """Awaits awaitable and records its wall time in milliseconds under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
+
+def _search_options(request):
+    return search_options(request.GET)
+
+def _report_timings(response, query, timings, request_start):
+    # Snapshot, since a correction that was not waited for may still be running
+    timings = dict(timings, total=(time.perf_counter() - request_start) * 1000)
+    # Stages overlap, so the sum of stage times is what the request would cost if run one after another
+    sequential = sum(value for stage, value in timings.items() if stage != 'total')
+    logger.info(
+        f"Search '{query}' took {timings['total']:.0f}ms (stages {sequential:.0f}ms run sequentially): "
+        + ", ".join(f"{stage}={value:.0f}ms" for stage, value in timings.items() if stage != 'total')
+    )
+    response['Server-Timing'] = ", ".join(f"{stage};dur={value:.1f}" for stage, value in timings.items())
+
+def _render_results(request, query, use_semantic, fusion, search_results, llm_summary, error_message, query_suggestions):
+    context = {
+        'query': query,
+        'search_results': search_results,
+        'llm_summary': llm_summary,
+        'error_message': error_message,
+        'query_suggestions': query_suggestions,
+        'use_semantic': use_semantic,
+        'fusion': fusion,
+        # As requested, so the form and suggestion links keep an explicit 'none' or an empty default
+        'fusion_param': request.GET.get('fusion', ''),
+        'summary_deferred': bool(search_results) and not llm_summary and getattr(settings, 'LLM_SUMMARY_DEFERRED', True),
+        'summary_ids': ",".join(result['id'] for result in search_results[:3]),
+        'search_engine_name': "ESEMPEHA Search" 
+    }
+    return render(request, "index.html", context)
+
 def show_main(request):
-    query = request.GET.get('query', '').strip()
-    use_semantic = request.GET.get('semantic', 'false').lower() == 'true'
+    query, use_semantic, fusion = _search_options(request)
     search_results = []
     llm_summary = ""
     error_message = ""
     query_suggestions = []
+    timings = {}
+    request_start = time.perf_counter()
+    # Deferred summaries are streamed by the page from summary_stream after the results are shown
+    defer_summary = getattr(settings, 'LLM_SUMMARY_DEFERRED', True)
 
     if query:
         try:
             client = get_opensearch_client()
-            if not client.ping():
+            executor = _get_view_executor()
+            
+            # Ping, search and corrections do not depend on each other, so they run side by side
+            ping_future = executor.submit(_timed, timings, 'ping', client.ping)
+            search_future = executor.submit(
+                _timed, timings, 'search', search_documents,
+                client, settings.OPENSEARCH_INDEX_NAME, query, use_semantic=use_semantic, fusion=fusion
+            )
+            # Queries this short never get corrections
+            corrections_future = None
+            if len(query) >= 3:
+                corrections_future = executor.submit(_timed, timings, 'corrections', query_corrector.suggest_corrections, query)
+            
+            if not ping_future.result():
                 error_message = "Could not connect to Search Engine. Please try again later."
+                search_future.cancel()
+                if corrections_future:
+                    corrections_future.cancel()
             else:
                 # Perform search with original query first
-                search_results = search_documents(
-                    client, 
-                    settings.OPENSEARCH_INDEX_NAME, 
-                    query, 
-                    use_semantic=use_semantic
-                )
+                search_results = search_future.result()
+                
+                # The summary only needs the top results, so it starts before corrections are resolved
+                summary_future = None
+                if search_results and not defer_summary:
+                    summary_future = executor.submit(_timed, timings, 'summary', get_llm_summary, query, search_results[:3])
                 
-                # Get query corrections - always get them for potential display
-                corrections = query_corrector.suggest_corrections(query)
+                # Corrections are only shown when few or no results were found; otherwise they are not waited for
+                if corrections_future and len(search_results) > 2:
+                    corrections_future.cancel()
+                    corrections_future = None
+                
+                corrections = corrections_future.result() if corrections_future else []
                 
                 # Show corrections if:
                 # 1. We have corrections that are different from the original query
                 # 2. AND either we have no results OR very few results
                 if corrections and any(correction.lower() != query.lower() for correction in corrections):
-                    if len(search_results) <= 2:  # Show suggestions when few or no results
-                        query_suggestions = corrections
-                        logger.info(f"Showing query corrections for '{query}' (found {len(search_results)} results): {corrections}")
-                        
-                        # If no results with original query, try the first correction
-                        if len(search_results) == 0 and corrections:
-                            logger.info(f"No results for '{query}', trying correction '{corrections[0]}'")
-                            corrected_results = search_documents(
-                                client, 
-                                settings.OPENSEARCH_INDEX_NAME, 
-                                corrections[0], 
-                                use_semantic=use_semantic
-                            )
-                            if corrected_results:
-                                search_results = corrected_results
-                                logger.info(f"Found {len(corrected_results)} results with correction")
+                    query_suggestions = corrections
+                    logger.info(f"Showing query corrections for '{query}' (found {len(search_results)} results): {corrections}")
+                    
+                    # If no results with original query, try the first correction
+                    if len(search_results) == 0:
+                        logger.info(f"No results for '{query}', trying correction '{corrections[0]}'")
+                        corrected_results = _timed(
+                            timings, 'corrected_search', search_documents,
+                            client, settings.OPENSEARCH_INDEX_NAME, corrections[0], use_semantic=use_semantic, fusion=fusion
+                        )
+                        if corrected_results:
+                            search_results = corrected_results
+                            logger.info(f"Found {len(corrected_results)} results with correction")
+                            if not defer_summary:
+                                summary_future = executor.submit(
+                                    _timed, timings, 'summary', get_llm_summary, query, search_results[:3]
+                                )
                 
-                if search_results:
+                if summary_future:
                     # Get LLM summary for top results
-                    llm_summary = get_llm_summary(query, search_results[:3])
-                elif not error_message:
+                    llm_summary = summary_future.result()
+                elif not search_results and not error_message:
                     error_message = "No results found for your query."
 
         except Exception as e:
             logger.error(f"Error in search view: {e}", exc_info=True)
             error_message = f"An error occurred during the search: {str(e)}"
 
-    context = {
-        'query': query,
-        'search_results': search_results,
-        'llm_summary': llm_summary,
-        'error_message': error_message,
-        'query_suggestions': query_suggestions,
-        'use_semantic': use_semantic,
-        'search_engine_name': "ESEMPEHA Search" 
-    }
-    return render(request, "index.html", context)
+    response = _render_results(
+        request, query, use_semantic, fusion, search_results, llm_summary, error_message, query_suggestions
+    )
+    if query:
+        _report_timings(response, query, timings, request_start)
+    return response
 
 def autocomplete_suggestions(request):
     """API endpoint for query autocompletion"""
@@ -109,3 +206,202 @@ def query_corrections_api(request):
     except Exception as e:
         logger.error(f"Error getting query corrections: {e}")
         return JsonResponse({'corrections': [], 'error': str(e)})
+
+
+def readiness(request):
+    """
+    Readiness probe: 503 until this worker has finished its boot warm-up (when WARMUP_ON_BOOT is set),
+    so a load balancer only routes traffic to warm workers.
+    """
+    finished, report = warmup_status()
+    if getattr(settings, 'WARMUP_ON_BOOT', False) and not finished:
+        return JsonResponse({'ready': False, 'status': 'warming up'}, status=503)
+    return JsonResponse({'ready': True, 'warmup': report})
+
+def _sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def _summary_sse(event):
+    if 'error' in event:
+        return _sse_event(event, event='error')
+    if event.get('done'):
+        return _sse_event(event, event='done')
+    return _sse_event(event)
+
+def _summary_request(request):
+    """Query and the comma separated ids of the top results, as rendered by show_main"""
+    query = request.GET.get('query', '').strip()
+    doc_ids = [doc_id for doc_id in request.GET.get('ids', '').split(',') if doc_id][:3]
+    return query, doc_ids
+
+def _event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def summary_stream(request):
+    """
+    Streams the LLM summary of a result page as server-sent events.
+    Expects the query and the comma separated ids of the top results, as rendered by show_main.
+    """
+    query, doc_ids = _summary_request(request)
+
+    def events():
+        if not query or not doc_ids:
+            yield _sse_event({'error': "No documents provided."}, event='error')
+            return
+        try:
+            documents = get_documents_by_ids(get_opensearch_client(), settings.OPENSEARCH_INDEX_NAME, doc_ids)
+        except Exception as e:
+            logger.error(f"Error fetching documents for summary: {e}")
+            yield _sse_event({'error': "Could not load the documents to summarize."}, event='error')
+            return
+        for event in stream_llm_summary(query, documents):
+            yield _summary_sse(event)
+
+    return _event_stream_response(events())
+
+async def summary_stream_async(request):
+    """
+    Async version of summary_stream for ASGI servers. The events come from an async generator, so
+    tokens are sent as they arrive instead of being collected in a thread until the summary is complete.
+    """
+    query, doc_ids = _summary_request(request)
+
+    async def events():
+        if not query or not doc_ids:
+            yield _sse_event({'error': "No documents provided."}, event='error')
+            return
+        try:
+            documents = await async_get_documents_by_ids(
+                get_async_opensearch_client(), settings.OPENSEARCH_INDEX_NAME, doc_ids
+            )
+        except Exception as e:
+            logger.error(f"Error fetching documents for summary: {e}")
+            yield _sse_event({'error': "Could not load the documents to summarize."}, event='error')
+            return
+        async for event in async_stream_llm_summary(query, documents):
+            yield _summary_sse(event)
+
+    return _event_stream_response(events())
+
+async def show_main_async(request):
+    """
+    Async version of show_main for ASGI servers: OpenSearch and the LLM API are awaited instead of
+    holding a thread, and preprocessing, encoding and corrections run on the bounded CPU executor.
+    """
+    query, use_semantic, fusion = _search_options(request)
+    search_results = []
+    llm_summary = ""
+    error_message = ""
+    query_suggestions = []
+    timings = {}
+    request_start = time.perf_counter()
+    # Deferred summaries are streamed by the page from summary_stream after the results are shown
+    defer_summary = getattr(settings, 'LLM_SUMMARY_DEFERRED', True)
+
+    if query:
+        tasks = []
+        try:
+            client = get_async_opensearch_client()
+            
+            # Ping, search and corrections do not depend on each other, so they run side by side
+            ping_task = asyncio.create_task(_atimed(timings, 'ping', client.ping()))
+            search_task = asyncio.create_task(_atimed(timings, 'search', async_search_documents(
+                client, settings.OPENSEARCH_INDEX_NAME, query, use_semantic=use_semantic, fusion=fusion
+            )))
+            tasks = [ping_task, search_task]
+            # Queries this short never get corrections
+            corrections_task = None
+            if len(query) >= 3:
+                corrections_task = asyncio.create_task(_atimed(
+                    timings, 'corrections', run_cpu_bound(query_corrector.suggest_corrections, query)
+                ))
+                tasks.append(corrections_task)
+            
+            if not await ping_task:
+                error_message = "Could not connect to Search Engine. Please try again later."
+            else:
+                search_results = await search_task
+                
+                # The summary only needs the top results, so it starts before corrections are resolved
+                summary_task = None
+                if search_results and not defer_summary:
+                    summary_task = asyncio.create_task(_atimed(
+                        timings, 'summary', async_get_llm_summary(query, search_results[:3])
+                    ))
+                    tasks.append(summary_task)
+                
+                # Corrections are only shown when few or no results were found; otherwise they are not waited for
+                corrections = []
+                if corrections_task and len(search_results) <= 2:
+                    corrections = await corrections_task
+                
+                if corrections and any(correction.lower() != query.lower() for correction in corrections):
+                    query_suggestions = corrections
+                    logger.info(f"Showing query corrections for '{query}' (found {len(search_results)} results): {corrections}")
+                    
+                    # If no results with original query, try the first correction
+                    if len(search_results) == 0:
+                        logger.info(f"No results for '{query}', trying correction '{corrections[0]}'")
+                        corrected_results = await _atimed(timings, 'corrected_search', async_search_documents(
+                            client, settings.OPENSEARCH_INDEX_NAME, corrections[0], use_semantic=use_semantic, fusion=fusion
+                        ))
+                        if corrected_results:
+                            search_results = corrected_results
+                            logger.info(f"Found {len(corrected_results)} results with correction")
+                            if not defer_summary:
+                                summary_task = asyncio.create_task(_atimed(
+                                    timings, 'summary', async_get_llm_summary(query, search_results[:3])
+                                ))
+                                tasks.append(summary_task)
+                
+                if summary_task:
+                    llm_summary = await summary_task
+                elif not search_results and not error_message:
+                    error_message = "No results found for your query."
+
+        except Exception as e:
+            logger.error(f"Error in async search view: {e}", exc_info=True)
+            error_message = f"An error occurred during the search: {str(e)}"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    response = _render_results(
+        request, query, use_semantic, fusion, search_results, llm_summary, error_message, query_suggestions
+    )
+    if query:
+        _report_timings(response, query, timings, request_start)
+    return response
+
+async def autocomplete_suggestions_async(request):
+    """Async API endpoint for query autocompletion"""
+    partial_query = request.GET.get('q', '').strip()
+    
+    if len(partial_query) < 2:
+        return JsonResponse({'suggestions': []})
+    
+    try:
+        suggestions = await run_cpu_bound(query_corrector.get_query_suggestions, partial_query)
+        return JsonResponse({'suggestions': suggestions})
+    except Exception as e:
+        logger.error(f"Error getting autocomplete suggestions: {e}")
+        return JsonResponse({'suggestions': [], 'error': str(e)})
+
+async def query_corrections_api_async(request):
+    """Async API endpoint for query spell corrections"""
+    query = request.GET.get('q', '').strip()
+    
+    if len(query) < 2:
+        return JsonResponse({'corrections': []})
+    
+    try:
+        corrections = await run_cpu_bound(query_corrector.suggest_corrections, query)
+        return JsonResponse({'corrections': corrections})
+    except Exception as e:
+        logger.error(f"Error getting query corrections: {e}")
+        return JsonResponse({'corrections': [], 'error': str(e)})
@@ -0,0 +1,140 @@
+import threading
+import time
+from .lazy import load
+import logging
+
+logger = logging.getLogger(__name__)
+
+def preload_engines():
+    """
+    Builds the lazily created engines now: the spaCy pipeline and NLTK data, the sentence transformer
+    with its document embeddings, and the spelling dictionaries. Returns the seconds each one took.
+    """
+    from .text_preprocessing import get_nlp, preprocessor
+    from .semantic_search import semantic_engine
+    from .query_correction import query_corrector
+
+    timings = {}
+
+    start = time.perf_counter()
+    get_nlp()
+    load(preprocessor)
+    timings['preprocessor'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = load(semantic_engine)
+    if engine.model and engine.store is None:
+        engine.load_document_embeddings()
+    timings['semantic_engine'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load(query_corrector)
+    timings['query_corrector'] = time.perf_counter() - start
+
+    logger.info("Preloaded engines: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+WARMUP_QUERY = "protein folding in human cells"
+
+_warmup_done = threading.Event()
+_warmup_report = {}
+
+def load_top_queries(path, top_n=None):
+    """
+    Reads queries to replay, one per line, most popular first. A line may also be `query<TAB>count`,
+    in which case queries are ordered by count. Blank lines and lines starting with # are skipped.
+    """
+    queries = {}
+    with open(path, encoding='utf-8') as f:
+        for position, line in enumerate(f):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            query, _, count = line.rpartition('\t')
+            if not query or not count.isdigit():
+                query, count = line, 0
+            query = query.strip()
+            if query and query not in queries:
+                queries[query] = (-int(count), position)
+    ordered = sorted(queries, key=queries.get)
+    return ordered[:top_n] if top_n else ordered
+
+def _replay_search(client, query, semantic=False):
+    """Runs a search with the arguments the search view would use for it, filling the same result cache entry"""
+    from django.conf import settings
+    from .opensearch_utils import search_documents, search_options
+
+    query, use_semantic, fusion = search_options({'query': query, 'semantic': 'true' if semantic else 'false'})
+    return search_documents(client, settings.OPENSEARCH_INDEX_NAME, query, use_semantic=use_semantic, fusion=fusion)
+
+def run_warmup(queries_file=None, top_n=None, search=True):
+    """
+    Loads every engine, runs a first encode, preprocessing and correction so allocations and lazy
+    initialisation happen now, then optionally replays the top queries from `queries_file` to prime the
+    embedding, correction and search result caches. Marks this process ready when done.
+    Returns a report of the seconds each step took.
+    """
+    from django.conf import settings
+    from .text_preprocessing import preprocessor
+    from .semantic_search import semantic_engine
+    from .query_correction import query_corrector
+    from .opensearch_utils import get_opensearch_client
+
+    queries_file = queries_file if queries_file is not None else getattr(settings, 'WARMUP_QUERIES_FILE', None)
+    top_n = top_n if top_n is not None else getattr(settings, 'WARMUP_TOP_N', 50)
+    report = {}
+    warmup_start = time.perf_counter()
+    try:
+        report['engines'] = preload_engines()
+
+        start = time.perf_counter()
+        preprocessor.preprocess_query(WARMUP_QUERY, method=settings.TEXT_PREPROCESSING_METHOD)
+        semantic_engine.encode_queries([WARMUP_QUERY])
+        query_corrector.suggest_corrections(WARMUP_QUERY)
+        report['first_inference'] = time.perf_counter() - start
+
+        client = None
+        if search:
+            start = time.perf_counter()
+            client = get_opensearch_client()
+            if client.ping():
+                _replay_search(client, WARMUP_QUERY)
+            else:
+                logger.warning("OpenSearch is unreachable, skipping warm-up searches")
+                client = None
+            report['first_search'] = time.perf_counter() - start
+
+        if queries_file:
+            start = time.perf_counter()
+            queries = load_top_queries(queries_file, top_n)
+            for query in queries:
+                query_corrector.suggest_corrections(query)
+                if client:
+                    _replay_search(client, query)
+                    if semantic_engine.model:
+                        _replay_search(client, query, semantic=True)
+                else:
+                    semantic_engine.encode_queries([query])
+            report['replayed_queries'] = len(queries)
+            report['replay'] = time.perf_counter() - start
+    except Exception as e:
+        # A failed warm-up only means slower first requests, so the process still becomes ready
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+        report['error'] = str(e)
+    finally:
+        report['total'] = time.perf_counter() - warmup_start
+        _warmup_report.clear()
+        _warmup_report.update(report)
+        _warmup_done.set()
+        logger.info(f"Warm-up finished in {report['total']:.2f}s")
+    return report
+
+def start_background_warmup(**kwargs):
+    """Runs run_warmup in a daemon thread, e.g. from a worker boot hook that must not block"""
+    thread = threading.Thread(target=run_warmup, kwargs=kwargs, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def warmup_status():
+    """(finished, report) of the warm-up of this process"""
+    return _warmup_done.is_set(), dict(_warmup_report)